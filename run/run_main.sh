@@ -3,6 +3,8 @@ data_mode='dev' # Options: 'dev', 'train'
 db_root_path=Bird #root directory # UPDATE THIS WITH THE PATH TO THE TARGET DATASET
 start=0 #闭区间
 end=1  #开区间
+workers=1 #并行处理的任务数，>1 时按 db_id 分组并行
+pool=thread # Options: 'thread', 'process', 'async'
 pipeline_nodes='generate_db_schema+extract_col_value+extract_query_noun+column_retrieve_and_other_info+candidate_generate+align_correct+vote+evaluation'
 # pipeline_nodes='column_retrieve_and_other_info'
 # pipeline指当前工作流的节点组合
@@ -68,6 +70,9 @@ engine10='gpt-3.5-turbo-instruct'
 #         "bert_model": "/app/bge",            
 #         "device":"cpu",                           #bert_model 加载方式
 #         "align_methods":"style_align+function_align+agent_align"   #对齐方式，以+号分割
+#     },
+#     "vote":{                                  #可省略
+#         "tie_break":"time_cost"               #平票规则: time_cost(执行最快) / sql_length(最短) / llm_judge(大模型选择，需设定 engine)
 #     }
 # }'  
 pipeline_setup='{
@@ -78,11 +83,13 @@ pipeline_setup='{
     },
     "extract_col_value": {
         "engine": "'${engine1}'",
-        "temperature":0.0
+        "temperature":0.0,
+        "llm_cache":true
     },
     "extract_query_noun": {
         "engine": "'${engine1}'",
-        "temperature":0.0
+        "temperature":0.0,
+        "llm_cache":true
     },
     "column_retrieve_and_other_info": {
         "engine": "'${engine1}'",
@@ -109,6 +116,6 @@ pipeline_setup='{
 
 python3 -u ./src/main.py --data_mode ${data_mode} --db_root_path ${db_root_path}\
         --pipeline_nodes ${pipeline_nodes} --pipeline_setup "$pipeline_setup"\
-        --start ${start} --end ${end} \
+        --start ${start} --end ${end} --workers ${workers} --pool ${pool} \
         # --use_checkpoint --checkpoint_nodes ${checkpoint_nodes} --checkpoint_dir ${checkpoint_dir}
   
@@ -13,10 +13,14 @@ Few-shot 管理工具 - CRUD 操作
 
 import json
 import sys
-import sqlite3
 from pathlib import Path
 import argparse
 
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root / 'src'))
+
+from runner.sqlite_pool import pooled_connection
+
 
 class FewShotManager:
     def __init__(self, db_root_path="PosTest"):
@@ -267,10 +271,8 @@ class FewShotManager:
             return False
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            conn.close()
+            with pooled_connection(self.db_path) as conn:
+                conn.cursor().execute(sql)
             return True
         except Exception as e:
             print(f"❌ SQL 錯誤: {e}")
@@ -254,8 +254,7 @@ check_file "$DB_NAME/dev/dev_tables.json"
 check_file "$DB_NAME/train/train.json"
 check_file "$DB_NAME/fewshot/questions.json"
 check_file "$DB_NAME/data_preprocess/tables.json"
-check_file "$DB_NAME/emb/$DB_NAME.pkl.gz"
-check_file "$DB_NAME/emb/${DB_NAME}_value.pkl.gz"
+check_file "$DB_NAME/emb/$DB_NAME.index.json"
 
 echo ""
 echo "========================================"
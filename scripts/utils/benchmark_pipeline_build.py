@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+測量每個任務的 LangGraph workflow 建構開銷
+比較「每個任務重新 build_pipeline」與「get_pipeline 快取」兩種方式
+
+使用方法:
+    python scripts/utils/benchmark_pipeline_build.py --tasks 200
+"""
+
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'src'))
+
+from pipeline import workflow_builder
+from pipeline.workflow_builder import build_pipeline, get_pipeline
+
+DEFAULT_NODES = "generate_db_schema+extract_col_value+extract_query_noun+column_retrieve_and_other_info+candidate_generate+align_correct+vote+evaluation"
+
+
+def time_per_task(build, pipeline_nodes, tasks):
+    """回傳每個任務取得 workflow 的耗時列表（毫秒）"""
+    timings = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        build(pipeline_nodes)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<28} mean {statistics.mean(timings):8.3f} ms | "
+          f"median {statistics.median(timings):8.3f} ms | "
+          f"max {max(timings):8.3f} ms | total {sum(timings):9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-task pipeline build overhead")
+    parser.add_argument('--pipeline_nodes', type=str, default=DEFAULT_NODES, help="Pipeline nodes configuration.")
+    parser.add_argument('--tasks', type=int, default=100, help="Number of simulated tasks.")
+    args = parser.parse_args()
+
+    print(f"Nodes: {args.pipeline_nodes}")
+    print(f"Tasks: {args.tasks}\n")
+
+    before = time_per_task(build_pipeline, args.pipeline_nodes, args.tasks)
+    workflow_builder._pipeline_cache.clear()
+    after = time_per_task(get_pipeline, args.pipeline_nodes, args.tasks)
+
+    report("before (build per task)", before)
+    report("after (cached per nodes)", after)
+    saved = sum(before) - sum(after)
+    print(f"\nSaved {saved:.1f} ms over {args.tasks} tasks "
+          f"({saved / args.tasks:.3f} ms per task)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+比較資料庫值索引（ivf / hnsw）與精確搜尋的召回率與延遲
+查詢取自資料庫中的真實值（加上少量雜訊模擬拼字差異），以精確搜尋的 top-k 作為標準答案
+
+使用方法:
+    python scripts/utils/benchmark_value_index.py --db_root_path Bird --db california_schools \\
+        --backend ivf --probes 1 2 4 8 16 32
+"""
+
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'src'))
+
+from database_process.make_emb import load_emb
+from database_process.value_index import ExactIndex, load_value_index, build_value_index
+
+
+def run_queries(index, queries, k, probe=None):
+    """回傳每個查詢的結果列號與耗時（毫秒）"""
+    rows, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        (_, found), = index.search(query[None, :], k, probe)
+        timings.append((time.perf_counter() - start) * 1000)
+        rows.append(set(found.tolist()))
+    return rows, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark approximate value search against exact search")
+    parser.add_argument('--db_root_path', type=str, required=True, help="Directory containing the emb folder.")
+    parser.add_argument('--db', type=str, required=True, help="Database id.")
+    parser.add_argument('--backend', type=str, default='ivf', choices=['ivf', 'hnsw'])
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="Probe values to sweep (IVF lists scanned / HNSW efSearch).")
+    parser.add_argument('--queries', type=int, default=200, help="Number of sampled queries.")
+    parser.add_argument('--top_k', type=int, default=7)
+    parser.add_argument('--noise', type=float, default=0.05, help="Std of the noise added to sampled values.")
+    parser.add_argument('--build', action='store_true', help="(Re)build the index before benchmarking.")
+    args = parser.parse_args()
+
+    emb_dir = str(Path(args.db_root_path) / "emb")
+    DB_emb, _ = load_emb(args.db, emb_dir)
+    matrix = DB_emb.search_matrix()
+    print(f"Database: {args.db} | values: {len(matrix)} | dim: {matrix.shape[1] if matrix.ndim == 2 else 0}")
+
+    if args.build:
+        start = time.perf_counter()
+        built = build_value_index(emb_dir, args.db, matrix, args.backend)
+        if built is None:
+            print("Too few values for an approximate index; exact search is used.")
+            return
+        print(f"Built {args.backend} index in {time.perf_counter() - start:.1f}s")
+
+    index = load_value_index(emb_dir, args.db, matrix, args.backend)
+    if isinstance(index, ExactIndex):
+        print(f"No {args.backend} index found for {args.db}; run with --build or make_emb --value_index.")
+        return
+
+    rng = np.random.default_rng(0)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False))],
+                        dtype=np.float32)
+    queries = sample + rng.normal(0, args.noise, sample.shape).astype(np.float32)
+
+    truth, exact_timings = run_queries(ExactIndex(matrix), queries, args.top_k)
+    print(f"\n{'method':<16}{'recall@' + str(args.top_k):>12}{'mean ms':>12}{'p95 ms':>12}")
+    print(f"{'exact':<16}{1.0:>12.3f}{statistics.mean(exact_timings):>12.3f}"
+          f"{np.percentile(exact_timings, 95):>12.3f}")
+    for probe in args.probes:
+        found, timings = run_queries(index, queries, args.top_k, probe)
+        recall = statistics.mean(len(f & t) / len(t) for f, t in zip(found, truth) if t)
+        print(f"{args.backend + ' probe=' + str(probe):<16}{recall:>12.3f}{statistics.mean(timings):>12.3f}"
+              f"{np.percentile(timings, 95):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
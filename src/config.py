@@ -67,6 +67,32 @@ class Config:
     BERT_MODEL: str = os.getenv("BERT_MODEL", "all-MiniLM-L6-v2")
     EMBEDDING_DEVICE: str = os.getenv("EMBEDDING_DEVICE", "cpu")
     
+    # ============================================
+    # 效能配置
+    # ============================================
+    DB_CONTEXT_POOL_SIZE: int = int(os.getenv("DB_CONTEXT_POOL_SIZE", "8"))
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    ASYNC_HTTP_MAX_CONNECTIONS: int = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "256"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    HTTP_READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+    RETRY_BACKOFF_BASE: float = float(os.getenv("RETRY_BACKOFF_BASE", "1.0"))
+    RETRY_BACKOFF_MAX: float = float(os.getenv("RETRY_BACKOFF_MAX", "60"))
+    LLM_RATE_LIMIT_RPM: float = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+    LLM_RATE_LIMIT_TPM: float = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+    LLM_MAX_IN_FLIGHT: int = int(os.getenv("LLM_MAX_IN_FLIGHT", "0"))
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "data/cache/llm_cache.sqlite")
+    LLM_CACHE_TTL_DAYS: float = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+    LLM_CACHE_MAX_MB: int = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+    LLM_CACHE_SKIP_NONZERO_TEMPERATURE: bool = os.getenv("LLM_CACHE_SKIP_NONZERO_TEMPERATURE", "true").lower() in ("true", "1", "yes")
+    SCHEMA_STATS_SAMPLE_ROWS: int = int(os.getenv("SCHEMA_STATS_SAMPLE_ROWS", "0"))
+    SCHEMA_STATS_WORKERS: int = int(os.getenv("SCHEMA_STATS_WORKERS", "4"))
+    SQLITE_POOL_SIZE: int = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+    SQLITE_CACHE_SIZE_MB: int = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+    SQLITE_MMAP_SIZE_MB: int = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+    SQLITE_IMMUTABLE: bool = os.getenv("SQLITE_IMMUTABLE", "true").lower() in ("true", "1", "yes")
+    SQL_MAX_VM_STEPS: int = int(os.getenv("SQL_MAX_VM_STEPS", "0"))
+    RESULT_CACHE_MAX_MB: int = int(os.getenv("RESULT_CACHE_MAX_MB", "256"))
+    
     # ============================================
     # Web 界面配置
     # ============================================
@@ -198,6 +224,18 @@ class Config:
         print(f"  Embedding 設備: {cls.EMBEDDING_DEVICE}")
         print(f"  Few-shot 範例數: {cls.FEWSHOT_EXAMPLES_COUNT}")
         
+        print(f"\n⚡ 效能配置:")
+        print(f"  資料庫 context 數量上限: {cls.DB_CONTEXT_POOL_SIZE}")
+        print(f"  HTTP 連線池大小: {cls.HTTP_POOL_SIZE} (async 最大連線: {cls.ASYNC_HTTP_MAX_CONNECTIONS})")
+        print(f"  HTTP 逾時 (連線/讀取): {cls.HTTP_CONNECT_TIMEOUT}s / {cls.HTTP_READ_TIMEOUT}s")
+        print(f"  重試退避 (基數/上限): {cls.RETRY_BACKOFF_BASE}s / {cls.RETRY_BACKOFF_MAX}s")
+        print(f"  LLM 限流 (每分鐘請求/每分鐘 token/同時請求，0 為不限): {cls.LLM_RATE_LIMIT_RPM:g} / {cls.LLM_RATE_LIMIT_TPM:g} / {cls.LLM_MAX_IN_FLIGHT}")
+        print(f"  LLM 回應快取: {cls.LLM_CACHE_PATH} (TTL {cls.LLM_CACHE_TTL_DAYS} 天, 上限 {cls.LLM_CACHE_MAX_MB}MB, 略過非零溫度: {cls.LLM_CACHE_SKIP_NONZERO_TEMPERATURE})")
+        print(f"  Schema 統計 (抽樣列數，0 為全表/並行表數): {cls.SCHEMA_STATS_SAMPLE_ROWS} / {cls.SCHEMA_STATS_WORKERS}")
+        print(f"  SQLite 唯讀連線池: 每個資料庫 {cls.SQLITE_POOL_SIZE} 個閒置連線, cache {cls.SQLITE_CACHE_SIZE_MB}MB, mmap {cls.SQLITE_MMAP_SIZE_MB}MB, immutable: {cls.SQLITE_IMMUTABLE}")
+        print(f"  SQL 執行 VM 指令數上限 (0 為只限時間): {cls.SQL_MAX_VM_STEPS}")
+        print(f"  SQL 執行結果快取上限: {cls.RESULT_CACHE_MAX_MB}MB")
+        
         print("=" * 60 + "\n")
 
 
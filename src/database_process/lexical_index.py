@@ -0,0 +1,144 @@
+"""
+Lexical index
+欄位值的字面索引，放在 embedding 比對之前:
+    - 完全相同（忽略大小寫與前後空白）的值直接命中，不需要編碼查詢或掃描 embedding
+    - 字元 trigram 倒排索引找出字面相近的值，縮小交給 embedding 比對的候選集合
+
+索引由 make_emb 與 value store 一起建立，存放於 emb 目錄的 {db}.lexical.pkl
+"""
+
+import os
+import pickle
+import logging
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+LEXICAL_FORMAT = 1
+NGRAM = 3
+
+
+def normalize(value: str) -> str:
+    return value.strip().lower()
+
+
+def char_ngrams(text: str, n: int = NGRAM) -> set:
+    """Returns the character n-grams of text padded with spaces, so short strings still get grams."""
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+class LexicalIndex:
+    """
+    An exact-match map and a character n-gram inverted index over the rows of a value store.
+    """
+
+    def __init__(self, exact: Dict[str, np.ndarray], postings: Dict[str, np.ndarray], gram_counts: np.ndarray):
+        self.exact = exact
+        self.postings = postings
+        self.gram_counts = gram_counts
+
+    @staticmethod
+    def path(emb_dir: str, db: str) -> str:
+        return os.path.join(emb_dir, f"{db}.lexical.pkl")
+
+    @classmethod
+    def build(cls, values: Iterable[str]) -> "LexicalIndex":
+        """
+        Args:
+            values (Iterable[str]): Every value in value store row order.
+        """
+        exact: Dict[str, List[int]] = {}
+        postings: Dict[str, List[int]] = {}
+        gram_counts = []
+        for row, value in enumerate(values):
+            norm = normalize(value)
+            exact.setdefault(norm, []).append(row)
+            grams = char_ngrams(norm)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        return cls(
+            {key: np.array(rows, dtype=np.int64) for key, rows in exact.items()},
+            {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()},
+            np.array(gram_counts, dtype=np.int32),
+        )
+
+    def save(self, emb_dir: str, db: str):
+        path = self.path(emb_dir, db)
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump({"format": LEXICAL_FORMAT, "count": len(self.gram_counts), "exact": self.exact,
+                         "postings": self.postings, "gram_counts": self.gram_counts},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, emb_dir: str, db: str, count: int) -> Optional["LexicalIndex"]:
+        """Loads the index of db, or None when it is missing or was built for other values."""
+        path = cls.path(emb_dir, db)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("format") != LEXICAL_FORMAT or data.get("count") != count:
+            logging.warning(f"Ignoring stale lexical index {path}")
+            return None
+        return cls(data["exact"], data["postings"], data["gram_counts"])
+
+    def exact_rows(self, value: str) -> np.ndarray:
+        """Returns the rows whose value equals value, ignoring case and surrounding spaces."""
+        return self.exact.get(normalize(value), np.zeros(0, dtype=np.int64))
+
+    def candidate_rows(self, value: str, min_similarity: float = 0.3, max_candidates: int = 256) -> np.ndarray:
+        """
+        Returns up to max_candidates rows whose n-gram Jaccard similarity with value is at least
+        min_similarity, most similar first.
+        """
+        grams = [gram for gram in char_ngrams(normalize(value)) if gram in self.postings]
+        if not grams:
+            return np.zeros(0, dtype=np.int64)
+        rows, common = np.unique(np.concatenate([self.postings[gram] for gram in grams]), return_counts=True)
+        similarity = common / (len(char_ngrams(normalize(value))) + self.gram_counts[rows] - common)
+        keep = similarity >= min_similarity
+        rows, similarity = rows[keep], similarity[keep]
+        if len(rows) > max_candidates:
+            top = np.argpartition(-similarity, max_candidates - 1)[:max_candidates]
+            rows, similarity = rows[top], similarity[top]
+        return rows[np.argsort(-similarity, kind="stable")]
+
+
+class LexicalStats:
+    """Process-wide counters of how value lookups were answered and how long they took."""
+    _lock = Lock()
+    _counts = {"exact": 0, "narrowed": 0, "full": 0}
+    _seconds = {"exact": 0.0, "narrowed": 0.0, "full": 0.0}
+
+    @classmethod
+    def record(cls, kind: str, seconds: float, lookups: int = 1):
+        with cls._lock:
+            cls._counts[kind] += lookups
+            cls._seconds[kind] += seconds
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """
+        Returns the lookup counts, the lexical hit rate and the estimated time saved compared with
+        running every lookup through the full embedding search.
+        """
+        with cls._lock:
+            counts, seconds = dict(cls._counts), dict(cls._seconds)
+        total = sum(counts.values())
+        full_avg = seconds["full"] / counts["full"] if counts["full"] else 0.0
+        saved = sum(counts[kind] * full_avg - seconds[kind] for kind in ("exact", "narrowed")) if full_avg else 0.0
+        return {
+            "lookups": total,
+            "exact_hits": counts["exact"],
+            "narrowed": counts["narrowed"],
+            "full_searches": counts["full"],
+            "hit_rate": (counts["exact"] + counts["narrowed"]) / total if total else 0.0,
+            "avg_full_ms": full_avg * 1000,
+            "avg_exact_ms": seconds["exact"] / counts["exact"] * 1000 if counts["exact"] else 0.0,
+            "avg_narrowed_ms": seconds["narrowed"] / counts["narrowed"] * 1000 if counts["narrowed"] else 0.0,
+            "saved_seconds": saved,
+        }
@@ -1,67 +1,240 @@
 import pickle
-import gzip, re
+import hashlib
+import gzip
 import tqdm, json, random
-import pandas as pd
 import torch
 import sqlite3, os
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import sys
 from sklearn.metrics.pairwise import euclidean_distances
 import argparse
 import logging
+import time
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from runner.embedding_registry import get_embedding_model
+from database_process.value_store import ValueEmbeddingStore, ValueEmbeddings, ValueStoreWriter, store_exists
+from database_process.value_index import INDEX_BACKENDS, build_value_index
+from database_process.lexical_index import LexicalIndex
 device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-uuid_pattern = re.compile(
-    r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
-)
+# SQLite GLOB 版本的 UUID 格式，讓 UUID 值在 SQL 端就被排除
+_HEX = "[0-9a-fA-F]"
+UUID_GLOB = "-".join(_HEX * n for n in (8, 4, 4, 4, 12))
 
+# cursor.fetchmany 每批列數與 encoder 每批值數，兩者決定建立時的記憶體上限
+FETCH_SIZE = 10000
+ENCODE_BATCH_SIZE = 1024
 
-def filter_column(table, col, exclude_num, num_shold=6000):
-    cols=table[col].unique()
-    if len(cols) > num_shold and exclude_num:
-        try:
-            table[col].dropna().astype(float)
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def stream_rows(conn, sql, params=()):
+    """以 fetchmany 分批讀取查詢結果，不會一次把整個結果載入記憶體"""
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield row[0]
+
+
+def _is_float(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def scan_column(conn, table, col, exclude_num, num_shold=6000):
+    """
+    Returns the values of one column to index, streaming SELECT DISTINCT instead of loading the table.
+
+    Only text values shorter than 100 characters that are not UUIDs are kept, and columns with
+    more than num_shold distinct values that all parse as numbers are skipped. Columns without any text value (numeric columns) are skipped with a single probe.
+    """
+    t, c = quote_identifier(table), quote_identifier(col)
+    if conn.execute(f"SELECT 1 FROM {t} WHERE typeof({c}) = 'text' LIMIT 1").fetchone() is None:
+        return []
+    if exclude_num:
+        # unique() 會把 NULL 算成一個值
+        distinct = conn.execute(f"SELECT COUNT(DISTINCT {c}) + COALESCE(MAX({c} IS NULL), 0) FROM {t}").fetchone()[0]
+        if distinct > num_shold and all(
+                _is_float(value) for value in stream_rows(
+                    conn, f"SELECT DISTINCT {c} FROM {t} WHERE typeof({c}) IN ('text', 'blob')")):
             return []  # 跳过当前列，因为它满足排除条件
-        except ValueError:
-            pass
-    # 排除具有UUID格式的数据
-    col_vals = [
-        item for item in cols if isinstance(item, str)
-        and not uuid_pattern.match(item) and len(item) < 100
-    ]
-    return col_vals
+    return list(stream_rows(
+        conn,
+        f"SELECT DISTINCT {c} FROM {t} WHERE typeof({c}) = 'text' AND length({c}) < 100 AND {c} NOT GLOB ?",
+        (UUID_GLOB,),
+    ))
+
+
+def table_fingerprint(conn, table):
+    """回傳資料表的列數與最大 rowid（WITHOUT ROWID 的表只有列數）"""
+    t = quote_identifier(table)
+    try:
+        rows, max_rowid = conn.execute(f"SELECT COUNT(*), MAX(rowid) FROM {t};").fetchone()
+    except sqlite3.OperationalError:
+        rows, max_rowid = conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0], None
+    return {"rows": rows, "max_rowid": max_rowid}
+
 
+def values_hash(col_vals):
+    return hashlib.sha1("\x00".join(col_vals).encode("utf-8", "ignore")).hexdigest()
 
-def make_emb(db, DB_dir, DB_emb,col_values,bert_model,exclude_int=True):
-    conn = sqlite3.connect(os.path.join(DB_dir, db, db + '.sqlite'))
+
+def open_database(db_path):
+    conn = sqlite3.connect(db_path)
     conn.text_factory = lambda x: str(x, 'utf-8', 'ignore')
-    sql = "SELECT name FROM sqlite_master WHERE type='table';"
-    df = pd.read_sql_query(sql, conn)
-    print("db name:", db, "table count:", len(df.values))
-    for table in df.values:
-        table = table[0]
-        if table[0] == 'sqlite_sequence':
-                continue
-        sql_t = f"SELECT * FROM '{table}';"
-        values = pd.read_sql_query(sql_t, conn)
-        values = values.select_dtypes(exclude=[np.number])
-        for col in tqdm.tqdm(values.columns):
-            col_vals = filter_column(values, col, exclude_int)###做索引的值：str
+    return conn
+
+
+def list_tables(conn):
+    """回傳每個資料表的 (名稱, 資料表 fingerprint, 欄位名稱)，略過 sqlite_sequence"""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+    return [
+        (table, table_fingerprint(conn, table),
+         [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")])
+        for table in tables if table != 'sqlite_sequence'
+    ]
+
+
+def iter_column_values(db, DB_dir, exclude_int=True):
+    """
+    Yields (table, column, values to index, column fingerprint) for every column of db with text values.
+    """
+    conn = open_database(os.path.join(DB_dir, db, db + '.sqlite'))
+    try:
+        tables = list_tables(conn)
+        print("db name:", db, "table count:", len(tables))
+        for table, table_fp, columns in tables:
+            for col in tqdm.tqdm(columns, desc=table):
+                col_vals = scan_column(conn, table, col, exclude_int)###做索引的值：str
+                yield table, col, col_vals, dict(table_fp, count=len(col_vals), hash=values_hash(col_vals))
+    finally:
+        conn.close()
+
+
+def encode_batches(bert_model, values):
+    """依固定大小分批編碼，yield (該批的值, embeddings)"""
+    for start in range(0, len(values), ENCODE_BATCH_SIZE):
+        batch = values[start:start + ENCODE_BATCH_SIZE]
+        yield batch, bert_model.encode(batch, device=device, show_progress_bar=False)
+
+
+def make_emb_store(db, DB_dir, emb_dir, bert_model, dtype="float32", exclude_int=True):
+    """
+    Builds the value store of db, streaming every encoded batch straight to disk so memory stays
+    bounded by the largest column's distinct values rather than the database size.
+    """
+    fingerprints = {}
+    with ValueStoreWriter(emb_dir, db, dtype) as writer:
+        for table, col, col_vals, fingerprint in iter_column_values(db, DB_dir, exclude_int):
+            key = table + "." + col
+            fingerprints[key] = fingerprint
+            for batch, embs in encode_batches(bert_model, col_vals):
+                writer.add_rows(key, batch, embs)
+    save_fingerprints(emb_dir, db, fingerprints)
+    return writer.count
+
+
+def fingerprints_path(emb_dir, db):
+    return os.path.join(emb_dir, f"{db}.fingerprints.json")
+
+
+def save_fingerprints(emb_dir, db, fingerprints):
+    path = fingerprints_path(emb_dir, db)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(fingerprints, f, ensure_ascii=False, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_fingerprints(emb_dir, db):
+    try:
+        with open(fingerprints_path(emb_dir, db), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def make_emb_incremental(db, DB_dir, emb_dir, bert_model, dtype="float32", exclude_int=True):
+    """
+    Updates the value store of db, encoding only the values that are not embedded yet.
+
+    Each column is fingerprinted by its table's row count and max(rowid) plus a hash of its indexed
+    values. Unchanged columns are copied from the current store; changed columns reuse the
+    embeddings of values they already had and encode the new ones. Nothing is written when no
+    column changed.
+
+    Returns:
+        bool: Whether the store was rewritten.
+    """
+    if not store_exists(emb_dir, db):
+        make_emb_store(db, DB_dir, emb_dir, bert_model, dtype, exclude_int)
+        return True
+
+    old_emb, old_values = load_emb(db, emb_dir)
+    old_fingerprints = load_fingerprints(emb_dir, db)
+    fingerprints = {}
+    changed, encoded = 0, 0
+    writer = ValueStoreWriter(emb_dir, db, dtype)
+    try:
+        for table, col, col_vals, fingerprint in iter_column_values(db, DB_dir, exclude_int):
+            key = table + "." + col
+            fingerprints[key] = fingerprint
             if len(col_vals) == 0:
+                changed += key in old_emb
                 continue
-            train_embeddings = bert_model.encode(col_vals,device=device)##对值和embedding做相互索引
-            DB_emb[table + "." + col] = train_embeddings
-            col_values[table + "." + col] = col_vals
-
+            if old_fingerprints.get(key) == fingerprint and key in old_emb:
+                for start in range(0, len(col_vals), ENCODE_BATCH_SIZE):
+                    end = start + ENCODE_BATCH_SIZE
+                    writer.add_rows(key, old_values[key][start:end], old_emb[key][start:end])
+                continue
+            changed += 1
+            previous = {value: i for i, value in enumerate(old_values[key])} if key in old_values else {}
+            for start in range(0, len(col_vals), ENCODE_BATCH_SIZE):
+                batch = col_vals[start:start + ENCODE_BATCH_SIZE]
+                new_vals = [value for value in batch if value not in previous]
+                new_embs = bert_model.encode(new_vals, device=device, show_progress_bar=False) if new_vals else None
+                new_rows = {value: i for i, value in enumerate(new_vals)}
+                writer.add_rows(key, batch, np.stack([
+                    new_embs[new_rows[value]] if value in new_rows else old_emb[key][previous[value]]
+                    for value in batch
+                ]))
+                encoded += len(new_vals)
+        # 已不存在的欄位
+        changed += len(set(old_emb) - set(fingerprints))
+    except BaseException:
+        writer.abort()
+        raise
 
-def save_emb(dicts, dbname, emb_dir):
-    with gzip.open(os.path.join(emb_dir, f'{dbname}.pkl.gz'),
-                   'wb') as pkl_file:
-        pickle.dump(dicts, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+    if not changed:
+        writer.abort()
+        logging.info(f"{db}: embeddings are up to date")
+        save_fingerprints(emb_dir, db, fingerprints)
+        return False
+    logging.info(f"{db}: {changed} columns changed, {encoded} values encoded")
+    writer.close()
+    save_fingerprints(emb_dir, db, fingerprints)
+    return True
 
 
 def load_emb(dbname, emb_dir="Bird/emb"):
+    """
+    Loads (DB_emb, col_values) of a database, from the memory-mapped value store when it exists
+    and from the legacy gzip pickles otherwise.
+    """
+    if store_exists(emb_dir, dbname):
+        return ValueEmbeddingStore(emb_dir, dbname).as_dicts()
     with gzip.open(os.path.join(emb_dir, f'{dbname}.pkl.gz'),
                    'rb') as pkl_file:
         data = pickle.load(pkl_file)
@@ -69,34 +242,196 @@ def load_emb(dbname, emb_dir="Bird/emb"):
                    'rb') as pkl_file:
         col_vs = pickle.load(pkl_file)
 
-    return data, col_vs
+    return ValueEmbeddings.from_dict(data), col_vs
+
+def build_index(dbname, emb_dir, backend):
+    """為已寫入的 value store 建立字面索引與近似最近鄰索引（exact 時不建立後者）"""
+    DB_emb, col_values = load_emb(dbname, emb_dir)
+    LexicalIndex.build(value for key, _, _ in DB_emb.columns for value in col_values[key]).save(emb_dir, dbname)
+    if backend == "exact":
+        return
+    if build_value_index(emb_dir, dbname, DB_emb.search_matrix(), backend) is not None:
+        logging.info(f"Built {backend} value index for {dbname}")
+
+
+def convert_legacy_emb(dbname, emb_dir, dtype="float32", index_backend="exact"):
+    """把舊的 {db}.pkl.gz / {db}_value.pkl.gz 轉成 value store 格式"""
+    DB_emb, col_values = load_emb(dbname, emb_dir)
+    ValueEmbeddingStore.write(emb_dir, dbname, DB_emb, col_values, dtype)
+    build_index(dbname, emb_dir, index_backend)
+
+
+def list_databases(DB_dir):
+    """列出 DB_dir 下所有 {db}/{db}.sqlite 資料庫"""
+    return sorted(name for name in os.listdir(DB_dir)
+                  if os.path.isfile(os.path.join(DB_dir, name, name + '.sqlite')))
+
+
+# 每個 worker process 目前資料庫的連線
+_worker_connections = {}
+
+
+def _scan_job(job):
+    """process pool 的工作：掃描一個欄位的值"""
+    db_path, table, col, table_fp, exclude_int = job
+    conn = _worker_connections.get(db_path)
+    if conn is None:
+        for other in _worker_connections.values():
+            other.close()
+        _worker_connections.clear()
+        conn = _worker_connections[db_path] = open_database(db_path)
+    col_vals = scan_column(conn, table, col, exclude_int)
+    return table, col, col_vals, dict(table_fp, count=len(col_vals), hash=values_hash(col_vals))
+
+
+def _ordered_results(pool, jobs, window):
+    """依提交順序回傳 _scan_job 的結果，同時最多 window 個工作，避免掃描結果在記憶體中堆積"""
+    if pool is None:
+        yield from map(_scan_job, jobs)
+        return
+    futures = deque()
+    for job in jobs:
+        futures.append(pool.submit(_scan_job, job))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
 
-def make_emb_all(data_dir, database, bertmodel):
+def _write_batch(bert_model, writer, batch):
+    """編碼一批 (key, value)（可能跨越多個欄位）並依欄位寫入"""
+    embs = bert_model.encode([value for _, value in batch], device=device, show_progress_bar=False)
+    start = 0
+    for key, rows in itertools.groupby(batch, key=lambda item: item[0]):
+        values = [value for _, value in rows]
+        writer.add_rows(key, values, embs[start:start + len(values)])
+        start += len(values)
+
+
+def build_database(db, DB_dir, emb_dir, bert_model, pool=None, dtype="float32", exclude_int=True,
+                   resume=False, window=16):
+    """
+    Builds the value store of db from column scans run on pool (None scans in this process).
+
+    Values of consecutive columns share encoder batches of ENCODE_BATCH_SIZE, so small columns do
+    not leave the encoder underused. A checkpoint is written after every batch; with resume an
+    interrupted build continues at its first unfinished column.
+
+    Returns:
+        int: Number of values encoded.
+    """
+    db_path = os.path.join(DB_dir, db, db + '.sqlite')
+    writer = ValueStoreWriter(emb_dir, db, dtype, resume=resume)
+    done = dict(writer.done)
+    if done:
+        logging.info(f"{db}: resuming after {len(done)} finished columns")
+    try:
+        conn = open_database(db_path)
+        try:
+            jobs = [(db_path, table, col, table_fp, exclude_int)
+                    for table, table_fp, columns in list_tables(conn)
+                    for col in columns if table + "." + col not in done]
+        finally:
+            conn.close()
+
+        pending, waiting, encoded = [], {}, 0
+        for table, col, col_vals, fingerprint in tqdm.tqdm(_ordered_results(pool, jobs, window),
+                                                           total=len(jobs), desc=db):
+            waiting[table + "." + col] = fingerprint
+            pending.extend((table + "." + col, value) for value in col_vals)
+            while len(pending) >= ENCODE_BATCH_SIZE:
+                _write_batch(bert_model, writer, pending[:ENCODE_BATCH_SIZE])
+                del pending[:ENCODE_BATCH_SIZE]
+                encoded += ENCODE_BATCH_SIZE
+                # 值已全部寫入的欄位即完成
+                remaining = {key for key, _ in pending}
+                for key in [key for key in waiting if key not in remaining]:
+                    done[key] = waiting.pop(key)
+                writer.checkpoint(done)
+        if pending:
+            _write_batch(bert_model, writer, pending)
+            encoded += len(pending)
+        done.update(waiting)
+    except BaseException:
+        # 保留暫存檔與最後的 checkpoint，供 --resume 接續
+        writer.suspend()
+        raise
+    writer.close()
+    save_fingerprints(emb_dir, db, done)
+    return encoded
+
+
+def build_state_path(emb_dir):
+    return os.path.join(emb_dir, "build_state.json")
+
+
+def load_build_state(emb_dir, bertmodel, dtype):
+    """回傳上次以相同模型與 dtype 建立時已完成的資料庫"""
+    try:
+        with open(build_state_path(emb_dir), encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return set()
+    if state.get("bert_model") != bertmodel or state.get("dtype") != dtype:
+        logging.warning("Previous build used another model or dtype, building every database again")
+        return set()
+    return set(state["completed"])
+
+
+def save_build_state(emb_dir, bertmodel, dtype, completed):
+    path = build_state_path(emb_dir)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"bert_model": bertmodel, "dtype": dtype, "completed": sorted(completed)}, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def make_emb_all(data_dir, database, bertmodel, dtype="float32", index_backend="exact", incremental=False,
+                 workers=4, resume=False):
+    """
+    Builds the value stores of every database under data_dir/database.
+
+    Column scans run on a pool of workers processes while this process encodes. Finished
+    databases are recorded in emb/build_state.json; with resume they are skipped and a database
+    that was interrupted continues from its last checkpoint.
+    """
     emb_dir=os.path.join(data_dir,"emb")
     os.makedirs(emb_dir, exist_ok=True)
-    database=os.path.join(data_dir,database)
-    data_dir=os.path.join(data_dir,"data_preprocess","dev.json")
+    DB_dir=os.path.join(data_dir,database)
+    dbs = list_databases(DB_dir)
     # init model
-    bert_model = SentenceTransformer(bertmodel, device=device, cache_folder='model/')
-    
-    # load data
-    Q = pd.read_json(data_dir)
-    DB_dir = database
-    DB_emb = {}
-    Db_names = set()
-    col_values = {}
-    
-    for i, (id, q) in enumerate(tqdm.tqdm(Q.iterrows())):
-        db = q['db_id']
-        if db not in Db_names:
-            logging.info(f"Processing database: {db}") 
-            col_values = {}
-            DB_emb = {}
-            make_emb(db, DB_dir, DB_emb, col_values,bert_model)
-            save_emb(DB_emb, db, emb_dir)
-            save_emb(col_values, db + '_value', emb_dir)
-            Db_names.add(db)
+    bert_model = get_embedding_model(bertmodel, device, cache_folder='model/')
 
+    completed = load_build_state(emb_dir, bertmodel, dtype) if resume else set()
+    if completed:
+        logging.info(f"Skipping {len(completed & set(dbs))} databases finished by the previous build")
+    # spawn 避免 fork 已初始化 CUDA 的主程序
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) \
+        if workers > 1 and not incremental else None
+    total_values, total_seconds = 0, 0.0
+    try:
+        for db in dbs:
+            if db in completed:
+                continue
+            logging.info(f"Processing database: {db}")
+            start = time.perf_counter()
+            if incremental:
+                if make_emb_incremental(db, DB_dir, emb_dir, bert_model, dtype):
+                    build_index(db, emb_dir, index_backend)
+            else:
+                encoded = build_database(db, DB_dir, emb_dir, bert_model, pool, dtype, resume=resume)
+                seconds = time.perf_counter() - start
+                total_values += encoded
+                total_seconds += seconds
+                logging.info(f"{db}: {encoded} values in {seconds:.1f}s ({encoded / max(seconds, 1e-9):.0f} values/sec)")
+                build_index(db, emb_dir, index_backend)
+            completed.add(db)
+            save_build_state(emb_dir, bertmodel, dtype, completed)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    if total_values:
+        logging.info(f"Encoded {total_values} values in {total_seconds:.1f}s "
+                     f"({total_values / total_seconds:.0f} values/sec)")
 
 
 if __name__ == "__main__":
@@ -104,7 +439,28 @@ if __name__ == "__main__":
     parser.add_argument('--db_root_directory', type=str, help='Directory containing the data files.')
     parser.add_argument('--dev_database', type=str, help='Database file name.')
     parser.add_argument('--bert_model', type=str, help='Name of the BERT model to use.')
+    parser.add_argument('--dtype', type=str, default='float32', choices=['float32', 'float16'],
+                        help='Storage precision of the value embedding matrix.')
+    parser.add_argument('--value_index', type=str, default='exact', choices=list(INDEX_BACKENDS),
+                        help='Approximate nearest-neighbour index to build over the value embeddings.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only re-encode values of columns whose data changed since the last build.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Processes scanning column values in parallel (1 scans in the encoding process).')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip databases finished by an interrupted build and resume the unfinished one.')
+    parser.add_argument('--convert_legacy', action='store_true',
+                        help='Convert existing .pkl.gz embeddings in <db_root_directory>/emb instead of re-encoding.')
 
     args = parser.parse_args()
-    logging.info(f"Start make_emb_for_dev,the output_file is {args.db_root_directory}/emb")
-    make_emb_all(args.db_root_directory,args.dev_database,args.bert_model)
+    if args.convert_legacy:
+        emb_dir = os.path.join(args.db_root_directory, "emb")
+        for file in sorted(os.listdir(emb_dir)):
+            if file.endswith(".pkl.gz") and not file.endswith("_value.pkl.gz"):
+                db = file[:-len(".pkl.gz")]
+                logging.info(f"Converting embeddings of {db}")
+                convert_legacy_emb(db, emb_dir, args.dtype, args.value_index)
+    else:
+        logging.info(f"Start make_emb_for_dev,the output_file is {args.db_root_directory}/emb")
+        make_emb_all(args.db_root_directory,args.dev_database,args.bert_model,args.dtype,args.value_index,
+                     args.incremental,args.workers,args.resume)
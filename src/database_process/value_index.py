@@ -0,0 +1,233 @@
+"""
+Value index
+資料庫欄位值 embedding 的最近鄰索引，可替換後端:
+    exact   逐一計算所有值的距離（預設，結果與 DES 原本相同）
+    ivf     以 k-means 分群的倒排索引（純 numpy），查詢時只掃描 probe 個最近的群
+    hnsw    faiss 的 HNSW 圖索引（需安裝 faiss-cpu），probe 對應 efSearch
+
+probe 越大召回率越高、延遲越長；索引由 make_emb 建立，存放於 emb 目錄
+"""
+
+import os
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.metrics.pairwise import euclidean_distances
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+INDEX_BACKENDS = ("exact", "ivf", "hnsw")
+
+# 值的數量少於此數時不建立近似索引，直接精確搜尋
+MIN_INDEXED_VALUES = 10000
+
+
+def _top_k(distances: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the k smallest (distance, row) pairs ordered by distance, then by row."""
+    if len(rows) > k:
+        kth = distances[np.argpartition(distances, k - 1)[k - 1]]
+        keep = distances <= kth
+        distances, rows = distances[keep], rows[keep]
+    order = np.lexsort((rows, distances))[:k]
+    return distances[order], rows[order]
+
+
+class ExactIndex:
+    """Brute-force search over every value."""
+    backend = "exact"
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def search(self, queries: np.ndarray, k: int, probe: Optional[int] = None):
+        """
+        Returns, per query, the euclidean distances and rows of its k nearest values.
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: (distances, rows) per query, closest first.
+        """
+        rows = np.arange(len(self.matrix))
+        distances = euclidean_distances(queries, self.matrix)
+        return [_top_k(row_distances, rows, k) for row_distances in distances]
+
+
+class IVFIndex:
+    """
+    An inverted file index: values are grouped by their nearest k-means centroid and a query only
+    scans the probe lists whose centroids are closest to it.
+    """
+    backend = "ivf"
+
+    def __init__(self, matrix: np.ndarray, centroids: np.ndarray, rows: np.ndarray, list_offsets: np.ndarray,
+                 probe: int = 8):
+        self.matrix = matrix
+        self.centroids = centroids
+        self.rows = rows
+        self.list_offsets = list_offsets
+        self.probe = probe
+
+    @staticmethod
+    def path(emb_dir: str, db: str) -> str:
+        return os.path.join(emb_dir, f"{db}.ivf.npz")
+
+    @staticmethod
+    def _assign(data: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        labels = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), chunk):
+            block = np.asarray(data[start:start + chunk], dtype=np.float32)
+            # ||x - c||^2 的排序只需要 ||c||^2 - 2 x·c
+            labels[start:start + chunk] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+        return labels
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: Optional[int] = None, iterations: int = 10,
+              seed: int = 0) -> "IVFIndex":
+        """
+        Trains the centroids with k-means on a sample of the values and assigns every value.
+
+        Args:
+            matrix (np.ndarray): The (N, dim) value embeddings.
+            nlist (Optional[int]): Number of lists, 4 * sqrt(N) by default.
+            iterations (int): k-means iterations.
+        """
+        n = len(matrix)
+        nlist = min(n, nlist or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, size=min(n, 256 * nlist), replace=False))],
+                            dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = cls._assign(sample, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        labels = cls._assign(matrix, centroids)
+        rows = np.argsort(labels, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))])
+        return cls(matrix, centroids, rows, list_offsets)
+
+    def save(self, emb_dir: str, db: str):
+        path = self.path(emb_dir, db)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, centroids=self.centroids, rows=self.rows, list_offsets=self.list_offsets,
+                 count=np.int64(len(self.matrix)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, emb_dir: str, db: str, matrix: np.ndarray, probe: int = 8) -> Optional["IVFIndex"]:
+        path = cls.path(emb_dir, db)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data["count"]) != len(matrix):
+                logging.warning(f"Ignoring stale IVF index {path}")
+                return None
+            return cls(matrix, data["centroids"], data["rows"], data["list_offsets"], probe)
+
+    def search(self, queries: np.ndarray, k: int, probe: Optional[int] = None):
+        probe = min(probe or self.probe, len(self.centroids))
+        queries = np.asarray(queries, dtype=np.float32)
+        centroid_distances = euclidean_distances(queries, self.centroids)
+        results = []
+        for query, row_distances in zip(queries, centroid_distances):
+            lists = np.argpartition(row_distances, probe - 1)[:probe] if probe < len(row_distances) \
+                else np.arange(len(row_distances))
+            rows = np.concatenate([self.rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+            if len(rows) == 0:
+                results.append((np.zeros(0), rows))
+                continue
+            rows.sort()
+            distances = euclidean_distances(query[None, :], self.matrix[rows])[0]
+            results.append(_top_k(distances, rows, k))
+        return results
+
+
+class HNSWIndex:
+    """A faiss HNSW graph over the values; probe sets efSearch."""
+    backend = "hnsw"
+
+    def __init__(self, index, probe: int = 64):
+        self.index = index
+        self.probe = probe
+
+    @staticmethod
+    def path(emb_dir: str, db: str) -> str:
+        return os.path.join(emb_dir, f"{db}.hnsw.faiss")
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, m: int = 32) -> "HNSWIndex":
+        index = faiss.IndexHNSWFlat(matrix.shape[1], m)
+        index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+        return cls(index)
+
+    def save(self, emb_dir: str, db: str):
+        path = self.path(emb_dir, db)
+        faiss.write_index(self.index, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, emb_dir: str, db: str, matrix: np.ndarray, probe: int = 64) -> Optional["HNSWIndex"]:
+        path = cls.path(emb_dir, db)
+        if not os.path.exists(path):
+            return None
+        index = faiss.read_index(path)
+        if index.ntotal != len(matrix):
+            logging.warning(f"Ignoring stale HNSW index {path}")
+            return None
+        return cls(index, probe)
+
+    def search(self, queries: np.ndarray, k: int, probe: Optional[int] = None):
+        self.index.hnsw.efSearch = max(probe or self.probe, k)
+        squared, rows = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        results = []
+        for row_squared, row_ids in zip(squared, rows):
+            valid = row_ids >= 0
+            # faiss 回傳平方距離，轉成與 euclidean_distances 相同的尺度
+            distances = np.sqrt(np.maximum(row_squared[valid], 0)).astype(np.float64)
+            results.append(_top_k(distances, row_ids[valid].astype(np.int64), k))
+        return results
+
+
+def build_value_index(emb_dir: str, db: str, matrix: np.ndarray, backend: str, **kwargs):
+    """
+    Builds and saves the approximate index of db. Small databases are left to exact search.
+    """
+    if backend == "exact" or len(matrix) < MIN_INDEXED_VALUES:
+        return None
+    if backend == "hnsw":
+        if not FAISS_AVAILABLE:
+            raise ImportError("The hnsw value index requires faiss: pip install faiss-cpu")
+        index = HNSWIndex.build(matrix, **kwargs)
+    elif backend == "ivf":
+        index = IVFIndex.build(matrix, **kwargs)
+    else:
+        raise ValueError(f"Unknown value index backend: {backend}")
+    index.save(emb_dir, db)
+    return index
+
+
+def load_value_index(emb_dir: str, db: str, matrix: np.ndarray, backend: str = "exact",
+                     probe: Optional[int] = None):
+    """
+    Loads the index of db for backend, falling back to exact search when it has not been built.
+    """
+    index = None
+    if backend == "ivf":
+        index = IVFIndex.load(emb_dir, db, matrix, probe or 8)
+    elif backend == "hnsw":
+        if not FAISS_AVAILABLE:
+            logging.warning("faiss is not installed, using exact value search")
+        else:
+            index = HNSWIndex.load(emb_dir, db, matrix, probe or 64)
+    elif backend != "exact":
+        raise ValueError(f"Unknown value index backend: {backend}")
+    return index or ExactIndex(matrix)
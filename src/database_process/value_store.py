@@ -0,0 +1,390 @@
+"""
+Value embedding store
+將一個資料庫所有欄位值的 embedding 存成單一連續矩陣（.npy），搭配欄位 offset 索引與字串表，
+以 memmap 載入，多個 worker 透過 page cache 共用同一份資料
+
+檔案（位於 emb 目錄，{v} 為每次寫入的版本）:
+    {db}.values.{v}.npy     float32 / float16 矩陣，形狀 (N, dim)
+    {db}.strings.{v}.bin    所有欄位值以 UTF-8 串接
+    {db}.offsets.{v}.npy    int64，長度 N + 1，第 i 個值位於 strings.bin[offsets[i]:offsets[i+1]]
+    {db}.index.json         格式版本、資料檔的版本 {v}、dtype、dim、列數與每個欄位的 [key, start, end]
+
+資料檔以新的版本名稱寫入，index.json 最後以 os.replace 替換並指向它們，是唯一的提交點:
+讀取端看到的一定是一組完整且一致的檔案（格式 1 的 store 沒有版本，檔名不含 {v}）
+"""
+
+import os
+import json
+import time
+import shutil
+import uuid
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+STORE_FORMAT = 2
+# 仍可讀取的格式（1: 資料檔沒有版本名稱）
+READABLE_FORMATS = (1, 2)
+# 載入時檔案被並行的寫入替換（舊版本已刪除）時重新讀取 index 的次數
+LOAD_RETRIES = 3
+
+
+def store_paths(emb_dir: str, db: str, version: str = None) -> Dict[str, str]:
+    """Returns the file paths of the value store of db, with the data files of version."""
+    tag = f".{version}" if version else ""
+    return {
+        "matrix": os.path.join(emb_dir, f"{db}.values{tag}.npy"),
+        "strings": os.path.join(emb_dir, f"{db}.strings{tag}.bin"),
+        "offsets": os.path.join(emb_dir, f"{db}.offsets{tag}.npy"),
+        "index": os.path.join(emb_dir, f"{db}.index.json"),
+    }
+
+
+def read_index(emb_dir: str, db: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Reads the index of the value store of db.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: (index, the paths of the data files it points to).
+
+    Raises:
+        ValueError: When the index has an unsupported format.
+    """
+    path = store_paths(emb_dir, db)["index"]
+    with open(path, encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") not in READABLE_FORMATS:
+        raise ValueError(f"Unsupported value store format {index.get('format')} in {path}")
+    return index, store_paths(emb_dir, db, index.get("version"))
+
+
+def store_exists(emb_dir: str, db: str) -> bool:
+    return os.path.exists(store_paths(emb_dir, db)["index"])
+
+
+class ColumnValues:
+    """A read-only sequence view of the values of one column, decoded from the string table on access."""
+
+    def __init__(self, store: "ValueEmbeddingStore", start: int, end: int):
+        self._store = store
+        self._start = start
+        self._end = end
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("column value index out of range")
+        return self._store.value(self._start + index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._store.value(self._start + i)
+
+
+class ValueEmbeddings(dict):
+    """
+    {column key: embedding matrix} whose values are row slices of one contiguous matrix.
+
+    Attributes:
+        matrix: The (N, dim) matrix holding every value embedding.
+        columns: [(key, start, end)] rows of each column in matrix, in storage order.
+    """
+
+    def __init__(self, matrix: np.ndarray, columns: List[Tuple[str, int, int]]):
+        super().__init__((key, matrix[start:end]) for key, start, end in columns)
+        self.matrix = matrix
+        self.columns = columns
+        self._search_matrix = None
+
+    @classmethod
+    def from_dict(cls, DB_emb: Dict[str, Any]) -> "ValueEmbeddings":
+        """Concatenates per-column embeddings (the legacy pickle layout) into one matrix."""
+        columns, blocks, row = [], [], 0
+        for key, embs in DB_emb.items():
+            embs = np.asarray(embs)
+            if embs.ndim != 2 or not len(embs):
+                continue
+            columns.append((key, row, row + len(embs)))
+            blocks.append(embs)
+            row += len(embs)
+        matrix = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        return cls(matrix, columns)
+
+    def search_matrix(self) -> np.ndarray:
+        """
+        Returns the matrix used for distance computations: the matrix itself, or a float32 copy
+        (made once) when it is stored in float16.
+        """
+        if self._search_matrix is None:
+            if self.matrix.dtype == np.float16:
+                self._search_matrix = self.matrix.astype(np.float32)
+            else:
+                self._search_matrix = self.matrix
+        return self._search_matrix
+
+
+class ValueEmbeddingStore:
+    """
+    The memory-mapped value embeddings and values of one database.
+    """
+
+    def __init__(self, emb_dir: str, db: str):
+        """
+        Raises:
+            ValueError: When the index and the data files still disagree after LOAD_RETRIES reads.
+        """
+        self.db = db
+        for attempt in range(LOAD_RETRIES):
+            index, paths = read_index(emb_dir, db)
+            try:
+                self._open(paths, index["count"])
+            except FileNotFoundError:
+                # 讀完 index 後寫入端已提交新版本並刪除舊檔案
+                error = f"data files of {paths['index']} were removed while loading"
+            else:
+                error = self._check(index)
+                if error is None:
+                    self.dim = index["dim"]
+                    self.columns = [tuple(column) for column in index["columns"]]
+                    return
+            time.sleep(0.1 * (attempt + 1))
+        raise ValueError(f"Inconsistent value store {db}: {error}")
+
+    def _open(self, paths: Dict[str, str], count: int):
+        if count:
+            # mmap_mode 讓 numpy 以 np.memmap 打開，只有實際讀到的頁面才會載入
+            self.matrix = np.load(paths["matrix"], mmap_mode="r")
+            self.offsets = np.load(paths["offsets"], mmap_mode="r")
+        else:
+            # 長度為 0 的檔案無法 mmap
+            self.matrix = np.load(paths["matrix"])
+            self.offsets = np.load(paths["offsets"])
+        if os.path.getsize(paths["strings"]):
+            self.strings = np.memmap(paths["strings"], dtype=np.uint8, mode="r")
+        else:
+            self.strings = np.zeros(0, dtype=np.uint8)
+
+    def _check(self, index: Dict[str, Any]):
+        """Returns why the opened files do not belong to index, or None when they do."""
+        count = index["count"]
+        if self.matrix.shape[0] != count or len(self.offsets) != count + 1:
+            return f"index has {count} rows, matrix {self.matrix.shape[0]}, offsets {len(self.offsets) - 1}"
+        if int(self.offsets[-1]) != len(self.strings):
+            return f"string table has {len(self.strings)} bytes, offsets expect {int(self.offsets[-1])}"
+        return None
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def value(self, row: int) -> str:
+        """Returns the string value stored at row."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.strings[start:end].tobytes().decode("utf-8")
+
+    def as_dicts(self) -> Tuple[ValueEmbeddings, Dict[str, ColumnValues]]:
+        """
+        Returns (DB_emb, col_values) in the layout of the legacy pickles, backed by the memory maps.
+        """
+        col_values = {key: ColumnValues(self, start, end) for key, start, end in self.columns}
+        return ValueEmbeddings(self.matrix, self.columns), col_values
+
+    @staticmethod
+    def write(emb_dir: str, db: str, DB_emb: Dict[str, Any], col_values: Dict[str, Iterable[str]],
+              dtype: str = "float32"):
+        """
+        Writes the embeddings and values of one database in the store format.
+
+        Args:
+            emb_dir (str): Output directory.
+            db (str): Database name.
+            DB_emb (Dict[str, Any]): {table.column: (n, dim) embeddings}.
+            col_values (Dict[str, Iterable[str]]): {table.column: the n values}, aligned with DB_emb.
+            dtype (str): float32 or float16.
+        """
+        with ValueStoreWriter(emb_dir, db, dtype) as writer:
+            for key in DB_emb:
+                writer.add_rows(key, col_values[key], DB_emb[key])
+
+
+class ValueStoreWriter:
+    """
+    Streams a value store to disk batch by batch, so memory stays bounded by one batch.
+
+    Rows go to temporary files and the .npy headers are written on close, once the row count is
+    known. close() moves the data files to new versioned names and then replaces the index, so the
+    store only changes, all at once, when close succeeds; used as a context manager, an exception
+    discards the partial files instead.
+
+    checkpoint() records which columns are complete. A writer created with resume=True continues
+    from the last checkpoint of an interrupted build, dropping the rows of an unfinished column.
+    """
+
+    def __init__(self, emb_dir: str, db: str, dtype: str = "float32", resume: bool = False):
+        self.emb_dir = emb_dir
+        self.db = db
+        self.paths = store_paths(emb_dir, db)
+        self.dtype = np.dtype(dtype)
+        # 先寫到暫存檔再 rename，讀取中的 worker 不會看到寫一半的檔案
+        self.tmp = {name: f"{path}.tmp" for name, path in self.paths.items()}
+        self._raw = {name: f"{self.tmp[name]}.raw" for name in ("matrix", "offsets")}
+        self._progress = f"{self.paths['index']}.progress"
+        self.columns: List[List[Any]] = []
+        self.done: Dict[str, Any] = {}
+        self.dim = None
+        self.count = 0
+        self._position = 0
+        if resume and self._restore():
+            return
+        if os.path.exists(self._progress):
+            os.remove(self._progress)
+        self._matrix = open(self._raw["matrix"], "wb")
+        self._offsets = open(self._raw["offsets"], "wb")
+        self._strings = open(self.tmp["strings"], "wb")
+        self._offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def _restore(self) -> bool:
+        """Reopens the files of the last checkpoint, truncated to its complete columns."""
+        try:
+            with open(self._progress, encoding="utf-8") as f:
+                progress = json.load(f)
+        except FileNotFoundError:
+            return False
+        if progress.get("format") != STORE_FORMAT or progress.get("dtype") != str(self.dtype):
+            return False
+        columns = [column for column in progress["columns"] if column[0] in progress["done"]]
+        count = columns[-1][2] if columns else 0
+        offsets_size = (count + 1) * 8
+        paths = (self._raw["matrix"], self._raw["offsets"], self.tmp["strings"])
+        if not all(os.path.exists(path) for path in paths) or os.path.getsize(self._raw["offsets"]) < offsets_size:
+            return False
+        with open(self._raw["offsets"], "rb") as f:
+            f.seek(count * 8)
+            position = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+        self._matrix, self._offsets, self._strings = (open(path, "r+b") for path in paths)
+        dim = progress["dim"] or 0
+        for f, size in ((self._matrix, count * dim * self.dtype.itemsize), (self._offsets, offsets_size),
+                        (self._strings, position)):
+            f.truncate(size)
+            f.seek(size)
+        self.columns = [list(column) for column in columns]
+        self.done = progress["done"]
+        self.dim = progress["dim"]
+        self.count = count
+        self._position = position
+        return True
+
+    def checkpoint(self, done: Dict[str, Any]):
+        """
+        Flushes the files and records the columns in done as complete.
+
+        Args:
+            done (Dict[str, Any]): {table.column: fingerprint} of every finished column, including
+                columns without values.
+        """
+        for f in (self._matrix, self._offsets, self._strings):
+            f.flush()
+        self.done = dict(done)
+        with open(f"{self._progress}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"format": STORE_FORMAT, "dtype": str(self.dtype), "dim": self.dim,
+                       "columns": self.columns, "done": self.done}, f, ensure_ascii=False)
+        os.replace(f"{self._progress}.tmp", self._progress)
+
+    def add_rows(self, key: str, values: Iterable[str], embs: Any):
+        """
+        Appends rows of column key. Consecutive calls for the same key extend that column.
+        """
+        values = list(values)
+        embs = np.asarray(embs, dtype=self.dtype)
+        if len(values) != len(embs):
+            raise ValueError(f"{key}: {len(values)} values for {len(embs)} embeddings")
+        if not values:
+            return
+        if self.dim is None:
+            self.dim = int(embs.shape[1])
+        elif embs.shape[1] != self.dim:
+            raise ValueError(f"{key}: embedding dim {embs.shape[1]} != {self.dim}")
+
+        if self.columns and self.columns[-1][0] == key and self.columns[-1][2] == self.count:
+            self.columns[-1][2] += len(values)
+        else:
+            self.columns.append([key, self.count, self.count + len(values)])
+        self._matrix.write(np.ascontiguousarray(embs).tobytes())
+        offsets = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            data = str(value).encode("utf-8")
+            self._strings.write(data)
+            self._position += len(data)
+            offsets[i] = self._position
+        self._offsets.write(offsets.tobytes())
+        self.count += len(values)
+
+    @staticmethod
+    def _finish_npy(path: str, raw_path: str, dtype: np.dtype, shape: Tuple[int, ...]):
+        """Writes an .npy header for shape and appends the raw rows after it."""
+        with open(path, "wb") as out, open(raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(
+                out, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+            shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+        os.remove(raw_path)
+
+    def _close_files(self):
+        for f in (self._matrix, self._offsets, self._strings):
+            f.close()
+
+    def close(self):
+        """
+        Finishes the files and replaces the previous store: the data files get new versioned names,
+        and replacing the index that points to them is the single commit point. The data files of
+        the previous version are removed afterwards; readers that already opened them keep their
+        memory maps.
+        """
+        self._close_files()
+        self._finish_npy(self.tmp["matrix"], self._raw["matrix"], self.dtype, (self.count, self.dim or 0))
+        self._finish_npy(self.tmp["offsets"], self._raw["offsets"], np.dtype(np.int64), (self.count + 1,))
+        try:
+            previous = read_index(self.emb_dir, self.db)[1]
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            previous = None
+        version = uuid.uuid4().hex[:12]
+        paths = store_paths(self.emb_dir, self.db, version)
+        # 新版本的檔名沒有讀取端會使用，提交前可以逐一搬移
+        for name in ("matrix", "strings", "offsets"):
+            os.replace(self.tmp[name], paths[name])
+        with open(self.tmp["index"], "w", encoding="utf-8") as f:
+            json.dump({"format": STORE_FORMAT, "version": version, "dtype": str(self.dtype), "dim": self.dim or 0,
+                       "count": self.count, "columns": self.columns}, f, ensure_ascii=False)
+        # 提交點: 替換 index 之後讀取端才會看到新版本
+        os.replace(self.tmp["index"], self.paths["index"])
+        if previous is not None:
+            for name in ("matrix", "strings", "offsets"):
+                if os.path.exists(previous[name]):
+                    os.remove(previous[name])
+        if os.path.exists(self._progress):
+            os.remove(self._progress)
+
+    def suspend(self):
+        """Closes the files but keeps them and the last checkpoint, for a later resume=True writer."""
+        self._close_files()
+
+    def abort(self):
+        """Discards the partial files and keeps the previous store."""
+        self._close_files()
+        for path in list(self.tmp.values()) + list(self._raw.values()) + [self._progress]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self) -> "ValueStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,190 @@
+"""
+LLM 回應快取
+以 (model, prompt, temperature, top_p, n) 的內容雜湊為 key，將 LLM 回應保存在本地 SQLite，
+重跑相同資料集或重複的 prompt 時直接取用
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from config import config
+
+
+class LLMResponseCache:
+    """
+    A persistent, content-addressed cache of raw LLM responses backed by SQLite.
+
+    Entries expire after ttl seconds, and the least recently used ones are evicted once the
+    cache grows beyond max_bytes. Hit and miss counts are kept per pipeline node.
+    """
+
+    # 每寫入多少筆檢查一次容量
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        """
+        Args:
+            path (str): Path of the SQLite cache file.
+            ttl (float): Time to live of an entry in seconds.
+            max_bytes (int): Maximum total size of the cached responses.
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats_lock = Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._puts = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                "created REAL, last_access REAL, size INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: Any, top_p: Any, n: int, **extra: Any) -> str:
+        """
+        Returns the content hash identifying a request.
+        """
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "temperature": temperature, "top_p": top_p, "n": n, "extra": extra},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _record(self, node: str, hit: bool):
+        with self._stats_lock:
+            stats = self._stats.setdefault(node, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+
+    def get(self, key: str, node: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached response for key, or None on a miss or an expired entry.
+
+        Args:
+            key (str): The request key from make_key.
+            node (str): The pipeline node asking, used for hit/miss statistics.
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                with conn:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._record(node, True)
+                return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logging.warning(f"LLM cache read failed: {e}")
+        self._record(node, False)
+        return None
+
+    def put(self, key: str, model: str, response: Dict[str, Any]):
+        """
+        Stores a response and evicts old entries from time to time.
+        """
+        now = time.time()
+        data = json.dumps(response, ensure_ascii=False)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, created, last_access, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, data, now, now, len(data)),
+                )
+            with self._stats_lock:
+                self._puts += 1
+                evict = self._puts % self.EVICT_EVERY == 0
+            if evict:
+                self.evict()
+        except sqlite3.Error as e:
+            logging.warning(f"LLM cache write failed: {e}")
+
+    def evict(self):
+        """Deletes expired entries, then the least recently used ones beyond max_bytes."""
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                stale.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def take_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns the hit/miss counts recorded since the last call and resets them."""
+        with self._stats_lock:
+            stats, self._stats = self._stats, {}
+        return stats
+
+    def merge_stats(self, stats: Dict[str, Dict[str, int]]):
+        """Adds hit/miss counts collected elsewhere (e.g. in a pool process) to this cache."""
+        with self._stats_lock:
+            for node, value in stats.items():
+                own = self._stats.setdefault(node, {"hits": 0, "misses": 0})
+                own["hits"] += value["hits"]
+                own["misses"] += value["misses"]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns hit/miss counts and hit rate per node."""
+        with self._stats_lock:
+            stats = {node: dict(value) for node, value in self._stats.items()}
+        for value in stats.values():
+            total = value["hits"] + value["misses"]
+            value["hit_rate"] = value["hits"] / total if total else 0.0
+        return stats
+
+
+_llm_cache = None
+_llm_cache_lock = Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    獲取行程內共用的 LLM 回應快取（依 config 設定建立）
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache(
+                    config.LLM_CACHE_PATH,
+                    ttl=config.LLM_CACHE_TTL_DAYS * 86400,
+                    max_bytes=config.LLM_CACHE_MAX_MB * 1024 * 1024,
+                )
+    return _llm_cache
+
+
+def llm_cache_in_use() -> bool:
+    """回傳此行程是否已使用過 LLM 回應快取（未開啟快取的節點不會建立快取檔）"""
+    return _llm_cache is not None
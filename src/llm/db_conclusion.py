@@ -1,45 +1,19 @@
 import pandas as pd
-import re, sqlite3, os, chardet
+import re, sqlite3, os, random
+from concurrent.futures import ThreadPoolExecutor
+from runner.schema_catalog import get_schema_catalog
+from runner.description_index import DescriptionIndex
+from config import config
+
+# 一次聚合查詢最多統計的欄位數（SQLite 結果欄位數有上限）
+STATS_COLUMNS_PER_QUERY = 200
+# 隨機範例值從每個表隨機抽取的列數
+RANDOM_EXAMPLE_ROWS = 64
 
 
 def find_foreign_keys_MYSQL_like(DATASET_JSON, db_name):
-    schema_df = pd.read_json(DATASET_JSON)
-    schema_df = schema_df.drop(['column_names', 'table_names'], axis=1)
-    f_keys = []
-    for index, row in schema_df.iterrows():
-        tables = row['table_names_original']
-        col_names = row['column_names_original']
-        foreign_keys = row['foreign_keys']
-        for foreign_key in foreign_keys:
-            first, second = foreign_key
-            first_index, first_column = col_names[first]
-            second_index, second_column = col_names[second]
-            f_keys.append([
-                row['db_id'], tables[first_index], tables[second_index],
-                first_column, second_column
-            ])
-    spider_foreign = pd.DataFrame(f_keys,
-                                  columns=[
-                                      'Database name', 'First Table Name',
-                                      'Second Table Name',
-                                      'First Table Foreign Key',
-                                      'Second Table Foreign Key'
-                                  ])
-
-    df = spider_foreign[spider_foreign['Database name'] == db_name]
-    output = []
-    col_set = set()
-    for index, row in df.iterrows():
-        output.append(row['First Table Name'] + '.' +
-                      row['First Table Foreign Key'] + " = " +
-                      row['Second Table Name'] + '.' +
-                      row['Second Table Foreign Key'])
-        col_set.add(row['First Table Name'] + '.' +
-                    row['First Table Foreign Key'])
-        col_set.add(row['Second Table Name'] + '.' +
-                    row['Second Table Foreign Key'])
-    output = ", ".join(output)
-    return output, col_set
+    # 從預先建立的 schema catalog 查詢，不再每次讀取整個 tables.json
+    return get_schema_catalog(DATASET_JSON).foreign_keys(db_name)
 
 
 def quote_field(field_name):
@@ -52,10 +26,109 @@ def quote_field(field_name):
         return field_name
 
 
+def example_value(val):
+    try:
+        return int(val)
+    except:
+        return val
+
+
+def random_rows(conn, source, count=RANDOM_EXAMPLE_ROWS):
+    """
+    Returns about count rows of a rowid table picked at random rowids, each found with an indexed
+    rowid lookup, so the table is never sorted or scanned.
+    """
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {source}").fetchone()
+    if low is None:
+        return []
+    rowids = random.sample(range(low, high + 1), min(count, high - low + 1))
+    rows = {}
+    for rowid in rowids:
+        # rowid 可能有空缺，取不小於它的第一列
+        row = conn.execute(f"SELECT rowid, * FROM {source} WHERE rowid >= ? ORDER BY rowid LIMIT 1",
+                           (rowid,)).fetchone()
+        rows[row[0]] = row[1:]
+    return list(rows.values())
+
+
+def table_statistics(conn, table_name, columns, sample_rows=0, random_examples=False):
+    """
+    Computes per column whether it contains NULL, whether it has duplicated values (NULLs count as
+    equal, like pandas duplicated) and up to three distinct non-null example values, using
+    aggregate queries instead of loading the table.
+
+    Args:
+        conn: SQLite connection.
+        table_name (str): Table name.
+        columns (List[str]): Column names, as returned by PRAGMA table_info.
+        sample_rows (int): When > 0, tables with more rows are summarised from about sample_rows
+            rows taken at a fixed rowid stride; the flags then describe that sample.
+        random_examples (bool): Pick random example values, from RANDOM_EXAMPLE_ROWS rows at random
+            rowids, instead of the first ones in table order.
+
+    Returns:
+        Dict[str, Tuple[bool, bool, list]]: {column: (contains null, contains duplicates, examples)}.
+    """
+    quote = lambda name: '"' + name.replace('"', '""') + '"'
+    table = quote(table_name)
+    source = table
+    try:
+        conn.execute(f"SELECT rowid FROM {table} LIMIT 1")
+        has_rowid = True
+    except sqlite3.OperationalError:
+        has_rowid = False
+    # 範例值依第一次出現的順序（與 drop_duplicates 相同）
+    order_key = "rowid"
+    if sample_rows:
+        total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if total > sample_rows:
+            if has_rowid:
+                step = -(-total // sample_rows)
+                order_key = '"__stats_rowid__"'
+                source = f"(SELECT rowid AS {order_key}, * FROM {table} WHERE rowid % {step} = 0)"
+            else:
+                # WITHOUT ROWID 的表取前 sample_rows 列
+                source = f"(SELECT * FROM {table} LIMIT {sample_rows})"
+
+    sampled = dict(zip(columns, zip(*random_rows(conn, table)))) if random_examples and has_rowid else {}
+    stats = {}
+    for start in range(0, len(columns), STATS_COLUMNS_PER_QUERY):
+        chunk = columns[start:start + STATS_COLUMNS_PER_QUERY]
+        aggregates = ", ".join(f"COUNT({quote(column)}), COUNT(DISTINCT {quote(column)})" for column in chunk)
+        row = conn.execute(f"SELECT COUNT(*), {aggregates} FROM {source}").fetchone()
+        total = row[0]
+        for i, column in enumerate(chunk):
+            non_null, distinct = row[1 + 2 * i], row[2 + 2 * i]
+            contains_null = non_null < total
+            examples = []
+            if column in sampled:
+                examples = list(dict.fromkeys(value for value in sampled[column] if value is not None))
+                random.shuffle(examples)
+                examples = examples[:3]
+            if len(examples) < min(3, distinct):
+                # 隨機抽樣的列中不重複值不足時，以最先出現的值補足
+                limit = 3 + len(examples)
+                if has_rowid:
+                    query = (f"SELECT {quote(column)} FROM {source} WHERE {quote(column)} IS NOT NULL "
+                             f"GROUP BY {quote(column)} ORDER BY MIN({order_key}) LIMIT {limit}")
+                else:
+                    query = (f"SELECT DISTINCT {quote(column)} FROM {source} "
+                             f"WHERE {quote(column)} IS NOT NULL LIMIT {limit}")
+                first = [r[0] for r in conn.execute(query)]
+                examples += [value for value in first if value not in examples][:3 - len(examples)]
+            stats[column] = (contains_null, distinct + contains_null < total, examples)
+    return stats
+
+
 class db_agent:
 
+    # 範例值取前三個不重複值；db_agent_string 改為隨機取
+    random_examples = False
+
     def __init__(self, chat_model) -> None:
         self.chat_model = chat_model
+        self.sample_rows = config.SCHEMA_STATS_SAMPLE_ROWS
+        self.workers = config.SCHEMA_STATS_WORKERS
 
     def get_allinfo(self,db_json_dir, db,sqllite_dir,db_dir,tables_info_dir, model):
         db_info, db_col = self.get_db_des(sqllite_dir,db_dir,model)
@@ -72,15 +145,10 @@ class db_agent:
         # 获取列的基本信息
         cursor.execute(f"PRAGMA table_info(`{table_name}`)")
         columns_info = cursor.fetchall()
-        df = pd.read_sql_query(f"SELECT * FROM `{table_name}`", conn)
-        contains_null = {
-            column: df[column].isnull().any()
-            for column in df.columns
-        }
-        contains_duplicates = {
-            column: df[column].duplicated().any()
-            for column in df.columns
-        }
+        stats = table_statistics(conn, table_name, [column[1] for column in columns_info],
+                                 self.sample_rows, self.random_examples)
+        contains_null = {column.strip(): s[0] for column, s in stats.items()}
+        contains_duplicates = {column.strip(): s[1] for column, s in stats.items()}
         dic = {}
         for _, row in table_df.iterrows():
             try:
@@ -102,24 +170,8 @@ class db_agent:
             except Exception as e:
                 print(e)
                 dic[col] = "", ""
-        # 获取外键信息
-        row = list(
-            cursor.execute(f"SELECT * FROM `{table_name}` LIMIT 1").fetchall()
-            [0])
-        for i, col in enumerate(df.columns):
-            try:
-                vals = df[col].dropna().drop_duplicates().iloc[:3].values
-                val_p = []
-                for val in vals:
-                    try:
-                        val_p.append(int(val))
-                    except:
-                        val_p.append(val)
-                if len(vals) == 0:
-                    raise ValueError
-                row[i] = val_p
-            except:
-                pass
+        # 每个字段的示例值，全为 NULL 时显示 None
+        row = [[example_value(val) for val in stats[column[1]][2]] or None for column in columns_info]
         # 构建schema表示
         schema_str = f"## Table {table_name}:\nColumn| Column Description| Value Description| Type| 3 Example Value\n"
         columns = {}
@@ -154,33 +206,39 @@ class db_agent:
         tables = cursor.execute(sql).fetchall()
         db_info = []
         db_col = dict()
-        file_list = os.listdir(table_dir)
-        files_emb = model.encode(file_list, show_progress_bar=False)
-        for table in tables:
-            if table[0] == 'sqlite_sequence':
-                continue
-            files_sim = (files_emb @ model.encode(table[0] + '.csv',
-                                                  show_progress_bar=False).T)
-            if max(files_sim) > 0.9:
-                file = os.path.join(table_dir, file_list[files_sim.argmax()])
-            else:
-                file = os.path.join(table_dir, table[0] + '.csv')
-
+        table_dfs = []
+        # 表与描述 CSV 的对应及编码检测结果缓存在 description index 中
+        index = DescriptionIndex.get(table_dir)
+        files = index.csv_files([table[0] for table in tables if table[0] != 'sqlite_sequence'], model)
+        for table, file in files.items():
             try:
-                with open(file, 'rb') as f:
-                    result = chardet.detect(f.read())
-                table_df = pd.read_csv(file, encoding=result['encoding'])
+                try:
+                    table_df = pd.read_csv(file, encoding=index.encoding(file))
+                except UnicodeDecodeError:
+                    # 文件开头不足以判断编码时，用整个文件重新检测
+                    table_df = pd.read_csv(file, encoding=index.redetect(file))
             except Exception as e:
                 print(e)
                 table_df = pd.DataFrame()
-            table_info, columns = self.get_complete_table_info(
-                conn, table[0], table_df)
-            db_info.append(table_info)
-            db_col.update(columns)
-        db_info = "\n".join(db_info)
+            table_dfs.append((table, table_df))
         cursor.close()
         conn.close()
 
+        def describe(item):
+            # sqlite3 连接不能跨线程共用，每个表各自连接
+            table_conn = sqlite3.connect(sqllite_dir)
+            try:
+                return self.get_complete_table_info(table_conn, *item)
+            finally:
+                table_conn.close()
+
+        # 各表的统计互不相关，并行执行（查询期间 sqlite3 会释放 GIL）
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for table_info, columns in executor.map(describe, table_dfs):
+                db_info.append(table_info)
+                db_col.update(columns)
+        db_info = "\n".join(db_info)
+
         return db_info, db_col
 
     def db_conclusion(self, db_info):
@@ -216,6 +274,8 @@ class db_agent:
 
 class db_agent_string(db_agent):
 
+    random_examples = True
+
     def __init__(self, chat_model) -> None:
         super().__init__(chat_model)
 
@@ -224,15 +284,10 @@ class db_agent_string(db_agent):
         # 获取列的基本信息
         cursor.execute(f"PRAGMA table_info(`{table_name}`)")
         columns_info = cursor.fetchall()
-        df = pd.read_sql_query(f"SELECT * FROM `{table_name}`", conn)
-        contains_null = {
-            column: df[column].isnull().any()
-            for column in df.columns
-        }
-        contains_duplicates = {
-            column: df[column].duplicated().any()
-            for column in df.columns
-        }
+        stats = table_statistics(conn, table_name, [column[1] for column in columns_info],
+                                 self.sample_rows, self.random_examples)
+        contains_null = {column.strip(): s[0] for column, s in stats.items()}
+        contains_duplicates = {column.strip(): s[1] for column, s in stats.items()}
         dic = {}
         for _, row in table_df.iterrows():
             try:
@@ -254,28 +309,8 @@ class db_agent_string(db_agent):
             except Exception as e:
                 print(e)
                 dic[col] = "", ""
-        # 获取外键信息
-        row = list(
-            cursor.execute(f"SELECT * FROM `{table_name}` LIMIT 1").fetchall()
-            [0])
-        for i, col in enumerate(df.columns):
-            try:
-                df_tmp=df[col].dropna().drop_duplicates()
-                if len(df_tmp)>=3:
-                    vals = df_tmp.sample(3).values
-                else:
-                    vals=df_tmp.values
-                val_p = []
-                for val in vals:
-                    try:
-                        val_p.append(int(val))
-                    except:
-                        val_p.append(val)
-                if len(vals) == 0:
-                    raise ValueError
-                row[i] = val_p
-            except:
-                pass
+        # 每个字段的示例值，全为 NULL 时显示 None
+        row = [[example_value(val) for val in stats[column[1]][2]] or None for column in columns_info]
         # 构建schema表示
         schema_str = f"## Table {table_name}:\n"
         columns = {}
@@ -1,11 +1,24 @@
 import requests, time
-import dashscope
 import torch
 import json
 import re
 import os
+import random
+import asyncio
+from threading import Lock
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from runner.logger import Logger
 from llm.prompts import prompts_fewshot_parse
+from llm.cache import get_llm_cache
+from llm.rate_limiter import get_rate_limiter, estimate_tokens
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    # 沒有 httpx 時，async 呼叫會改用執行緒執行同步的 requests
+    HTTPX_AVAILABLE = False
 
 # 使用統一的配置管理
 try:
@@ -30,17 +43,166 @@ except ImportError:
         AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
 
 
-def model_chose(step, model="gpt-4 32K"):
+class LLMHTTPError(Exception):
+    """An LLM provider answered with a non-2xx status."""
+
+    def __init__(self, status_code, body, retry_after=None):
+        super().__init__(f"HTTP {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+_http_session = None
+_http_session_lock = Lock()
+
+
+def get_http_session():
+    """
+    Returns the process-wide requests.Session shared by every LLM client.
+
+    The session keeps HTTP keep-alive connections in a pool of HTTP_POOL_SIZE per host, so LLM
+    calls reuse TCP+TLS connections instead of paying a new handshake each time.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config.HTTP_POOL_SIZE,
+                    pool_maxsize=config.HTTP_POOL_SIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+def http_timeout():
+    """Returns the (connect, read) timeout used for LLM requests."""
+    return (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header (delta-seconds or HTTP-date) into seconds, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Returns how long to wait before retry number attempt (starting at 1).
+
+    Honors the server's Retry-After when given, otherwise uses exponential backoff with full jitter
+    capped at RETRY_BACKOFF_MAX.
+    """
+    if retry_after is not None:
+        return min(retry_after, config.RETRY_BACKOFF_MAX)
+    cap = min(config.RETRY_BACKOFF_MAX, config.RETRY_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+def _decode_response(limiter, status_code, headers, text, decode, usage):
+    """
+    Decodes a provider response and reports its token usage to the rate limiter.
+
+    Raises:
+        LLMHTTPError: If the status is not 2xx. A 429 also pauses the endpoint for Retry-After.
+    """
+    if status_code >= 400:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if status_code == 429 and retry_after:
+            limiter.pause(retry_after)
+        raise LLMHTTPError(status_code, text[:500], retry_after)
+    res = decode()
+    if isinstance(res, dict) and isinstance(res.get("usage"), dict):
+        usage["total_tokens"] = res["usage"].get("total_tokens")
+    return res
+
+
+def post_json(url, headers, body):
+    """
+    POSTs a JSON body through the shared session and returns the decoded response.
+
+    The request waits on the endpoint's rate limiter before it is sent.
+
+    Raises:
+        LLMHTTPError: If the response status is not 2xx.
+    """
+    limiter = get_rate_limiter(url)
+    with limiter.limit(estimate_tokens(body)) as usage:
+        response = get_http_session().post(url=url, json=body, headers=headers, timeout=http_timeout())
+        return _decode_response(limiter, response.status_code, response.headers, response.text, response.json, usage)
+
+
+_async_http_clients = {}
+
+
+def get_async_http_client():
+    """
+    Returns the httpx.AsyncClient of the running event loop, creating it on first use.
+
+    One client per loop keeps up to ASYNC_HTTP_MAX_CONNECTIONS requests in flight over pooled
+    keep-alive connections.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(config.HTTP_READ_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+        )
+        _async_http_clients[loop] = client
+    return client
+
+
+async def close_async_http_client():
+    """Closes the httpx.AsyncClient of the running event loop, if any."""
+    client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def apost_json(url, headers, body):
+    """
+    Async version of post_json.
+
+    Raises:
+        LLMHTTPError: If the response status is not 2xx.
+    """
+    if not HTTPX_AVAILABLE:
+        return await asyncio.to_thread(post_json, url, headers, body)
+    limiter = get_rate_limiter(url)
+    async with limiter.alimit(estimate_tokens(body)) as usage:
+        response = await get_async_http_client().post(url, json=body, headers=headers)
+        return _decode_response(limiter, response.status_code, response.headers, response.text, response.json, usage)
+
+
+def model_chose(step, model="gpt-4 32K", cache=False):
     if (
         model.startswith("gpt")
         or model.startswith("claude35_sonnet")
         or model.startswith("gemini")
     ):
-        return gpt_req(step, model)
+        return gpt_req(step, model, cache=cache)
     if model == "deepseek":
-        return deep_seek(model)
+        return deep_seek(step, model)
     if model.startswith("qwen"):
-        return qwenmax(model)
+        return qwenmax(step, model)
     if model.startswith("sft"):
         return sft_req()
 
@@ -50,9 +212,20 @@ class req:
         self.Cost = 0
         self.model = model
         self.step = step
+        # 綁定建立時所在任務的 logger，讓節點內部的執行緒也寫入同一個任務的紀錄
+        try:
+            self.logger = Logger()
+        except ValueError:
+            self.logger = None
+
+    async def aget_ans(self, *args, **kwargs):
+        """
+        Async version of get_ans. Clients without a native async transport run get_ans in a thread.
+        """
+        return await asyncio.to_thread(self.get_ans, *args, **kwargs)
 
     def log_record(self, prompt_text, output):
-        logger = Logger()
+        logger = self.logger or Logger()
         logger.log_conversation(prompt_text, "Human", self.step)
         logger.log_conversation(output, "AI", self.step)
 
@@ -73,7 +246,8 @@ class req:
         return t + "#SELECT:" + s + "#values:" + v
 
 
-def request(url, model, messages, temperature, top_p, n, key, **k):
+def build_request(url, model, messages, temperature, top_p, n, key, **k):
+    """Builds the headers and JSON body of a chat completion request."""
     # 判斷是否為 Azure OpenAI（URL 包含 azure.com）
     is_azure = "azure.com" in url if url else False
 
@@ -108,20 +282,44 @@ def request(url, model, messages, temperature, top_p, n, key, **k):
     if not is_azure:
         request_body["model"] = model
 
-    res = requests.post(url=url, json=request_body, headers=headers).json()
+    return headers, request_body
+
+
+def request(url, model, messages, temperature, top_p, n, key, **k):
+    headers, request_body = build_request(url, model, messages, temperature, top_p, n, key, **k)
+    res = post_json(url, headers, request_body)
+
+    return res
+
+
+async def arequest(url, model, messages, temperature, top_p, n, key, **k):
+    headers, request_body = build_request(url, model, messages, temperature, top_p, n, key, **k)
+    res = await apost_json(url, headers, request_body)
 
     return res
 
 
 class gpt_req(req):
-    def __init__(self, step, model="gpt-4o-0513") -> None:
+    def __init__(self, step, model="gpt-4o-0513", cache=False) -> None:
         super().__init__(step, model)
-
-    def get_ans(self, messages, temperature=0.0, top_p=None, n=1, single=True, **k):
-        count = 0
-        res = None
-        response_clean = None
-        
+        # pipeline_setup 中的值可能是字串 "True"/"False"
+        self.cache = str(cache).lower() in ("true", "1", "yes")
+
+    def _cache_key(self, messages, temperature, top_p, n, **k):
+        """Returns the response cache key, or None when this request should not be cached."""
+        if not self.cache:
+            return None
+        if config.LLM_CACHE_SKIP_NONZERO_TEMPERATURE and temperature:
+            return None
+        return get_llm_cache().make_key(self.model, messages, temperature, top_p, n, **k)
+
+    def _cached_answer(self, cache_key, messages, n, single):
+        res = get_llm_cache().get(cache_key, self.step)
+        if res is None:
+            return None
+        return self._handle_response(res, messages, n, single)
+
+    def _print_prompt(self, messages):
         # Debug: 打印完整 prompt 到控制台（不寫入日誌文件）
         if config.DEBUG_PRINT_PROMPT:
             print(f"\n{'='*80}")
@@ -130,60 +328,112 @@ class gpt_req(req):
             print(messages)
             print("="*80 + "\n")
 
-        while count < 50:
+    def _request_kwargs(self, messages, temperature, top_p, n, **k):
+        # 使用 Azure OpenAI 配置（如果有設定）
+        return dict(
+            url=AZURE_ENDPOINT if AZURE_ENDPOINT else "",
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            n=n,
+            key=AZURE_API_KEY if AZURE_API_KEY else "",
+            **k,
+        )
+
+    def _handle_response(self, res, messages, n, single):
+        if n == 1 and single:
+            response_clean = res["choices"][0]["message"]["content"]
+        else:
+            response_clean = res["choices"]
+        # print(self.step)
+        if self.step != "prepare_train_queries":
+            self.log_record(messages, response_clean)  # 记录对话内容
+        return response_clean
+
+    def _add_cost(self, res):
+        if res and "usage" in res:
+            self.Cost += (
+                res["usage"]["prompt_tokens"] / 1000 * 0.042
+                + res["usage"]["completion_tokens"] / 1000 * 0.126
+            )
+
+    def get_ans(self, messages, temperature=0.0, top_p=None, n=1, single=True, **k):
+        count = 0
+        res = None
+        response_clean = None
+        self._print_prompt(messages)
+
+        cache_key = self._cache_key(messages, temperature, top_p, n, **k)
+        if cache_key:
+            response_clean = self._cached_answer(cache_key, messages, n, single)
+            if response_clean is not None:
+                return response_clean
+
+        while count < config.MAX_RETRIES:
             # print(messages) #保存prompt和答案
             try:
-                # 使用 Azure OpenAI 配置（如果有設定）
-                url = AZURE_ENDPOINT if AZURE_ENDPOINT else ""
-                key = AZURE_API_KEY if AZURE_API_KEY else ""
-
-                res = request(
-                    url=url,
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    top_p=top_p,
-                    n=n,
-                    key=key,
-                    **k,
-                )
-                if n == 1 and single:
-                    response_clean = res["choices"][0]["message"]["content"]
-                else:
-                    response_clean = res["choices"]
-                # print(self.step)
-                if self.step != "prepare_train_queries":
-                    self.log_record(messages, response_clean)  # 记录对话内容
+                res = request(**self._request_kwargs(messages, temperature, top_p, n, **k))
+                response_clean = self._handle_response(res, messages, n, single)
+                if cache_key:
+                    get_llm_cache().put(cache_key, self.model, res)
                 break
 
             except Exception as e:
                 count += 1
-                time.sleep(2)
                 # print(messages)
                 print(f"Error: {e}, attempt {count}, Cost: {self.Cost}")
                 if res:
                     print(f"Response: {res}")
+                time.sleep(backoff_delay(count, getattr(e, "retry_after", None)))
 
-        if res and "usage" in res:
-            self.Cost += (
-                res["usage"]["prompt_tokens"] / 1000 * 0.042
-                + res["usage"]["completion_tokens"] / 1000 * 0.126
-            )
+        self._add_cost(res)
+        return response_clean
+
+    async def aget_ans(self, messages, temperature=0.0, top_p=None, n=1, single=True, **k):
+        """Async version of get_ans: waits on the event loop instead of blocking a thread."""
+        count = 0
+        res = None
+        response_clean = None
+        self._print_prompt(messages)
 
+        cache_key = self._cache_key(messages, temperature, top_p, n, **k)
+        if cache_key:
+            response_clean = await asyncio.to_thread(self._cached_answer, cache_key, messages, n, single)
+            if response_clean is not None:
+                return response_clean
+
+        while count < config.MAX_RETRIES:
+            try:
+                res = await arequest(**self._request_kwargs(messages, temperature, top_p, n, **k))
+                response_clean = self._handle_response(res, messages, n, single)
+                if cache_key:
+                    await asyncio.to_thread(get_llm_cache().put, cache_key, self.model, res)
+                break
+
+            except Exception as e:
+                count += 1
+                print(f"Error: {e}, attempt {count}, Cost: {self.Cost}")
+                if res:
+                    print(f"Response: {res}")
+                await asyncio.sleep(backoff_delay(count, getattr(e, "retry_after", None)))
+
+        self._add_cost(res)
         return response_clean
 
 
 class deep_seek(req):
-    def __init__(self, model) -> None:
-        super().__init__(model)
+    def __init__(self, step, model) -> None:
+        super().__init__(step, model)
 
     def get_ans(self, messages, temperature=0.0, debug=False):
         count = 0
+        ans = None
 
         while count < 8:
             try:
-                url = "https://api.deepseek.com/chat/completions"
-                headers = {"Content-Type": "application/json", "Authorization": ""}
+                url = config.DEEPSEEK_API_BASE
+                headers = {"Content-Type": "application/json", "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}"}
 
                 # 定义请求体
                 jsons = {
@@ -197,40 +447,48 @@ class deep_seek(req):
                 }
 
                 # 发送POST请求
-                response = requests.post(url, headers=headers, json=jsons)
+                response = post_json(url, headers, jsons)
                 if debug:
-                    print(response.json)
-                ans = response.json()["choices"][0]["message"]["content"]
+                    print(response)
+                ans = response["choices"][0]["message"]["content"]
                 break
             except Exception as e:
                 count += 1
-                time.sleep(2)
-                print(e, count, self.Cost, response.json())
+                print(e, count, self.Cost)
+                time.sleep(backoff_delay(count, getattr(e, "retry_after", None)))
         return ans
 
 
 class qwenmax(req):
-    def __init__(self, model) -> None:
-        super().__init__(model)
-        dashscope.api_key = ""
+    # DashScope 的 OpenAI 相容端點，透過共用的 HTTP session 呼叫
+    URL = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
+
+    def __init__(self, step, model) -> None:
+        super().__init__(step, model)
 
     def get_ans(self, messages, temperature=0.0, debug=False):
         count = 0
 
         while count < 8:
             try:
-                response = dashscope.Generation.call(
-                    model=self.model, temperature=temperature, prompt=messages
-                )
+                headers = {"Content-Type": "application/json", "Authorization": f"Bearer {config.QWEN_API_KEY}"}
+                jsons = {
+                    "model": self.model,
+                    "temperature": temperature,
+                    "messages": [{"role": "user", "content": messages}],
+                }
+                response = post_json(self.URL, headers, jsons)
+                if debug:
+                    print(response)
                 self.Cost += (
-                    response.usage.input_tokens / 1000 * 0.04
-                    + response.usage.output_tokens / 1000 * 0.12
+                    response["usage"]["prompt_tokens"] / 1000 * 0.04
+                    + response["usage"]["completion_tokens"] / 1000 * 0.12
                 )
-                return response.output["text"]
-            except:
+                return response["choices"][0]["message"]["content"]
+            except Exception as e:
                 count += 1
-                time.sleep(5)
-                print(response.code, response.message)
+                print(e, count, self.Cost)
+                time.sleep(backoff_delay(count, getattr(e, "retry_after", None)))
 
 
 class sft_req(req):
@@ -0,0 +1,228 @@
+"""
+LLM 請求速率限制
+依 provider / endpoint 以 token bucket 控制每分鐘請求數、每分鐘 token 數與同時進行的請求數，
+超過限制時呼叫端會在此排隊等待，而不是直接送出後收到 429 再重試
+"""
+
+import time
+import asyncio
+from threading import Condition, Lock
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config import config
+
+# 同時請求數已滿時，async 呼叫端的輪詢間隔（秒）
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at rate_per_min, holding at most one minute of budget.
+
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_min: float):
+        self.capacity = float(rate_per_min)
+        self.rate = rate_per_min / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Returns how many seconds until amount can be consumed (0 when it can be now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # 單次請求超過整個桶容量時，以滿桶為準，避免永遠等不到
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        if self.rate:
+            self.level -= amount
+
+    def refund(self, amount: float):
+        """Gives back (or, when negative, charges) the difference between estimated and actual usage."""
+        if self.rate:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    A thread-safe limiter for one provider endpoint enforcing requests/min, tokens/min and
+    a maximum number of requests in flight.
+
+    Sync callers block on a condition variable; async callers sleep on the event loop. Queue depth
+    and wait times are tracked for reporting.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, max_in_flight: int = 0):
+        """
+        Args:
+            name (str): The endpoint this limiter guards.
+            rpm (float): Requests per minute, 0 for unlimited.
+            tpm (float): Tokens per minute, 0 for unlimited.
+            max_in_flight (int): Maximum concurrent requests, 0 for unlimited.
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._cond = Condition(Lock())
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _wait_time(self, tokens: float) -> Optional[float]:
+        """
+        Returns 0 and takes a slot when the request may start, the seconds to wait for the buckets,
+        or None when it must wait for a request in flight to finish. Called with the lock held.
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return None
+        wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self._requests.consume(1)
+        self._tokens.consume(tokens)
+        self.in_flight += 1
+        return 0.0
+
+    def _record_wait(self, waited: float):
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, tokens: float = 0):
+        """Blocks until a request estimated at tokens may be sent."""
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait)
+            finally:
+                self.waiting -= 1
+            self._record_wait(time.monotonic() - start)
+
+    async def aacquire(self, tokens: float = 0):
+        """Async version of acquire: sleeps on the event loop instead of blocking a thread."""
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._wait_time(tokens)
+                    if wait == 0:
+                        self._record_wait(time.monotonic() - start)
+                        return
+                await asyncio.sleep(ASYNC_POLL_INTERVAL if wait is None else wait)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, estimated_tokens: float = 0, used_tokens: Optional[float] = None):
+        """
+        Frees the in-flight slot of a finished request.
+
+        Args:
+            estimated_tokens (float): The amount passed to acquire.
+            used_tokens (Optional[float]): The actual usage reported by the provider, if known.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self._tokens.refund(estimated_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Holds back every request to this endpoint for seconds (e.g. after a 429 with Retry-After)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @contextmanager
+    def limit(self, tokens: float = 0):
+        """Context manager around acquire/release. The yielded dict may receive the actual usage."""
+        self.acquire(tokens)
+        usage = {}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage.get("total_tokens"))
+
+    @asynccontextmanager
+    async def alimit(self, tokens: float = 0):
+        """Async version of limit."""
+        await self.aacquire(tokens)
+        usage = {}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage.get("total_tokens"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the current queue depth, requests in flight and wait times."""
+        with self._cond:
+            return {
+                "endpoint": self.name,
+                "waiting": self.waiting,
+                "in_flight": self.in_flight,
+                "requests": self.granted,
+                "total_wait": self.total_wait,
+                "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = Lock()
+
+
+def get_rate_limiter(url: str) -> RateLimiter:
+    """
+    獲取 url 所屬 endpoint（host + path）的共用限流器，限制值取自 config
+    """
+    parts = urlsplit(url or "")
+    name = f"{parts.netloc}{parts.path}" or "default"
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(name, RateLimiter(
+                name,
+                rpm=config.LLM_RATE_LIMIT_RPM,
+                tpm=config.LLM_RATE_LIMIT_TPM,
+                max_in_flight=config.LLM_MAX_IN_FLIGHT,
+            ))
+    return limiter
+
+
+def rate_limiter_stats() -> List[Dict[str, Any]]:
+    """回傳所有已建立限流器的統計"""
+    return [limiter.stats() for limiter in list(_limiters.values())]
+
+
+def estimate_tokens(body: Dict[str, Any]) -> int:
+    """
+    Estimates the tokens a chat completion request will use: about 4 characters per prompt
+    token plus the completion budget of every choice.
+    """
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+    return prompt_chars // 4 + (body.get("max_tokens") or 0) * (body.get("n") or 1)
@@ -47,6 +47,8 @@ if __name__ == '__main__':
     args_parser.add_argument('--log_level', type=str, default='warning', help="Logging level.")
     args_parser.add_argument('--start', type=int, default=0, help="Start point")
     args_parser.add_argument('--end', type=int, default=1, help="End point")
+    args_parser.add_argument('--workers', type=int, default=1, help="Number of tasks processed in parallel.")
+    args_parser.add_argument('--pool', type=str, default='thread', choices=['thread', 'process', 'async'], help="Worker pool type used when workers > 1.")
     args = args_parser.parse_args()
     args.run_start_time = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
 
@@ -1,7 +1,7 @@
 import logging
 from typing import Any, Dict, List
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from runner.embedding_registry import get_embedding_model
 from pipeline.utils import node_decorator,get_last_node_result
 from pipeline.pipeline_manager import PipelineManager
 from runner.database_manager import DatabaseManager
@@ -16,16 +16,12 @@ from runner.check_and_correct import muti_process_sql,soft_check,sql_raw_parse
 def align_correct(task: Any,  execution_history: List[Dict[str, Any]]) -> Dict[str, Any]:
     config,node_name=PipelineManager().get_model_para()
     paths=DatabaseManager()
-    fewshot_path=paths.db_fewshot_path
-    correct_fewshot_json=paths.db_fewshot2_path
     db_sqlite_path=paths.db_path
     prompts_template=db_check_prompts()
-    bert_model = SentenceTransformer(config["bert_model"], device=config["device"])
-    with open(fewshot_path) as f:## fewshot
-        df_fewshot = json.load(f)
-    chat_model = model_chose(node_name,config["engine"])
-    with open(correct_fewshot_json) as f:
-        correct_dic = json.load(f)
+    bert_model = get_embedding_model(config["bert_model"], config["device"])
+    df_fewshot = paths.get_fewshot()## fewshot
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
+    correct_dic = paths.get_correct_fewshot()
     all_db_col = get_last_node_result(execution_history, "generate_db_schema")["db_col_dic"]
     column = get_last_node_result(execution_history, "column_retrieve_and_other_info")["column"]
     foreign_keys= get_last_node_result(execution_history, "column_retrieve_and_other_info")["foreign_keys"]
@@ -8,18 +8,48 @@ from llm.model import model_chose
 from llm.db_conclusion import *
 import json
 from llm.prompts import *
-from runner.check_and_correct import get_sql
+from runner.check_and_correct import get_sql, aget_sql
 
 @node_decorator(check_schema_status=False)
 def candidate_generate(task: Any, execution_history: List[Dict[str, Any]]) -> Dict[str, Any]:
-    config,node_name=PipelineManager().get_model_para()
-    paths=DatabaseManager()
-    fewshot_path=paths.db_fewshot_path
+    chat_model, question, new_prompt, config = prepare_candidate(task, execution_history)
+
+    single = config['single'].lower() == 'true'  # 将字符串转换为布尔值
+    return_question=config['return_question']== 'true' 
+    SQL,_ = get_sql(chat_model, new_prompt, config['temperature'], return_question=return_question,n=config['n'],single=single)
+
+    
+    response = {
+        "rewrite_question":question,
+        "SQL": SQL
+        # "new_prompt":new_prompt
+    }
+
+    return response
+
 
-    with open(fewshot_path) as f:## fewshot
-        df_fewshot = json.load(f)
+@node_decorator(check_schema_status=False, node_name="candidate_generate")
+async def acandidate_generate(task: Any, execution_history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    chat_model, question, new_prompt, config = prepare_candidate(task, execution_history)
 
-    chat_model = model_chose(node_name,config["engine"])  # deepseek qwen-max gpt qwen-max-longcontext
+    single = config['single'].lower() == 'true'
+    return_question=config['return_question']== 'true'
+    SQL,_ = await aget_sql(chat_model, new_prompt, config['temperature'], return_question=return_question,n=config['n'],single=single)
+
+    response = {
+        "rewrite_question":question,
+        "SQL": SQL
+    }
+
+    return response
+
+
+def prepare_candidate(task: Any, execution_history: List[Dict[str, Any]]):
+    config,node_name=PipelineManager().get_model_para(node_name="candidate_generate")
+    paths=DatabaseManager()
+    df_fewshot = paths.get_fewshot()## fewshot
+
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))  # deepseek qwen-max gpt qwen-max-longcontext
     column = get_last_node_result(execution_history, "column_retrieve_and_other_info")["column"]
     foreign_keys= get_last_node_result(execution_history, "column_retrieve_and_other_info")["foreign_keys"]
     L_values = get_last_node_result(execution_history, "column_retrieve_and_other_info")["L_values"]
@@ -46,19 +76,7 @@ def candidate_generate(task: Any, execution_history: List[Dict[str, Any]]) -> Di
     new_prompt = make_newprompt(db_check_prompts().new_prompt, fewshot,
                             key_col_des, new_db_info, question,
                             task.evidence,q_order)
-
-    single = config['single'].lower() == 'true'  # 将字符串转换为布尔值
-    return_question=config['return_question']== 'true' 
-    SQL,_ = get_sql(chat_model, new_prompt, config['temperature'], return_question=return_question,n=config['n'],single=single)
-
-    
-    response = {
-        "rewrite_question":question,
-        "SQL": SQL
-        # "new_prompt":new_prompt
-    }
-
-    return response
+    return chat_model, question, new_prompt, config
 
 
 
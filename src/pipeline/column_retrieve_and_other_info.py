@@ -1,27 +1,79 @@
 import logging,re,json
+import asyncio
 from typing import Any, Dict
 import json_repair  
 from pathlib import Path
 from pipeline.utils import node_decorator,get_last_node_result
 from pipeline.pipeline_manager import PipelineManager
 from runner.database_manager import DatabaseManager
-from sentence_transformers import SentenceTransformer
+from runner.embedding_registry import get_embedding_model
 from llm.model import model_chose
 from llm.db_conclusion import find_foreign_keys_MYSQL_like
 from llm.prompts import *
 from runner.extract import DES_new
-from database_process.make_emb import load_emb
 from runner.column_retrieve import ColumnRetriever
 from runner.column_update import ColumnUpdater
 
 @node_decorator(check_schema_status=False)
 def column_retrieve_and_other_info(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
     config,node_name=PipelineManager().get_model_para()
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
+    L_values, column, foreign_keys, foreign_set = retrieve_columns_and_values(task, execution_history, config)
+    # values = [f"{x[0]}: '{x[1]}'" for x in L_values]
+    count=0
+    while count<3:
+        try:
+            q_order=query_order(task.raw_question,chat_model,db_check_prompts().select_prompt,temperature=config['temperature'])
+            break
+        except:
+            count+=1
+
+    # # q_order = f"The content of the SELECT statement should only include: {q_order}"
+    # q_order=""
+
+    response = {
+        # "col_retrieve":list(col_retrieve),
+        # "col_select":list(cols_select),
+        "L_values":L_values,
+        "column":column,
+        "foreign_keys":foreign_keys,
+        "foreign_set":foreign_set,
+        "q_order":q_order
+    }
+
+    return response
+
+
+@node_decorator(check_schema_status=False, node_name="column_retrieve_and_other_info")
+async def acolumn_retrieve_and_other_info(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
+    config,node_name=PipelineManager().get_model_para(node_name="column_retrieve_and_other_info")
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
+    # embedding 检索是 CPU 计算，放到执行绪中，和 query_order 的 LLM 请求并行
+    retrieve = asyncio.create_task(asyncio.to_thread(retrieve_columns_and_values, task, execution_history, config))
+    count=0
+    while count<3:
+        try:
+            q_order=await aquery_order(task.raw_question,chat_model,db_check_prompts().select_prompt,temperature=config['temperature'])
+            break
+        except:
+            count+=1
+    L_values, column, foreign_keys, foreign_set = await retrieve
+
+    response = {
+        "L_values":L_values,
+        "column":column,
+        "foreign_keys":foreign_keys,
+        "foreign_set":foreign_set,
+        "q_order":q_order
+    }
+
+    return response
+
+
+def retrieve_columns_and_values(task: Any, execution_history: Dict[str, Any], config: Dict[str, Any]):
     paths=DatabaseManager()
-    emb_dir=paths.emb_dir
     tables_info_dir=paths.db_tables
-    chat_model = model_chose(node_name,config["engine"])
-    bert_model = SentenceTransformer(config["bert_model"], device=config["device"])
+    bert_model = get_embedding_model(config["bert_model"], config["device"])
 
     all_db_col = get_last_node_result(execution_history, "generate_db_schema")["db_col_dic"]#返回最后面等于 参数名的结果
     origin_col = get_last_node_result(execution_history, "extract_query_noun")["col"]
@@ -32,12 +84,7 @@ def column_retrieve_and_other_info(task: Any, execution_history: Dict[str, Any])
     #     hint = "None"
     db=task.db_id
 
-    emb_values_dic = {}
-    if emb_values_dic.get(db):
-        DB_emb, col_values = emb_values_dic[db]
-    else:
-        DB_emb, col_values = load_emb(db, emb_dir)
-        emb_values_dic[db] = [DB_emb, col_values]
+    DB_emb, col_values = paths.get_emb()
 
     db_col = {x: all_db_col[x][0] for x in all_db_col }  ## db string
     db_keys_col=all_db_col.keys()
@@ -47,7 +94,12 @@ def column_retrieve_and_other_info(task: Any, execution_history: Dict[str, Any])
     foreign_keys, foreign_set = find_foreign_keys_MYSQL_like(tables_info_dir, db)      
     cols=ColumnUpdater(db_col).col_pre_update(origin_col,col_retrieve,foreign_set)
 
-    des = DES_new(bert_model, DB_emb, col_values)   
+    # value_index: exact（預設）/ ivf / hnsw，value_index_probe 越大召回率越高、延遲越長
+    value_index = paths.get_value_index(config.get("value_index", "exact"))
+    # lexical_prefilter: 完全相同的值直接命中（不足 topk 個時其餘由 embedding 搜尋補足），字面相近的值縮小 embedding 比對範圍
+    lexical = paths.get_lexical_index() if str(config.get("lexical_prefilter", False)).lower() == "true" else None
+    des = DES_new(bert_model, DB_emb, col_values, index=value_index, probe=config.get("value_index_probe"),
+                  lexical=lexical)
 
     cols_select, L_values = des.get_key_col_des(cols,
                                     values,
@@ -56,29 +108,7 @@ def column_retrieve_and_other_info(task: Any, execution_history: Dict[str, Any])
                                     shold=0.65)
 
     column=ColumnUpdater(db_col).col_suffix(cols_select)
-    # values = [f"{x[0]}: '{x[1]}'" for x in L_values]
-    count=0
-    while count<3:
-        try:
-            q_order=query_order(task.raw_question,chat_model,db_check_prompts().select_prompt,temperature=config['temperature'])
-            break
-        except:
-            count+=1
-
-    # # q_order = f"The content of the SELECT statement should only include: {q_order}"
-    # q_order=""
-
-    response = {
-        # "col_retrieve":list(col_retrieve),
-        # "col_select":list(cols_select),
-        "L_values":L_values,
-        "column":column,
-        "foreign_keys":foreign_keys,
-        "foreign_set":foreign_set,
-        "q_order":q_order
-    }
-
-    return response
+    return L_values, column, foreign_keys, foreign_set
 
 def safe_extract_json(ans: str):
     # 抓出 ```json ... ``` 區塊
@@ -103,6 +133,16 @@ def query_order(question, chat_model, select_prompt,temperature):
 
 
 
+async def aquery_order(question, chat_model, select_prompt,temperature):
+    select_prompt = select_prompt.format(question=question)
+    ans = await chat_model.aget_ans(select_prompt, temperature=temperature)
+    ans = re.sub("```json|```", "", ans)
+    select_json = safe_extract_json(ans)
+    res, judge = json_ext(select_json)
+    return res
+
+
+
 def json_ext(jsonf):
     ans = []
     judge = False
@@ -11,13 +11,28 @@ from llm.prompts import *
 
 @node_decorator(check_schema_status=False)
 def extract_col_value(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
-    config, node_name = PipelineManager().get_model_para()
+    chat_model, ext_prompt, temperature = prepare_extract(task, execution_history)
+    key_col_des_raw = chat_model.get_ans(ext_prompt, temperature).replace("```", "")
+
+    response = {"key_col_des_raw": key_col_des_raw}
+    return response
+
+
+@node_decorator(check_schema_status=False, node_name="extract_col_value")
+async def aextract_col_value(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
+    chat_model, ext_prompt, temperature = prepare_extract(task, execution_history)
+    key_col_des_raw = (await chat_model.aget_ans(ext_prompt, temperature)).replace("```", "")
+
+    response = {"key_col_des_raw": key_col_des_raw}
+    return response
+
+
+def prepare_extract(task: Any, execution_history: Dict[str, Any]):
+    config, node_name = PipelineManager().get_model_para(node_name="extract_col_value")
     paths = DatabaseManager()
-    fewshot_path = paths.db_fewshot_path
-    chat_model = model_chose(node_name, config["engine"])
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
 
-    with open(fewshot_path) as f:  ## fewshot
-        df_fewshot = json.load(f)
+    df_fewshot = paths.get_fewshot()  ## fewshot
 
     hint = task.evidence
     if hint == "":
@@ -33,24 +48,18 @@ def extract_col_value(task: Any, execution_history: Dict[str, Any]) -> Dict[str,
     # 記錄使用的 extract few-shot
     logging.info(f"Using extract few-shot example #{qid}")
 
-    key_col_des_raw = get_des_ans(
-        chat_model,
+    ext_prompt = get_des_prompt(
         db_check_prompts().extract_prompt,
         df_fewshot["extract"][qid]["prompt"],
         all_info,
         task.question,
         hint,
         False,
-        temperature=config["temperature"],
     )
-
-    response = {"key_col_des_raw": key_col_des_raw}
-    return response
+    return chat_model, ext_prompt, config["temperature"]
 
 
-def get_des_ans(
-    chat_model, ext_prompt, fewshot, db, question, hint, debug, temperature=1.0
-):
+def get_des_prompt(ext_prompt, fewshot, db, question, hint, debug):
     fewshot = fewshot.split("/* Answer the following:")[1:6]
     fewshot = "/* Answer the following:" + "/* Answer the following:".join(fewshot)
     ext_prompt = ext_prompt.format(
@@ -59,6 +68,13 @@ def get_des_ans(
 
     if debug:
         print(ext_prompt)
+    return ext_prompt
+
+
+def get_des_ans(
+    chat_model, ext_prompt, fewshot, db, question, hint, debug, temperature=1.0
+):
+    ext_prompt = get_des_prompt(ext_prompt, fewshot, db, question, hint, debug)
     pre_col_values = chat_model.get_ans(ext_prompt, temperature).replace("```", "")
 
     return pre_col_values
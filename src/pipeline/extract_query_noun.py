@@ -10,7 +10,7 @@ from llm.prompts import *
 def extract_query_noun(task: Any,execution_history: Dict[str, Any]) -> Dict[str, Any]:
     config,node_name=PipelineManager().get_model_para()
 
-    chat_model = model_chose(node_name,config["engine"])
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
     key_col_des_raw = get_last_node_result(execution_history, "extract_col_value")["key_col_des_raw"]
     noun_ext = chat_model.get_ans(db_check_prompts().noun_prompt.format(raw_question=task.question),temperature=config["temperature"])
     values, col = parse_des(key_col_des_raw, noun_ext, debug=False)
@@ -21,6 +21,21 @@ def extract_query_noun(task: Any,execution_history: Dict[str, Any]) -> Dict[str,
     }
     return response
 
+@node_decorator(check_schema_status=False, node_name="extract_query_noun")
+async def aextract_query_noun(task: Any,execution_history: Dict[str, Any]) -> Dict[str, Any]:
+    config,node_name=PipelineManager().get_model_para(node_name="extract_query_noun")
+
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
+    key_col_des_raw = get_last_node_result(execution_history, "extract_col_value")["key_col_des_raw"]
+    noun_ext = await chat_model.aget_ans(db_check_prompts().noun_prompt.format(raw_question=task.question),temperature=config["temperature"])
+    values, col = parse_des(key_col_des_raw, noun_ext, debug=False)
+
+    response = {
+        "values":values,
+        "col":col
+    }
+    return response
+
 def parse_des(pre_col_values, nouns, debug):
     pre_col_values = pre_col_values.split("/*")[0].strip()
     if debug:
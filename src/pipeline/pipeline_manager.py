@@ -48,7 +48,8 @@ class PipelineManager:
         Retrieves the prompt, engine, and parser for the current node based on the pipeline setup.
 
         Args:
-            **kwargs: Additional keyword arguments for the prompt.
+            **kwargs: Additional keyword arguments for the prompt. node_name overrides the node
+                inferred from the caller, for node variants whose function name differs.
 
         Returns:
             Tuple[Any, Any, Any]: The prompt, engine, and parser instances.
@@ -56,9 +57,11 @@ class PipelineManager:
         Raises:
             ValueError: If the engine is not specified for the node.
         """
-        frame = inspect.currentframe()
-        caller_frame = frame.f_back
-        node_name = caller_frame.f_code.co_name
+        node_name = kwargs.get("node_name")
+        if node_name is None:
+            frame = inspect.currentframe()
+            caller_frame = frame.f_back
+            node_name = caller_frame.f_code.co_name
         
         node_setup = self.pipeline_setup.get(node_name, {})
                 
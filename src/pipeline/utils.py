@@ -1,48 +1,78 @@
+import inspect
 from functools import wraps
 from typing import Dict, List, Any, Callable
 from runner.logger import Logger
 from runner.database_manager import DatabaseManager
 
-def node_decorator(check_schema_status: bool = False) -> Callable:
+def node_decorator(check_schema_status: bool = False, node_name: str = None) -> Callable:
     """
     A decorator to add logging and error handling to pipeline node functions.
 
+    Coroutine functions get an async wrapper, so a node can have an async variant that runs
+    under app.astream.
+
     Args:
         check_schema_status (bool, optional): Whether to check the schema status. Defaults to False.
+        node_name (str, optional): The node type to record. Defaults to the function name.
 
     Returns:
         Callable: The decorated function.
     """
     def decorator(func: Callable) -> Callable:
+        name = node_name or func.__name__
+
+        def already_done(execution_history: List[Dict[str, Any]]) -> bool:
+            return any(x["node_type"] == name for x in execution_history)
+
+        def record(state: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+            execution_history = state["keys"]["execution_history"]
+            execution_history.append(result)
+            # if execution_history[-1]["node_type"]=="align_correct":
+            #     print(execution_history)
+            Logger().dump_history_to_file(execution_history)
+            return state
+
+        def record_error(task: Any, result: Dict[str, Any], e: Exception):
+            Logger().log(f"Node '{name}': {task.db_id}_{task.question_id}\n{type(e)}: {e}\n", "error")
+            # Logger().log(f"Vote content: {vote}, Type: {type(vote)}", "error")  # 打印 vote 内容
+            result.update({
+                "status": "error",
+                "error": f"{type(e)}: <{e}>",
+            })
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+                Logger().log(f"---{name.upper()}---")
+                result = {"node_type": name}
+                task = state["keys"]["task"]
+                try:
+                    execution_history = state["keys"]["execution_history"]
+                    if already_done(execution_history):
+                        return state
+                    output = await func(task, execution_history)
+                    result.update(output)
+                    result["status"] = "success"
+                except Exception as e:
+                    record_error(task, result, e)
+                return record(state, result)
+            return async_wrapper
+
         @wraps(func)
         def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
-            node_name = func.__name__
-            Logger().log(f"---{node_name.upper()}---")
-            result = {"node_type": node_name}
-
+            Logger().log(f"---{name.upper()}---")
+            result = {"node_type": name}
+            task = state["keys"]["task"]
             try:
-                task = state["keys"]["task"]
                 execution_history = state["keys"]["execution_history"]
-                for x in execution_history:
-                    if x["node_type"]==node_name:
-                        return state
+                if already_done(execution_history):
+                    return state
                 output = func(task,execution_history)
                 result.update(output)
                 result["status"] = "success"
             except Exception as e:
-                Logger().log(f"Node '{node_name}': {task.db_id}_{task.question_id}\n{type(e)}: {e}\n", "error")
-                # Logger().log(f"Vote content: {vote}, Type: {type(vote)}", "error")  # 打印 vote 内容
-                result.update({
-                    "status": "error",
-                    "error": f"{type(e)}: <{e}>",
-                })
-            
-            execution_history.append(result)
-            # if execution_history[-1]["node_type"]=="align_correct":
-            #     print(execution_history)
-            Logger().dump_history_to_file(execution_history)
-            
-            return state
+                record_error(task, result, e)
+            return record(state, result)
         return wrapper
     return decorator
 
@@ -1,64 +1,130 @@
 import logging
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional
 from pathlib import Path
 from pipeline.utils import node_decorator,get_last_node_result
-from runner.check_and_correct import sql_raw_parse
+from pipeline.pipeline_manager import PipelineManager
+from llm.model import model_chose
+from llm.prompts import db_check_prompts
+from runner.check_and_correct import sql_raw_parse, get_sql
+from runner.result_cache import multiset_fingerprint, normalize_sql
 
-def vote_single(vote_all,mod="answer",SQLs=[]):
-    vote_M = [0] * len(vote_all)
-    same_ans = {}
+# 没有候选的执行时间低于此值时，回退到第一个候选 SQL
+NO_TIME_COST = 1000000
+
+def answer_fingerprint(ans):
+    # 答案为 sql_exec 的 {"fingerprint", "row_count", "preview"}，执行失败时为 [] / None
+    # 空结果与执行失败都不参与投票
+    if isinstance(ans, dict):
+        return ans["fingerprint"] if ans.get("row_count") else None
+    if not ans:
+        return None
+    # 旧版执行纪录（--use_checkpoint）中答案为结果行的列表，以相同的行哈希计算
+    if isinstance(ans, (list, tuple, set)):
+        return multiset_fingerprint(tuple(row) for row in ans)[0]
+    raise TypeError(f"Unsupported vote answer of type {type(ans).__name__}")
+
+def tie_break_time_cost(tied: List[int], vote_all: List[Dict[str, Any]], judge=None) -> Optional[int]:
+    # 执行最快的候选，相同时取较早的
+    chosen, min_t = None, NO_TIME_COST
+    for i in tied:
+        if vote_all[i]["time_cost"] < min_t:
+            chosen, min_t = i, vote_all[i]["time_cost"]
+    return chosen
+
+def tie_break_sql_length(tied: List[int], vote_all: List[Dict[str, Any]], judge=None) -> Optional[int]:
+    # 最短的 SQL，相同时取执行较快、再较早的
+    return min(tied, key=lambda i: (len(vote_all[i]["sql"]), vote_all[i]["time_cost"], i))
+
+def tie_break_llm_judge(tied: List[int], vote_all: List[Dict[str, Any]], judge=None) -> Optional[int]:
+    # 由大模型从平票的候选中选择，回复无法对应到候选时按执行时间
+    groups = {}
+    for i in tied:
+        groups.setdefault(normalize_sql(vote_all[i]["sql"]), i)
+    if judge is not None and len(groups) > 1:
+        try:
+            choice = normalize_sql(judge([vote_all[i]["sql"] for i in groups.values()]))
+            if choice in groups:
+                return groups[choice]
+            logging.warning(f"LLM vote judge chose a SQL outside the candidates: {choice}")
+        except Exception as e:
+            logging.warning(f"LLM vote judge failed: {e}")
+    return tie_break_time_cost(tied, vote_all)
+
+TIE_BREAKERS: Dict[str, Callable[..., Optional[int]]] = {
+    "time_cost": tie_break_time_cost,
+    "sql_length": tie_break_sql_length,
+    "llm_judge": tie_break_llm_judge,
+}
+
+def vote_single(vote_all,mod="answer",SQLs=[],tie_break="time_cost",judge=None):
+    """
+    Votes for the candidate whose answer is shared by the most candidates.
+
+    Each answer is hashed once and candidates are grouped by the hash; a candidate gets the total
+    count of its group, or 0 when its answer is empty. Ties between the candidates with the most
+    votes are broken by TIE_BREAKERS[tie_break]; without a winner (or when no candidate has votes
+    and tie_break is not time_cost) the rule is time_cost, and the first SQL is the fallback.
+
+    Args:
+        vote_all (List[Dict[str, Any]]): The vote entries of align_correct.
+        mod (str): The answer field to vote on.
+        SQLs (List[str]): The candidate SQLs of candidate_generate, for the fallback.
+        tie_break (str): Name of the tie-breaking rule.
+        judge (Callable[[List[str]], str]): Picks one SQL out of several, for llm_judge.
+
+    Returns:
+        Tuple[str, int, float, List[int]]: The chosen SQL, the max vote, the chosen time cost and the votes.
+    """
+    if tie_break not in TIE_BREAKERS:
+        raise ValueError(f"Unknown vote tie_break {tie_break}, expected one of {list(TIE_BREAKERS)}")
+    # fingerprint -> 组内的候选
+    groups = {}
+    keys = []
     for i, item in enumerate(vote_all):
-        sql = item["sql"]
-        ans = item[mod]  # ans 现在是一个列表
-        count = item["count"]
-        time_cost = item["time_cost"]
-        
-        vote_M[i] += count
-        
-        if same_ans.get(i, -1) == -1:  #父节点
-            same_ans[i] = i
-        if not ans:
-            vote_M[i] = 0
-            continue
-        for j in range(i + 1, len(vote_all)):
-            other_ans = vote_all[j][mod]  # 其他项的答案
-            # 使用集合比较两个答案列表
-            if ans ==  other_ans:
-                same_ans[j] = same_ans[i]
-                vote_M[i] += vote_all[j]["count"]
-                vote_M[j] += vote_all[i]["count"]
-            # if ans == vote_all[j][1]:
-            #     same_ans[j] = same_ans[i]
-            #     vote_M[i] += vote_all[j][2]
-            #     vote_M[j] += vote_all[i][2]
+        key = answer_fingerprint(item[mod])
+        keys.append(key)
+        if key is not None:
+            groups.setdefault(key, []).append(i)
+    group_count = {key: sum(vote_all[i]["count"] for i in members) for key, members in groups.items()}
+    vote_M = [group_count[key] if key is not None else 0 for key in keys]
+    # 每个候选对应组内第一个候选（父节点）
+    same_ans = {i: groups[key][0] if key is not None else i for i, key in enumerate(keys)}
 
     maxm = max(vote_M)
-    # print(maxm,ans)
-    min_t = 1000000
-    sql_0=sql_raw_parse(SQLs[0], False)[0] 
-    ans = sql_0 
-    # ans=
-    # print(vote_M)
+    sql_0=sql_raw_parse(SQLs[0], False)[0]
     print("_______vote same best", same_ans)
-    # result_all = {}
-    for i, x in enumerate(vote_M):
-        if maxm == x:
-            if vote_all[i]["time_cost"]< min_t:
-                ans = vote_all[i]['sql']
-                min_t = vote_all[i]["time_cost"]
-    return ans,maxm,min_t,vote_M
-      
+    tied = [i for i, x in enumerate(vote_M) if x == maxm]
+    rule = TIE_BREAKERS[tie_break] if maxm > 0 else tie_break_time_cost
+    chosen = rule(tied, vote_all, judge)
+    if chosen is None:
+        return sql_0, maxm, NO_TIME_COST, vote_M
+    return vote_all[chosen]['sql'], maxm, vote_all[chosen]["time_cost"], vote_M
+
+def make_vote_judge(config: Dict[str, Any], node_name: str, question: str) -> Callable[[List[str]], str]:
+    chat_model = model_chose(node_name, config["engine"], cache=config.get("llm_cache", False))
+    vote_prompt = db_check_prompts().vote_prompt
+
+    def judge(SQLs: List[str]) -> str:
+        prompt = vote_prompt.format(question=question, sql='\n\n'.join(SQLs))
+        return get_sql(chat_model, prompt, 0.0)[0]
+    return judge
 
 
 @node_decorator(check_schema_status=False)
 def vote(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
+    config,node_name=PipelineManager().get_model_para()
+    tie_break = config.get("tie_break", "time_cost")
+    judge = None
+    if tie_break == "llm_judge":
+        question = get_last_node_result(execution_history, "candidate_generate")["rewrite_question"]
+        judge = make_vote_judge(config, node_name, question)
 
     vote = get_last_node_result(execution_history, "align_correct")["vote"]
     SQLs=get_last_node_result(execution_history, "candidate_generate")["SQL"]# 兜底
 
-    ans_correct,maxm,min_t,vote_M=vote_single(vote,"correct_ans",SQLs)
+    ans_correct,maxm,min_t,vote_M=vote_single(vote,"correct_ans",SQLs,tie_break,judge)
     # align_ans,maxm,min_t,vote_M=vote_single(vote,"align_ans",SQLs)
-    ans,maxm,min_t,vote_M=vote_single(vote,"answer",SQLs)
+    ans,maxm,min_t,vote_M=vote_single(vote,"answer",SQLs,tie_break,judge)
     print(ans)
     print("_______")
     if maxm == 0:
@@ -68,7 +134,7 @@ def vote(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
     print(
         f"******votes:{vote_M} max vote: {maxm}, min_t:{min_t}, SQL vote is: {ans}"
     )
-  
+
     response = {
         "SQL":ans,
         "SQL_correct_vote":ans_correct,
@@ -79,4 +145,3 @@ def vote(task: Any, execution_history: Dict[str, Any]) -> Dict[str, Any]:
     return response
 
 
-
@@ -1,16 +1,26 @@
+from threading import Lock
 from typing import Dict, TypedDict, Callable
 from langgraph.graph import END, StateGraph
+from langchain_core.runnables import RunnableLambda
 
 from pipeline.generate_db_schema import generate_db_schema
-from pipeline.extract_col_value import extract_col_value
-from pipeline.extract_query_noun import extract_query_noun
-from pipeline.column_retrieve_and_other_info import column_retrieve_and_other_info
-from pipeline.candidate_generate import candidate_generate
+from pipeline.extract_col_value import extract_col_value, aextract_col_value
+from pipeline.extract_query_noun import extract_query_noun, aextract_query_noun
+from pipeline.column_retrieve_and_other_info import column_retrieve_and_other_info, acolumn_retrieve_and_other_info
+from pipeline.candidate_generate import candidate_generate, acandidate_generate
 from pipeline.align_correct import align_correct
 from pipeline.vote import vote
 from pipeline.evaluation import evaluation
 import logging
 
+# 节点的 async 版本，app.astream 执行时使用；没有 async 版本的节点由 LangGraph 放到执行绪中执行
+ASYNC_NODES = {
+    "extract_col_value": aextract_col_value,
+    "extract_query_noun": aextract_query_noun,
+    "column_retrieve_and_other_info": acolumn_retrieve_and_other_info,
+    "candidate_generate": acandidate_generate,
+}
+
 ### Graph State ###
 class GraphState(TypedDict):
     """
@@ -50,7 +60,10 @@ class WorkflowBuilder:
         """
         for node_name in nodes:
             if node_name in globals() and callable(globals()[node_name]):
-                self.workflow.add_node(node_name, globals()[node_name])
+                node = globals()[node_name]
+                if node_name in ASYNC_NODES:
+                    node = RunnableLambda(node, afunc=ASYNC_NODES[node_name], name=node_name)
+                self.workflow.add_node(node_name, node)
                 logging.info(f"Added node: {node_name}")
             else:
                 logging.error(f"Node function '{node_name}' not found in global scope")
@@ -84,3 +97,31 @@ def build_pipeline(pipeline_nodes: str) -> Callable:
     app = builder.workflow.compile()
     logging.info("Pipeline built and compiled successfully")
     return app
+
+
+# 已編譯的 workflow 快取，key 為 pipeline_nodes 字串
+_pipeline_cache: Dict[str, Callable] = {}
+_pipeline_cache_lock = Lock()
+
+
+def get_pipeline(pipeline_nodes: str) -> Callable:
+    """
+    Returns the compiled pipeline for the given nodes, building it only on first use.
+
+    The compiled graph holds no per-task state, so one instance is shared by every task
+    and every RunManager in the process.
+
+    Args:
+        pipeline_nodes (str): A string of pipeline node names separated by '+'.
+
+    Returns:
+        Callable: The cached compiled workflow application.
+    """
+    app = _pipeline_cache.get(pipeline_nodes)
+    if app is None:
+        with _pipeline_cache_lock:
+            app = _pipeline_cache.get(pipeline_nodes)
+            if app is None:
+                app = build_pipeline(pipeline_nodes)
+                _pipeline_cache[pipeline_nodes] = app
+    return app
@@ -1,8 +1,11 @@
-import os, sqlite3, re, json
+import os, re, json
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor, TimeoutError
-import random, time
-from func_timeout import func_timeout, FunctionTimedOut
+import random
+import contextvars
+from config import config
+from runner.sqlite_pool import QueryBudget, QueryTimeout, pooled_connection
+from runner.result_cache import fingerprint_cached
 
 
 
@@ -36,6 +39,20 @@ def get_sql(chat_model,
         return [x['message']['content'] for x in sql], ""
 
 
+async def aget_sql(chat_model,
+                   prompt,
+                   temp=1.0,
+                   return_question=False,
+                   top_p=None,
+                   n=1,
+                   single=True):
+    sql = await chat_model.aget_ans(prompt, temp, top_p=top_p, n=n, single=single)
+    if single:
+        return sql_raw_parse(sql, return_question)
+    else:
+        return [x['message']['content'] for x in sql], ""
+
+
 def retable(sql):  # 把T1 恢复原状
     table_as = re.findall(' ([^ ]*) +AS +([^ ]*)', sql)
     for x in table_as:
@@ -158,9 +175,9 @@ def filter_sql(b, bx, conn, SQL, chars=""):
     return SQL, flag
 
 
-def join_exec(db, bx, al, question, SQL, chat_model):
+def join_exec(db, bx, al, question, SQL, chat_model, budget=None):
     flag = False
-    with sqlite3.connect(db, timeout=180) as conn:
+    with pooled_connection(db, budget=budget) as conn:
         if bx.startswith("IN"):
             b = bx[2:].strip(" ()").split(',')
             SQL, flag = filter_sql(b, bx, conn, SQL, chars="= ")
@@ -324,12 +341,10 @@ class soft_check:
             _, al, bx = join_mutil[0]
 
             try:
-                SQL, flag = func_timeout(180 * 8,
-                                         join_exec,
-                                         args=(db, bx, al, question, SQL,
-                                               self.chat_model))
+                SQL, flag = join_exec(db, bx, al, question, SQL, self.chat_model,
+                                      QueryBudget(180 * 8, config.SQL_MAX_VM_STEPS))
                 # print("soft change JOIN")
-            except FunctionTimedOut:
+            except QueryTimeout:
                 print("time out join")
             except Exception as e:
                 print(e)
@@ -513,10 +528,11 @@ ERROR: 数据库中不存在: {', '.join(badval_l)}
                     new_prompt,
                     db_col={},
                     foreign_set={},
-                    L_values=[]):
+                    L_values=[],
+                    budget=None):
         # db = os.path.join(DB_dir, db, db + ".sqlite")
+        # budget 为所有执行共用的 QueryBudget，用完时抛出 QueryTimeout（不会中断等待中的 LLM 请求）
 
-        conn = sqlite3.connect(db_sqlite_path, timeout=180)
         count = 0
         raw = sql
         none_case = False
@@ -524,11 +540,16 @@ ERROR: 数据库中不存在: {', '.join(badval_l)}
             try:
                 # def
                 # ans,time_cost=func_timeout(180,sql_exec,args=(SQL,dbt))
-                df = pd.read_sql_query(sql, conn)
-                if len(df) == 0:
+                # 串流执行，相同（正规化后）的 SQL 只执行一次，之后 get_sql_ans 直接命中同一条快取
+                result = fingerprint_cached(db_sqlite_path, sql, budget)
+                if result.error is not None:
+                    raise Exception(result.error)
+                if result.row_count == 0:
                     raise ValueError("Error':Result: None")
                 else:
                     break
+            except QueryTimeout:
+                raise
             except Exception as e:
                 if count >= 3:  #重新生成一次SQL
                     wsql = sql
@@ -588,26 +609,25 @@ ERROR: 数据库中不存在: {', '.join(badval_l)}
 
             raw = sql
 
-        conn.close()
         return sql, none_case
 
 
 
-def sql_exec(SQL, db):
-    with sqlite3.connect(db) as conn:
-        s = time.time()
-        df = pd.read_sql_query(SQL, conn)
-        ans = set(tuple(x) for x in df.values)
-        time_cost = time.time() - s
-    return ans, time_cost
+def sql_exec(SQL, db, timeout=None):
+    # 以 fetchmany 串流执行，答案只保留 multiset hash、行数与前几行预览（大结果不会占满内存与执行纪录）
+    # 命中快取时 time_cost 为首次执行的耗时
+    result = fingerprint_cached(db, SQL, QueryBudget(timeout, config.SQL_MAX_VM_STEPS))
+    if result.error is not None:
+        raise Exception(result.error)
+    return result.answer(), result.elapsed
 
 def get_sql_ans(SQL,db_sqlite_path):
     try:
             # dbt = os.path.join(DB_dir, db, db + ".sqlite")
-        ans, time_cost = func_timeout(180, sql_exec, args=(SQL, db_sqlite_path))
-    except FunctionTimedOut:
+        ans, time_cost = sql_exec(SQL, db_sqlite_path, timeout=180)
+    except QueryTimeout as e:
         ans,time_cost=[],100000
-        print("time out")
+        print(f"time out: {e}")
     except Exception as e:
         ans,time_cost=[],100000
         print(f"SQL execution error: {e}")
@@ -641,19 +661,21 @@ def process_sql(Dcheck, SQL,L_values, values, question,
     align_SQL=SQL
     can_ex = True
     nocse = True
-    ans = set()
+    ans = []
     time_cost = 10000000
 
 
     try:
-        SQL, nocse = func_timeout(540,
-                                  Dcheck.correct_sql,
-                                  args=(db_sqlite_path, SQL, question, new_db_info,
+        SQL, nocse = Dcheck.correct_sql(db_sqlite_path, SQL, question, new_db_info,
                                         hint, key_col_des, tmp_prompt, db_col,
-                                        foreign_set, L_values))
-    except:
+                                        foreign_set, L_values,
+                                        budget=QueryBudget(540, config.SQL_MAX_VM_STEPS))
+    except QueryTimeout:
         print("timeout")
         can_ex = False
+    except Exception as e:
+        print(e)
+        can_ex = False
 
     if can_ex:
         ans,time_cost=get_sql_ans(SQL, db_sqlite_path)
@@ -672,9 +694,10 @@ def muti_process_sql(Dcheck, SQLs, L_values, values, question,
     # Use ThreadPoolExecutor to execute the process_sql function concurrently
     with ThreadPoolExecutor(max_workers=n) as executor:
         # Submit all tasks
+        # 每个线程在复制的 context 中执行，继承当前任务的 Logger / DatabaseManager
 
         future_to_sql = {
-            executor.submit(process_sql, Dcheck, SQL, L_values, values, question, new_db_info, db_col_keys, hint,key_col_des,tmp_prompt,db_col,foreign_set, align_methods, db_sqlite_path): 
+            executor.submit(contextvars.copy_context().run, process_sql, Dcheck, SQL, L_values, values, question, new_db_info, db_col_keys, hint,key_col_des,tmp_prompt,db_col,foreign_set, align_methods, db_sqlite_path): 
             (SQLs[SQL], SQL)
             for SQL in SQLs
         }
@@ -699,7 +722,7 @@ def muti_process_sql(Dcheck, SQLs, L_values, values, question,
                 })
                 
                 none_case = none_case or none_c
-            except FunctionTimedOut:
+            except (TimeoutError, QueryTimeout):
                 print(f"Error: Processing SQL timeout for SQL count {count}")
                 # 将集合转换为列表
                 vote.append({
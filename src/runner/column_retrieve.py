@@ -1,6 +1,6 @@
-import pandas as pd
 import re
 import torch
+from runner.schema_catalog import get_schema_catalog
 
 class ColumnRetriever:
     def __init__(self, bert_model, tables_info_dir):
@@ -19,8 +19,7 @@ class ColumnRetriever:
         l = list(table_dic.keys())
         all_col = self.col_ret(l,ext_a)  # 正式的列名
         
-        tab_df = pd.read_json(self.tables_info_dir)
-        col_name_d = self.col_name_dic(tab_df, db)
+        col_name_d = get_schema_catalog(self.tables_info_dir).column_name_map(db)
         
         re_col = []
         if col_name_d:
@@ -62,10 +61,6 @@ class ColumnRetriever:
         all_col = self.same_pick(l,m_ans,num_pick)
         return all_col
 
-    def col_name_dic(self,df,db):
-        a,b=df[df["db_id"]==db][["column_names","column_names_original"]].values[0]
-        return {x[1]:y[1] for x,y in zip(a[1:],b[1:]) if  x[1]!=y[1]}
-
     def get_col_set(self,all_col,re_col,col_name_d,table_dic,reflect=False):
         ans = set()
         if reflect:
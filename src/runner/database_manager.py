@@ -1,33 +1,71 @@
 import os
 import pickle
+from collections import OrderedDict
 from threading import Lock
+from contextvars import ContextVar
 from pathlib import Path
 
-from typing import Callable, Dict, List, Any
+from typing import Callable, Dict, List, Any, Tuple
+from config import config
 from runner.execution import compare_sqls
+from database_process.make_emb import load_emb
+from database_process.value_index import load_value_index
+from database_process.lexical_index import LexicalIndex
+from runner.fewshot_store import load_fewshot
 
 
 class DatabaseManager:
     """
-    A singleton class to manage database operations including schema generation, 
+    A per-database context to manage database operations including schema generation, 
     querying LSH and vector databases, and managing column profiles.
+
+    One context exists per (db_mode, db_root_path, db_id) in a process-wide pool with LRU eviction.
+    Each context carries its own cached schema, embeddings and value indexes (fewshot files are
+    shared through FewshotStore, sqlite connections through runner.sqlite_pool), so
+    tasks on different databases no longer re-initialise a shared instance. Calling DatabaseManager()
+    without arguments returns the context bound to the calling thread or asyncio task; threads
+    started inside a task must be submitted with contextvars.copy_context().run to inherit it.
     """
-    _instance = None
     _lock = Lock()
+    _current: ContextVar = ContextVar("current_database_manager", default=None)
+    _contexts: "OrderedDict[Tuple[str, str, str], DatabaseManager]" = OrderedDict()
+    max_contexts = config.DB_CONTEXT_POOL_SIZE
 
     def __new__(cls, db_mode=None,db_root_path=None,db_id=None):
         if (db_mode is not None) and (db_root_path is not None) and(db_id is not None):
+            key = (db_mode, str(db_root_path), db_id)
             with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super(DatabaseManager, cls).__new__(cls)
-                    cls._instance._init(db_mode, db_root_path,db_id)
-                elif cls._instance.db_id != db_id:
-                    cls._instance._init(db_mode,db_root_path,db_id)
-                return cls._instance
+                instance = cls._contexts.get(key)
+                if instance is None:
+                    instance = super(DatabaseManager, cls).__new__(cls)
+                    instance._init(db_mode, db_root_path,db_id)
+                    cls._contexts[key] = instance
+                cls._contexts.move_to_end(key)
+                cls._evict()
+            cls._current.set(instance)
+            return instance
         else:
-            if cls._instance is None:
-                raise ValueError("DatabaseManager instance has not been initialized yet.")
-            return cls._instance
+            instance = cls._current.get()
+            if instance is None:
+                raise ValueError("No DatabaseManager is bound to the calling thread or task; threads must be "
+                                 "submitted with contextvars.copy_context().run.")
+            return instance
+
+    @classmethod
+    def release(cls):
+        """Unbinds the current context of the calling thread or asyncio task."""
+        cls._current.set(None)
+
+    @classmethod
+    def _evict(cls):
+        """
+        Drops least recently used contexts beyond max_contexts. Must hold cls._lock.
+
+        Evicted contexts are only removed from the pool; tasks still holding one keep using it and
+        its caches are released once the last reference goes away.
+        """
+        while len(cls._contexts) > cls.max_contexts:
+            cls._contexts.popitem(last=False)
 
     def _init(self, db_mode: str, db_root_path:str,db_id: str):
         """
@@ -40,6 +78,11 @@ class DatabaseManager:
         self.db_mode = db_mode
         self.db_root_path=db_root_path
         self.db_id = db_id
+        self._cache_lock = Lock()
+        self.schema = None
+        self._emb = None
+        self._value_indexes: Dict[str, Any] = {}
+        self._lexical = None
         self._set_paths()
 
     def _set_paths(self):
@@ -52,6 +95,57 @@ class DatabaseManager:
         self.db_fewshot2_path=Path(self.db_root_path)/"correct_fewshot2.json"
         self.emb_dir=Path(self.db_root_path)/"emb"
 
+    def get_emb(self) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+        """
+        Returns the value embeddings and column values of this database, loading them once.
+
+        Returns:
+            Tuple: (DB_emb, col_values) as produced by make_emb.
+        """
+        if self._emb is None:
+            with self._cache_lock:
+                if self._emb is None:
+                    self._emb = load_emb(self.db_id, self.emb_dir)
+        return self._emb
+
+    def get_value_index(self, backend: str = "exact"):
+        """
+        Returns the nearest-neighbour index over the value embeddings of this database, loading it once.
+
+        Args:
+            backend (str): exact, ivf or hnsw (see database_process.value_index). Falls back to exact
+                search when the index was not built by make_emb.
+        """
+        index = self._value_indexes.get(backend)
+        if index is None:
+            DB_emb = self.get_emb()[0]
+            with self._cache_lock:
+                index = self._value_indexes.get(backend)
+                if index is None:
+                    index = load_value_index(str(self.emb_dir), self.db_id, DB_emb.search_matrix(), backend)
+                    self._value_indexes[backend] = index
+        return index
+
+    def get_lexical_index(self):
+        """
+        Returns the lexical index over the values of this database (built by make_emb), or None.
+        """
+        if self._lexical is None:
+            count = len(self.get_emb()[0].search_matrix())
+            with self._cache_lock:
+                if self._lexical is None:
+                    # False 表示已經找過但沒有索引
+                    self._lexical = LexicalIndex.load(str(self.emb_dir), self.db_id, count) or False
+        return self._lexical or None
+
+    def get_fewshot(self) -> Dict[str, Any]:
+        """Returns the parsed fewshot questions.json, shared by the process and reloaded when it changes."""
+        return load_fewshot(self.db_fewshot_path)
+
+    def get_correct_fewshot(self) -> Dict[str, Any]:
+        """Returns the parsed correct_fewshot2.json, shared by the process and reloaded when it changes."""
+        return load_fewshot(self.db_fewshot2_path)
+
     @staticmethod
     def with_db_path(func: Callable):
         """
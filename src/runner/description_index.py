@@ -0,0 +1,138 @@
+"""
+Description index
+記錄資料庫 database_description 目錄中資料表與描述 CSV 的對應，以及每個 CSV 偵測到的編碼:
+    - 表名與檔名的模糊比對（embedding 相似度）只在目錄的檔案清單改變時重新計算
+    - 編碼偵測只讀取檔案開頭的一段，並以檔案的 mtime / 大小判斷是否需要重新偵測
+
+索引保存在記憶體並寫入資料庫目錄的 description_index.json（目錄不可寫時只保存在記憶體）
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+import chardet
+
+INDEX_FILE = "description_index.json"
+INDEX_FORMAT = 1
+
+# 編碼偵測讀取的位元組數
+DETECT_BYTES = 64 * 1024
+# 檔名與表名的相似度高於此值才採用模糊比對的結果
+MATCH_THRESHOLD = 0.9
+
+
+class DescriptionIndex:
+    """
+    The table to description CSV mapping and the CSV encodings of one database_description directory.
+    """
+    # table_dir -> DescriptionIndex
+    _indexes: Dict[str, "DescriptionIndex"] = {}
+    _indexes_lock = Lock()
+
+    def __init__(self, table_dir: str):
+        self.table_dir = table_dir
+        self.path = Path(table_dir).parent / INDEX_FILE
+        self._lock = Lock()
+        self.listing = None
+        self.tables: Dict[str, str] = {}
+        # filename -> [mtime_ns, size, encoding]
+        self.encodings: Dict[str, list] = {}
+        self._load()
+
+    @classmethod
+    def get(cls, table_dir: str) -> "DescriptionIndex":
+        """Returns the shared index of table_dir."""
+        key = os.path.abspath(table_dir)
+        with cls._indexes_lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                index = cls._indexes[key] = cls(table_dir)
+            return index
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get("format") != INDEX_FORMAT:
+            return
+        self.listing = data.get("listing")
+        self.tables = data.get("tables", {})
+        self.encodings = data.get("encodings", {})
+
+    def _save(self):
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"format": INDEX_FORMAT, "listing": self.listing, "tables": self.tables,
+                           "encodings": self.encodings}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save description index {self.path}: {e}")
+
+    def csv_files(self, tables: Iterable[str], model) -> Dict[str, str]:
+        """
+        Returns the description CSV path of every table.
+
+        A table maps to the file whose name embedding is most similar to "<table>.csv" when the
+        similarity exceeds MATCH_THRESHOLD, and to "<table>.csv" otherwise. Mappings are reused
+        until the directory listing changes; only unmapped tables are encoded, in one batch.
+        """
+        tables = list(tables)
+        file_list = sorted(os.listdir(self.table_dir))
+        with self._lock:
+            changed = False
+            if self.listing != file_list:
+                self.listing, self.tables, changed = file_list, {}, True
+            missing = [table for table in tables if table not in self.tables]
+            if missing:
+                changed = True
+                if file_list:
+                    files_emb = model.encode(file_list, show_progress_bar=False)
+                    tables_emb = model.encode([table + '.csv' for table in missing], show_progress_bar=False)
+                    for table, files_sim in zip(missing, tables_emb @ files_emb.T):
+                        self.tables[table] = file_list[files_sim.argmax()] \
+                            if max(files_sim) > MATCH_THRESHOLD else table + '.csv'
+                else:
+                    self.tables.update((table, table + '.csv') for table in missing)
+            if changed:
+                self._save()
+            return {table: os.path.join(self.table_dir, self.tables[table]) for table in tables}
+
+    def encoding(self, file: str) -> Optional[str]:
+        """
+        Returns the detected encoding of file, from the first DETECT_BYTES bytes.
+
+        ascii results are reported as utf-8, since a prefix without multibyte characters says nothing
+        about the rest of the file.
+        """
+        stat = os.stat(file)
+        name = os.path.basename(file)
+        with self._lock:
+            cached = self.encodings.get(name)
+        if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached[2]
+        with open(file, 'rb') as f:
+            encoding = chardet.detect(f.read(DETECT_BYTES))['encoding']
+        if encoding is not None and encoding.lower() == 'ascii':
+            encoding = 'utf-8'
+        with self._lock:
+            self.encodings[name] = [stat.st_mtime_ns, stat.st_size, encoding]
+            self._save()
+        return encoding
+
+    def redetect(self, file: str) -> Optional[str]:
+        """Detects the encoding of file from its full content, for files the prefix guess could not decode."""
+        stat = os.stat(file)
+        with open(file, 'rb') as f:
+            encoding = chardet.detect(f.read())['encoding']
+        with self._lock:
+            self.encodings[os.path.basename(file)] = [stat.st_mtime_ns, stat.st_size, encoding]
+            self._save()
+        return encoding
+
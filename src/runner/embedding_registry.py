@@ -0,0 +1,162 @@
+"""
+Embedding 模型註冊表
+在同一個行程內共用 SentenceTransformer 模型，避免每個節點、每個任務重複從磁碟載入
+"""
+
+import os
+import time
+import logging
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sentence_transformers import SentenceTransformer
+
+
+def _resident_memory_mb() -> float:
+    """
+    Returns the current resident set size of this process in MB.
+
+    Reads /proc/self/statm when available and falls back to the peak RSS
+    reported by the resource module on other platforms.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 回傳 bytes，Linux 回傳 KB
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return 0.0
+
+
+class EmbeddingModelRegistry:
+    """
+    A process-wide, thread-safe registry of SentenceTransformer models keyed by (model name, device).
+
+    The first caller for a key loads the model; concurrent callers for the same key wait for that
+    load instead of loading a second copy, while loads for other keys proceed in parallel.
+    """
+    _models: Dict[Tuple[str, Optional[str]], Any] = {}
+    _stats: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+    _key_locks: Dict[Tuple[str, Optional[str]], Lock] = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, model_name: str, device: Optional[str] = None, **model_kwargs: Any) -> SentenceTransformer:
+        """
+        Returns the shared model for (model_name, device), loading it on first use.
+
+        Args:
+            model_name (str): Name or path of the SentenceTransformer model.
+            device (Optional[str]): Device to load the model on. None lets SentenceTransformer choose.
+            **model_kwargs: Extra arguments passed to SentenceTransformer on first load (e.g. cache_folder).
+
+        Returns:
+            SentenceTransformer: The shared model instance.
+        """
+        key = (str(model_name), device)
+        model = cls._models.get(key)
+        if model is not None:
+            cls._stats[key]["hits"] += 1
+            return model
+
+        with cls._lock:
+            key_lock = cls._key_locks.setdefault(key, Lock())
+
+        with key_lock:
+            model = cls._models.get(key)
+            if model is not None:
+                cls._stats[key]["hits"] += 1
+                return model
+
+            rss_before = _resident_memory_mb()
+            start = time.time()
+            model = SentenceTransformer(model_name, device=device, **model_kwargs)
+            load_time = time.time() - start
+            rss_after = _resident_memory_mb()
+
+            cls._stats[key] = {
+                "model_name": str(model_name),
+                "device": device,
+                "load_time": load_time,
+                "rss_delta_mb": rss_after - rss_before,
+                "rss_after_mb": rss_after,
+                "hits": 0,
+            }
+            cls._models[key] = model
+            logging.info(
+                f"Loaded embedding model {model_name} on {device or 'auto'} in {load_time:.2f}s "
+                f"(RSS {rss_before:.0f}MB -> {rss_after:.0f}MB)"
+            )
+            return model
+
+    @classmethod
+    def warm_up(cls, specs: Iterable[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """
+        Loads the given models ahead of time, typically at process start.
+
+        Args:
+            specs (Iterable[Tuple[str, Optional[str]]]): (model name, device) pairs to load.
+
+        Returns:
+            Dict: The registry statistics after warm-up.
+        """
+        for model_name, device in specs:
+            if model_name:
+                cls.get(model_name, device)
+        return cls.stats()
+
+    @classmethod
+    def stats(cls) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """
+        Returns load time, memory and hit statistics for every loaded model.
+        """
+        stats = {key: dict(value) for key, value in cls._stats.items()}
+        for value in stats.values():
+            value["rss_current_mb"] = _resident_memory_mb()
+        return stats
+
+    @classmethod
+    def clear(cls):
+        """Drops every cached model (mainly for tests and long-lived services reloading models)."""
+        with cls._lock:
+            cls._models.clear()
+            cls._stats.clear()
+            cls._key_locks.clear()
+
+
+def get_embedding_model(model_name: str, device: Optional[str] = None, **model_kwargs: Any) -> SentenceTransformer:
+    """
+    獲取共用的 SentenceTransformer 實例
+
+    Args:
+        model_name: 模型名稱或路徑
+        device: 載入裝置（None 表示自動選擇）
+
+    Returns:
+        SentenceTransformer 實例
+    """
+    return EmbeddingModelRegistry.get(model_name, device, **model_kwargs)
+
+
+def embedding_specs_from_setup(pipeline_setup: Dict[str, Any]) -> set:
+    """
+    Collects the (bert_model, device) pairs used by the nodes of a pipeline setup.
+
+    Args:
+        pipeline_setup (Dict[str, Any]): The parsed pipeline setup.
+
+    Returns:
+        set: The distinct (model name, device) pairs.
+    """
+    specs = set()
+    for node_setup in pipeline_setup.values():
+        if isinstance(node_setup, dict) and node_setup.get("bert_model"):
+            specs.add((node_setup["bert_model"], node_setup.get("device")))
+    return specs
@@ -2,7 +2,8 @@ import sqlite3
 import random
 import logging
 from typing import Any, Union, List, Dict
-from func_timeout import func_timeout, FunctionTimedOut
+from runner.sqlite_pool import QueryBudget, QueryTimeout, pooled_connection
+from runner.result_cache import execute_cached
 
 def _clean_sql(sql: str) -> str:
     """
@@ -16,7 +17,7 @@ def _clean_sql(sql: str) -> str:
     """
     return sql.replace('\n', ' ').replace('"', "'").strip("`.")
 
-def execute_sql(db_path: str, sql: str, fetch: Union[str, int] = "all") -> Any:
+def execute_sql(db_path: str, sql: str, fetch: Union[str, int] = "all", budget: QueryBudget = None) -> Any:
     """
     Executes an SQL query on a database and fetches results.
     
@@ -24,15 +25,17 @@ def execute_sql(db_path: str, sql: str, fetch: Union[str, int] = "all") -> Any:
         db_path (str): The path to the database file.
         sql (str): The SQL query to execute.
         fetch (Union[str, int]): How to fetch the results. Options are "all", "one", "random", or an integer.
+        budget (QueryBudget): Deadline / step budget of the query, shared with other queries if given.
         
     Returns:
         Any: The fetched results based on the fetch argument.
     
     Raises:
+        QueryTimeout: If the query exceeds the budget.
         Exception: If an error occurs during SQL execution.
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with pooled_connection(db_path, budget=budget) as conn:
             cursor = conn.cursor()
             cursor.execute(sql)
             if fetch == "all":
@@ -46,11 +49,13 @@ def execute_sql(db_path: str, sql: str, fetch: Union[str, int] = "all") -> Any:
                 return cursor.fetchmany(fetch)
             else:
                 raise ValueError("Invalid fetch argument. Must be 'all', 'one', 'random', or an integer.")
+    except QueryTimeout:
+        raise
     except Exception as e:
         logging.error(f"Error in execute_sql: {e}\nSQL: {sql}")
         raise e
 
-def _compare_sqls_outcomes(db_path: str, predicted_sql: str, ground_truth_sql: str) -> int:
+def _compare_sqls_outcomes(db_path: str, predicted_sql: str, ground_truth_sql: str, budget: QueryBudget = None) -> int:
     """
     Compares the outcomes of two SQL queries to check for equivalence.
     
@@ -58,6 +63,7 @@ def _compare_sqls_outcomes(db_path: str, predicted_sql: str, ground_truth_sql: s
         db_path (str): The path to the database file.
         predicted_sql (str): The predicted SQL query.
         ground_truth_sql (str): The ground truth SQL query.
+        budget (QueryBudget): Budget shared by both queries.
         
     Returns:
         int: 1 if the outcomes are equivalent, 0 otherwise.
@@ -66,9 +72,17 @@ def _compare_sqls_outcomes(db_path: str, predicted_sql: str, ground_truth_sql: s
         Exception: If an error occurs during SQL execution.
     """
     try:
-        predicted_res = execute_sql(db_path, predicted_sql)
-        ground_truth_res = execute_sql(db_path, ground_truth_sql)
-        return int(set(predicted_res) == set(ground_truth_res))
+        # 以結果快取中的 row-set fingerprint 比較，相同的 gold SQL 在不同問題間只執行一次
+        results = []
+        for sql in (predicted_sql, ground_truth_sql):
+            result = execute_cached(db_path, sql, budget)
+            if result.error is not None:
+                logging.error(f"Error in execute_sql: {result.error}\nSQL: {sql}")
+                raise sqlite3.OperationalError(result.error)
+            results.append(result)
+        return int(results[0].fingerprint == results[1].fingerprint)
+    except QueryTimeout:
+        raise
     except Exception as e:
         logging.critical(f"Error comparing SQL outcomes: {e}")
         raise e
@@ -88,10 +102,10 @@ def compare_sqls(db_path: str, predicted_sql: str, ground_truth_sql: str, meta_t
     """
     # predicted_sql = _clean_sql(predicted_sql)
     try:
-        res = func_timeout(meta_time_out, _compare_sqls_outcomes, args=(db_path, predicted_sql, ground_truth_sql))
+        res = _compare_sqls_outcomes(db_path, predicted_sql, ground_truth_sql, QueryBudget(meta_time_out))
         error = "incorrect answer" if res == 0 else "--"
-    except FunctionTimedOut:
-        logging.warning("Comparison timed out.")
+    except QueryTimeout as e:
+        logging.warning(f"Comparison timed out: {e}")
         error = "timeout"
         res = 0
     except Exception as e:
@@ -1,37 +1,145 @@
-import re, json
+import re, json, time
 from sklearn.metrics.pairwise import euclidean_distances
 import numpy as np
+from database_process.value_store import ValueEmbeddings
+from database_process.lexical_index import LexicalStats
 
 class DES:
 
-    def __init__(self, bert_model, DB_emb, col_values) -> None:
+    def __init__(self, bert_model, DB_emb, col_values, index=None, probe=None, lexical=None,
+                 lexical_candidates=32) -> None:
         self.model = bert_model
         self.DB_emb = DB_emb
         self.col_values = col_values
+        # 近似最近鄰索引（見 database_process.value_index），None 表示精確搜尋
+        self.index = index
+        self.probe = probe
+        # 字面索引（見 database_process.lexical_index），None 表示不做字面預篩
+        self.lexical = lexical
+        self.lexical_candidates = lexical_candidates
+        self._values = None
+        self._examples = {}
 
-    def get_examples(self, target, topk=3):
-        target_embedding = self.model.encode(target,
-                                             show_progress_bar=False,
-                                            )
+    def _value_matrix(self):
+        """
+        Returns the value embeddings as one matrix with the start row and key of every column,
+        in DB_emb order, built once per DES.
+        """
+        if self._values is None:
+            emb = self.DB_emb if isinstance(self.DB_emb, ValueEmbeddings) else ValueEmbeddings.from_dict(self.DB_emb)
+            starts = np.array([start for _, start, _ in emb.columns], dtype=np.int64)
+            keys = [key for key, _, _ in emb.columns]
+            self._values = (emb.search_matrix(), starts, keys)
+        return self._values
+
+    def get_examples_batch(self, targets, topk=3):
+        """
+        Returns the topk closest column values of every target in one batched search.
+
+        The ranking matches the former per-column loop: ascending euclidean distance, ties broken
+        by column order in DB_emb and then by value index. With a lexical index, targets that equal
+        at least topk stored values are answered without encoding (distance 0); targets with fewer
+        exact matches keep them first and fill the rest of the topk from the embedding search, and
+        targets with enough similar-looking values are only compared against those.
+
+        Returns:
+            List[List[Tuple[float, int, str]]]: (distance, value index, column key) per target.
+        """
+        matrix, starts, keys = self._value_matrix()
+        if len(matrix) == 0 or len(targets) == 0:
+            return [[] for _ in targets]
+        k = min(topk, matrix.shape[0])
+
+        def to_examples(distances, rows):
+            columns = np.searchsorted(starts, rows, side="right") - 1
+            return [(float(distance), int(row - starts[col]), keys[col])
+                    for distance, row, col in zip(distances, rows, columns)]
+
+        results = [None] * len(targets)
+        narrowed = {}
+        # 完全相同的值不足 k 個的目標: i -> 這些值，其餘由 embedding 搜尋補足
+        partial = {}
+        if self.lexical is not None:
+            for i, target in enumerate(targets):
+                start = time.perf_counter()
+                rows = self.lexical.exact_rows(target)
+                if len(rows):
+                    examples = to_examples(np.zeros(len(rows)), rows)
+                    # 大小寫也相同的值排在前面，其餘依原本的欄位 / 值順序
+                    examples.sort(key=lambda x: self.col_values[x[2]][x[1]].strip() != target.strip())
+                    if len(examples) >= k:
+                        results[i] = examples[:k]
+                        LexicalStats.record("exact", time.perf_counter() - start)
+                        continue
+                    partial[i] = examples
+                rows = self.lexical.candidate_rows(target, max_candidates=self.lexical_candidates)
+                if len(rows) >= self.lexical_candidates:
+                    narrowed[i] = np.sort(rows)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        # 多取 partial 的列數，扣掉與完全相同的值重複的結果後仍有 k 個
+        k_search = min(k + max((len(examples) for examples in partial.values()), default=0), matrix.shape[0])
+        start = time.perf_counter()
+        target_embedding = self.model.encode([targets[i] for i in pending], show_progress_bar=False)
+        encode_seconds = (time.perf_counter() - start) / len(pending)
+
+        full = []
+        for position, i in enumerate(pending):
+            if i in narrowed:
+                start = time.perf_counter()
+                rows = narrowed[i]
+                distances = euclidean_distances(target_embedding[position:position + 1], matrix[rows])[0]
+                order = np.lexsort((rows, distances))[:k_search]
+                results[i] = to_examples(distances[order], rows[order])
+                LexicalStats.record("narrowed", encode_seconds + time.perf_counter() - start)
+            else:
+                full.append(position)
+        if not full:
+            return self._fill_partial(results, partial, k)
 
-        # find the most similar question in train dataset
-        all_pair = []
-        for key in self.DB_emb:
-            embs = self.DB_emb[key]
+        start = time.perf_counter()
+        full_embedding = target_embedding[full]
+        if self.index is not None:
+            hits = [to_examples(distances, rows)
+                    for distances, rows in self.index.search(full_embedding, k_search, self.probe)]
+        else:
+            hits = []
+            for row_distances in euclidean_distances(full_embedding, matrix):
+                # argpartition 找出第 k 小的距離，再納入所有不大於它的列，保證同分時的順序與逐欄排序一致
+                kth = row_distances[np.argpartition(row_distances, k_search - 1)[k_search - 1]]
+                candidates = np.flatnonzero(row_distances <= kth)
+                order = candidates[np.lexsort((candidates, row_distances[candidates]))][:k_search]
+                hits.append(to_examples(row_distances[order], order))
+        if self.lexical is not None:
+            LexicalStats.record("full", encode_seconds * len(full) + time.perf_counter() - start, len(full))
+        for position, examples in zip(full, hits):
+            results[pending[position]] = examples
+        return self._fill_partial(results, partial, k)
 
-            distances = np.squeeze(euclidean_distances(target_embedding,
-                                                       embs)).tolist()
-            distances = [distances] if np.isscalar(distances) else distances
-            pairs = [
-                (distance, index, key)
-                for distance, index in zip(distances, range(len(distances)))
-            ]
+    @staticmethod
+    def _fill_partial(results, partial, k):
+        """Puts the exact matches of partial first and keeps the topk of every searched target."""
+        for i, examples in enumerate(results):
+            if i in partial:
+                exact = partial[i]
+                seen = {(key, index) for _, index, key in exact}
+                examples = exact + [x for x in examples if (x[2], x[1]) not in seen]
+            results[i] = examples[:k]
+        return results
 
-            pairs_sorted = sorted(pairs, key=lambda x: x[0])
+    def prefetch_examples(self, targets, topk=3):
+        """Searches every distinct target at once and keeps the results for get_examples."""
+        pending = list(dict.fromkeys(t for t in targets if t and (t, topk) not in self._examples))
+        for target, examples in zip(pending, self.get_examples_batch(pending, topk)):
+            self._examples[(target, topk)] = examples
 
-            all_pair.extend(pairs_sorted[:topk])
-            all_pair.sort(key=lambda x: x[0])
-        return all_pair[:topk]
+    def get_examples(self, target, topk=3):
+        if len(target) == 1 and (target[0], topk) in self._examples:
+            return self._examples[(target[0], topk)]
+        examples = self.get_examples_batch(target, topk)
+        return examples[0] if examples else []
 
     def get_key_col_des_single(self, value, topk, debug, des, value_cols,
                                shold, match_filter):
@@ -73,13 +181,27 @@ class DES:
 
 class DES_new(DES):
 
-    def __init__(self, bert_model, DB_emb, col_values) -> None:
-        super().__init__(bert_model, DB_emb, col_values)
+    def __init__(self, bert_model, DB_emb, col_values, index=None, probe=None, lexical=None,
+                 lexical_candidates=32) -> None:
+        super().__init__(bert_model, DB_emb, col_values, index, probe, lexical, lexical_candidates)
         self.jump_l = {
             "how", "not", "what", "who", "which", "refer", "from", "with",
             "was", "were", "the", "and", "have", "many", "much", "list", "did"
         }
 
+    def collect_targets(self, values):
+        """Returns every string get_key_col_des will search for, so they can be encoded in one batch."""
+        targets = []
+        for value in values:
+            value = value.strip(" '\"")
+            if len(value) == 0 or re.fullmatch("\d+\.?\d*", value):
+                continue
+            targets.append(value)
+            value_split = value.split(' ')
+            if len(value_split) > 1:
+                targets.extend(val.strip() for val in value_split if val != '')
+        return targets
+
     def get_key_col_des(self,
                         cols,
                         values,
@@ -89,6 +211,7 @@ class DES_new(DES):
                         match_filter=0.3):
         des = []
         value_cols = []
+        self.prefetch_examples(self.collect_targets(values), topk)
         for value in values:
             value = value.strip(" '\"")
             if len(value) == 0 or re.fullmatch("\d+\.?\d*", value):
@@ -3,10 +3,10 @@ Few-shot 檢索器
 根據問題相似度選擇最合適的 few-shot 範例
 """
 
-import json
 import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from runner.embedding_registry import get_embedding_model
+from runner.fewshot_store import FewshotStore
 from typing import List, Tuple
 import logging
 
@@ -23,17 +23,18 @@ class FewshotRetriever:
             model_name: Sentence Transformer 模型名稱
         """
         self.fewshot_path = Path(fewshot_path)
-        self.model = SentenceTransformer(model_name)
+        self.model = get_embedding_model(model_name)
         self.fewshot_data = None
+        self.fewshot_version = None
         self.question_embeddings = None
         
         self._load_fewshot()
         self._compute_embeddings()
     
     def _load_fewshot(self):
-        """載入 fewshot 資料"""
-        with open(self.fewshot_path, 'r', encoding='utf-8') as f:
-            self.fewshot_data = json.load(f)
+        """載入 fewshot 資料（由 FewshotStore 共用解析結果）"""
+        self.fewshot_data = FewshotStore.get(self.fewshot_path)
+        self.fewshot_version = FewshotStore.version(self.fewshot_path)
         
         logging.info(f"Loaded {len(self.fewshot_data.get('questions', []))} few-shot examples")
     
@@ -59,6 +60,12 @@ class FewshotRetriever:
         
         logging.info(f"Computed embeddings shape: {self.question_embeddings.shape}")
     
+    def _refresh_if_changed(self):
+        """fewshot 檔案內容改變時重新載入並重算 embeddings"""
+        if FewshotStore.version(self.fewshot_path) != self.fewshot_version:
+            self._load_fewshot()
+            self._compute_embeddings()
+    
     def retrieve_top_k(self, query: str, k: int = 1) -> List[Tuple[int, float]]:
         """
         檢索最相似的 k 個 few-shot 範例
@@ -70,6 +77,8 @@ class FewshotRetriever:
         Returns:
             List of (question_id, similarity_score)
         """
+        self._refresh_if_changed()
+        
         if self.question_embeddings.size == 0:
             logging.warning("No embeddings available, returning default question_id=0")
             return [(0, 0.0)]
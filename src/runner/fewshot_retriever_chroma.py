@@ -3,11 +3,12 @@ Few-shot 檢索器 (ChromaDB 版本)
 使用 ChromaDB 進行持久化和高效檢索
 """
 
-import json
 import logging
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict, Any
 
+from runner.fewshot_store import FewshotStore
+
 try:
     import chromadb
     from chromadb.config import Settings
@@ -111,8 +112,7 @@ class FewshotRetrieverChroma:
         )
         
         # 載入 few-shot 資料
-        with open(self.fewshot_path, 'r', encoding='utf-8') as f:
-            fewshot_data = json.load(f)
+        fewshot_data = FewshotStore.get(self.fewshot_path)
         
         questions = fewshot_data.get('questions', [])
         
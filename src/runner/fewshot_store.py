@@ -0,0 +1,96 @@
+"""
+Few-shot 檔案快取
+在同一個行程內只解析一次 fewshot JSON（questions.json、correct_fewshot2.json），
+檔案的 mtime / 大小改變且內容雜湊不同時才重新載入
+"""
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Tuple, Union
+
+
+class FewshotStore:
+    """
+    A process-wide, thread-safe cache of parsed few-shot JSON files.
+
+    Every lookup stats the file. When (mtime, size) changed, the file is read and hashed, and it is
+    only parsed again if the hash differs. The returned data is shared and must be treated as
+    read-only.
+    """
+    # path -> {"signature": (mtime_ns, size), "hash": str, "data": Any, "version": int}
+    _entries: Dict[str, Dict[str, Any]] = {}
+    _lock = Lock()
+
+    @staticmethod
+    def _signature(path: Path) -> Tuple[int, int]:
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def _entry(cls, path: Union[str, Path]) -> Dict[str, Any]:
+        path = Path(path)
+        key = str(path.resolve())
+        signature = cls._signature(path)
+        entry = cls._entries.get(key)
+        if entry is not None and entry["signature"] == signature:
+            return entry
+
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None and entry["signature"] == signature:
+                return entry
+            raw = path.read_bytes()
+            digest = hashlib.sha1(raw).hexdigest()
+            if entry is not None and entry["hash"] == digest:
+                # 只有 mtime 改變（例如 touch 或重新寫入相同內容）
+                entry = dict(entry, signature=signature)
+            else:
+                entry = {
+                    "signature": signature,
+                    "hash": digest,
+                    "data": json.loads(raw.decode("utf-8")),
+                    "version": (entry["version"] + 1) if entry is not None else 1,
+                }
+                logging.info(f"Loaded few-shot file {path} (version {entry['version']})")
+            cls._entries[key] = entry
+            return entry
+
+    @classmethod
+    def get(cls, path: Union[str, Path]) -> Any:
+        """
+        Returns the parsed content of the JSON file at path, reloading it only when it changed.
+
+        Args:
+            path (Union[str, Path]): Path of the few-shot JSON file.
+
+        Returns:
+            Any: The parsed JSON (shared, read-only).
+        """
+        return cls._entry(path)["data"]
+
+    @classmethod
+    def version(cls, path: Union[str, Path]) -> int:
+        """Returns a counter increased every time the content of path changes."""
+        return cls._entry(path)["version"]
+
+    @classmethod
+    def clear(cls):
+        """Drops every cached file."""
+        with cls._lock:
+            cls._entries.clear()
+
+
+def load_fewshot(path: Union[str, Path]) -> Any:
+    """
+    獲取解析後的 fewshot JSON（同一行程內共用）
+
+    Args:
+        path: fewshot 檔案路徑
+
+    Returns:
+        解析後的 JSON 內容（請勿修改）
+    """
+    return FewshotStore.get(path)
@@ -1,16 +1,21 @@
 import logging
 import json
 from threading import Lock
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Any, List, Dict, Union
 
 class Logger:
-    _instance = None
     _lock = Lock()
+    _current: ContextVar = ContextVar("current_logger", default=None)
 
     def __new__(cls, db_id: str = None, question_id: str = None, result_directory: str = None):
         """
-        Ensures a singleton instance of Logger.
+        Ensures a singleton instance of Logger per task context.
+
+        The instance created with a db_id and question_id becomes the current logger of the calling
+        thread or asyncio task, so tasks running concurrently log to their own files. Threads started
+        inside a task must be submitted with contextvars.copy_context().run to inherit it.
 
         Args:
             db_id (str, optional): The database ID.
@@ -21,16 +26,19 @@ class Logger:
             Logger: The singleton instance of the class.
 
         Raises:
-            ValueError: If the Logger instance has not been initialized.
+            ValueError: If no Logger is bound to the calling thread or task.
         """
         with cls._lock:
             if (db_id is not None) and (question_id is not None):
-                cls._instance = super(Logger, cls).__new__(cls)
-                cls._instance._init(db_id, question_id, result_directory)
-            else:
-                if cls._instance is None:
-                    raise ValueError("Logger instance has not been initialized.")
-            return cls._instance
+                instance = super(Logger, cls).__new__(cls)
+                instance._init(db_id, question_id, result_directory)
+                cls._current.set(instance)
+                return instance
+            instance = cls._current.get()
+            if instance is None:
+                raise ValueError("No Logger is bound to the calling thread or task; threads must be "
+                                 "submitted with contextvars.copy_context().run.")
+            return instance
 
     def _init(self, db_id: str, question_id: str, result_directory: str):
         """
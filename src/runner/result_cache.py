@@ -0,0 +1,326 @@
+"""
+SQL 執行結果快取
+以 (資料庫檔案, 檔案 mtime / 大小, 正規化後的 SQL) 為 key，保存執行結果的 row-set fingerprint、
+列數、執行時間與錯誤訊息，同一行程內的候選 SQL 修正、投票與評估共用:
+    - 空白差異、結尾分號不同的相同 SQL 視為同一個查詢
+    - 多個執行緒同時執行相同的查詢時只執行一次，其他執行緒等待結果
+    - 只保存 fingerprint、列數與預覽而不保存完整結果，以記憶體用量為上限的 LRU
+    - 逾時（QueryTimeout）不會被快取，錯誤則會（相同 SQL 在相同資料庫上結果固定）
+
+投票使用串流模式（fingerprint）: 以 fetchmany 分批讀取結果，只計算與順序無關的 multiset hash
+與列數並保留前幾列做為預覽，不論結果多大，記憶體與寫入執行紀錄的內容都有上限
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from config import config
+from runner.sqlite_pool import QueryBudget, QueryTimeout, pooled_connection
+
+# 每筆快取項目的固定開銷估計（位元組）
+ENTRY_OVERHEAD = 256
+ROW_OVERHEAD = 64
+# 串流模式每次 fetchmany 的列數與保留的預覽列數
+STREAM_FETCH_SIZE = 1000
+PREVIEW_ROWS = 5
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Returns sql with whitespace outside string literals and quoted identifiers collapsed and
+    trailing semicolons removed; literal contents and letter case are kept.
+    """
+    out = []
+    quote = None
+    pending_space = False
+    for ch in sql.strip().rstrip(";").strip():
+        if quote is not None:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch.isspace():
+            pending_space = True
+            continue
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        if ch in "'\"`":
+            quote = ch
+        elif ch == "[":
+            quote = "]"
+        out.append(ch)
+    return "".join(out)
+
+
+def _canonical(value: Any) -> Any:
+    # 1 與 1.0 在 set 比較中相等，fingerprint 也要相同
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _row_bytes(row: tuple) -> bytes:
+    return repr(tuple(_canonical(value) for value in row)).encode("utf-8", "backslashreplace")
+
+
+def _row_digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _digest_sum(digests: Iterable[bytes]) -> str:
+    total = sum(int.from_bytes(digest, "big") for digest in digests) % (1 << 128)
+    return f"{total:032x}"
+
+
+def row_set_fingerprint(rows: Iterable[tuple]) -> Tuple[str, int]:
+    """
+    Returns an order-independent fingerprint of the set of rows, so two results have the same
+    fingerprint exactly when set(rows) are equal (up to hash collisions). Only the row digests
+    are kept, so rows may be streamed from a cursor.
+
+    Returns:
+        Tuple[str, int]: (fingerprint, distinct row count).
+    """
+    digests = set(_row_digest(_row_bytes(row)) for row in rows)
+    return _digest_sum(digests), len(digests)
+
+
+def multiset_fingerprint(rows: Iterable[tuple]) -> Tuple[str, int]:
+    """
+    Returns the multiset hash of rows computed by stream_fingerprint, for rows already in memory.
+
+    Returns:
+        Tuple[str, int]: (multiset hash, row count).
+    """
+    total = 0
+    count = 0
+    for row in rows:
+        total += int.from_bytes(_row_digest(_row_bytes(row)), "big")
+        count += 1
+    return f"{total % (1 << 128):032x}", count
+
+
+def stream_fingerprint(cursor, preview_rows: int = PREVIEW_ROWS,
+                       fetch_size: int = STREAM_FETCH_SIZE) -> Tuple[str, int, List[tuple]]:
+    """
+    Consumes an executed cursor with fetchmany and returns an order-independent multiset hash of
+    its rows, without keeping the rows: the hash is the sum of the row digests modulo 2**128, so
+    two results have the same hash exactly when they hold the same rows the same number of times
+    (up to hash collisions).
+
+    Returns:
+        Tuple[str, int, List[tuple]]: (multiset hash, row count, the first preview_rows rows).
+    """
+    total = 0
+    count = 0
+    preview = []
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            total += int.from_bytes(_row_digest(_row_bytes(row)), "big")
+        if len(preview) < preview_rows:
+            preview.extend(rows[:preview_rows - len(preview)])
+        count += len(rows)
+    return f"{total % (1 << 128):032x}", count, preview
+
+
+class ExecutionResult(NamedTuple):
+    """The cached outcome of one SQL execution."""
+    fingerprint: Optional[str]
+    row_count: int
+    elapsed: float
+    error: Optional[str] = None
+    # 串流模式保留的前幾列
+    preview: Optional[List[tuple]] = None
+
+    def answer(self) -> Optional[Dict[str, Any]]:
+        """The bounded, JSON-serializable summary of a streamed result kept in vote entries; None on error."""
+        if self.error is not None:
+            return None
+        return {"fingerprint": self.fingerprint, "row_count": self.row_count, "preview": self.preview}
+
+
+class ResultCache:
+    """
+    A thread-safe LRU of ExecutionResult bounded by the estimated memory of the entries.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes (int): Memory budget of the cache.
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[ExecutionResult, int]]" = OrderedDict()
+        self._inflight: Dict[Tuple, threading.Event] = {}
+        self._lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def make_key(db_path: Union[str, Path], sql: str) -> Tuple:
+        stat = os.stat(db_path)
+        return os.path.abspath(db_path), stat.st_mtime_ns, stat.st_size, normalize_sql(sql)
+
+    def _get(self, key: Tuple) -> Optional[ExecutionResult]:
+        """Must hold self._lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry[0].elapsed
+        return entry[0]
+
+    def _put(self, key: Tuple, result: ExecutionResult, size: int):
+        """Must hold self._lock."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (result, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    def _lookup_or_run(self, key: Tuple, run: Callable[[], Tuple[ExecutionResult, int]],
+                       budget: Optional[QueryBudget] = None) -> ExecutionResult:
+        """
+        Returns the cached result of key, or runs it once while concurrent callers wait.
+
+        Raises:
+            QueryTimeout: When budget runs out while waiting for another caller's run of key.
+        """
+        while True:
+            with self._lock:
+                result = self._get(key)
+                if result is not None:
+                    return result
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # 相同查詢正在其他執行緒執行（可能有更長的期限），只等到自己的期限為止
+            if not event.wait(budget.remaining() if budget is not None else None):
+                raise budget.expire()
+
+        try:
+            result, size = run()
+            with self._lock:
+                self._put(key, result, size)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def execute(self, db_path: Union[str, Path], sql: str, budget: Optional[QueryBudget] = None) -> ExecutionResult:
+        """
+        Returns the result of sql on db_path, executing it only when it is not cached:
+        fingerprint is the row-set fingerprint and row_count the number of distinct rows.
+
+        Args:
+            db_path (Union[str, Path]): Path of the database file.
+            sql (str): The SQL query.
+            budget (Optional[QueryBudget]): Budget of the execution on a cache miss.
+
+        Raises:
+            QueryTimeout: When the execution exceeds budget (the timeout is not cached).
+        """
+        def run():
+            start = time.perf_counter()
+            try:
+                with pooled_connection(db_path, budget=budget) as conn:
+                    fingerprint, row_count = row_set_fingerprint(conn.execute(sql))
+            except QueryTimeout:
+                raise
+            except Exception as e:
+                return ExecutionResult(None, 0, time.perf_counter() - start, str(e)), ENTRY_OVERHEAD
+            return ExecutionResult(fingerprint, row_count, time.perf_counter() - start), ENTRY_OVERHEAD
+
+        return self._lookup_or_run(self.make_key(db_path, sql), run, budget)
+
+    def fingerprint(self, db_path: Union[str, Path], sql: str,
+                    budget: Optional[QueryBudget] = None) -> ExecutionResult:
+        """
+        Returns the streamed result of sql on db_path: fingerprint is the multiset hash of the rows,
+        row_count counts duplicate rows, and only the first PREVIEW_ROWS rows are kept.
+
+        Raises:
+            QueryTimeout: When the execution exceeds budget (the timeout is not cached).
+        """
+        def run():
+            start = time.perf_counter()
+            try:
+                with pooled_connection(db_path, budget=budget) as conn:
+                    digest, row_count, preview = stream_fingerprint(conn.execute(sql))
+            except QueryTimeout:
+                raise
+            except Exception as e:
+                return ExecutionResult(None, 0, time.perf_counter() - start, str(e)), ENTRY_OVERHEAD
+            size = ENTRY_OVERHEAD + sum(len(_row_bytes(row)) + ROW_OVERHEAD for row in preview)
+            return ExecutionResult(digest, row_count, time.perf_counter() - start, None, preview), size
+
+        # 與 execute 的 set fingerprint 語意不同，使用不同的 key
+        return self._lookup_or_run(("multiset",) + self.make_key(db_path, sql), run, budget)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """獲取行程共用的 SQL 執行結果快取"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(config.RESULT_CACHE_MAX_MB * 1024 * 1024)
+        return _result_cache
+
+
+def execute_cached(db_path: Union[str, Path], sql: str, budget: Optional[QueryBudget] = None) -> ExecutionResult:
+    """
+    執行 SQL 並快取結果（見 ResultCache.execute）
+
+    Args:
+        db_path: 資料庫檔案路徑
+        sql: SQL 查詢
+        budget: 未命中時執行的期限
+    """
+    return get_result_cache().execute(db_path, sql, budget)
+
+
+def fingerprint_cached(db_path: Union[str, Path], sql: str, budget: Optional[QueryBudget] = None) -> ExecutionResult:
+    """
+    以串流模式執行 SQL 並快取結果（見 ResultCache.fingerprint），只保留 multiset hash、列數與預覽
+
+    Args:
+        db_path: 資料庫檔案路徑
+        sql: SQL 查詢
+        budget: 未命中時執行的期限
+    """
+    return get_result_cache().fingerprint(db_path, sql, budget)
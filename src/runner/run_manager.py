@@ -1,28 +1,77 @@
 import os
 import json
+import math
+import queue
+import asyncio
+import logging
+import multiprocessing
 from pathlib import Path
-from multiprocessing import Pool
-from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
 
 from runner.logger import Logger
 from runner.task import Task
 from runner.database_manager import DatabaseManager
 from runner.statistics_manager import StatisticsManager
-from pipeline.workflow_builder import build_pipeline
+from runner.embedding_registry import EmbeddingModelRegistry, embedding_specs_from_setup
+from pipeline.workflow_builder import get_pipeline
 from pipeline.pipeline_manager import PipelineManager
+from llm.model import close_async_http_client
+from llm.cache import get_llm_cache, llm_cache_in_use
+from llm.rate_limiter import rate_limiter_stats
+from database_process.lexical_index import LexicalStats
+from runner.result_cache import get_result_cache
+
+# 每個 worker process 各自持有一個 RunManager（在 initializer 中建立）
+_process_run_manager = None
+
+
+def _init_worker_process(args: Any, result_directory: str):
+    """Initializer of the process pool: builds the per-process RunManager."""
+    global _process_run_manager
+    _process_run_manager = RunManager(args, result_directory=result_directory)
+
+
+def _run_task_chunk_in_process(tasks: List[Task], result_queue: Any) -> Dict[str, Dict[str, int]]:
+    """
+    Runs a chunk of tasks inside a pool process, streaming each result to the queue.
+
+    Returns:
+        Dict[str, Dict[str, int]]: The LLM cache hits and misses of this chunk, merged by the parent.
+    """
+    _process_run_manager.run_task_chunk(tasks, result_queue)
+    return get_llm_cache().take_stats() if llm_cache_in_use() else {}
 
-NUM_WORKERS = 3   
 
 class RunManager:
     RESULT_ROOT_PATH = "results"
 
-    def __init__(self, args: Any):
+    def __init__(self, args: Any, result_directory: Optional[str] = None):
+        """
+        Args:
+            args (Any): The run arguments.
+            result_directory (Optional[str]): Existing result directory to reuse. Pool workers pass the
+                directory of the parent run instead of creating a new one.
+        """
         self.args = args
-        self.result_directory = self.get_result_directory()
+        self.result_directory = result_directory or self.get_result_directory()
         self.statistics_manager = StatisticsManager(self.result_directory)
         self.tasks: List[Task] = []
         self.total_number_of_tasks = 0
         self.processed_tasks = 0
+        self.warm_up_models()
+        self.app = get_pipeline(self.args.pipeline_nodes)
+        self.last_node_key = self.get_last_node_key(self.app)
+        PipelineManager(json.loads(self.args.pipeline_setup))
+
+    def warm_up_models(self):
+        """
+        Loads every embedding model referenced by the pipeline setup once, before any task runs.
+        """
+        specs = embedding_specs_from_setup(json.loads(self.args.pipeline_setup))
+        for (model_name, device), stats in EmbeddingModelRegistry.warm_up(specs).items():
+            print(f"Embedding model {model_name} ({device}): loaded in {stats['load_time']:.2f}s, "
+                  f"RSS +{stats['rss_delta_mb']:.0f}MB (now {stats['rss_current_mb']:.0f}MB)")
 
     def get_result_directory(self) -> str:
         """
@@ -68,15 +117,163 @@ class RunManager:
         print(f"Total number of tasks: {self.total_number_of_tasks}")
 
     def run_tasks(self):
-        """Runs the tasks using a pool of workers."""
-        # with Pool(NUM_WORKERS) as pool:
-        #     for task in self.tasks:
-        #         pool.apply_async(self.worker, args=(task,), callback=self.task_done)
-        #     pool.close()
-        #     pool.join()
+        """
+        Runs the tasks, sequentially or with a pool of workers when --workers is greater than 1.
+
+        Tasks are grouped by db_id so each worker keeps its database and embeddings warm, and
+        every result is handed to task_done as soon as it completes.
+        """
+        workers = getattr(self.args, "workers", 1) or 1
+        if workers <= 1:
+            for task in self.tasks:
+                ans = self.worker(task)
+                self.task_done(ans)
+        else:
+            chunks = self.group_tasks_by_db(workers)
+            pool = getattr(self.args, "pool", "thread")
+            if pool == "process":
+                self.run_tasks_in_processes(chunks, workers)
+            elif pool == "async":
+                asyncio.run(self.run_tasks_async(chunks, workers))
+            else:
+                self.run_tasks_in_threads(chunks, workers)
+        self.report_llm_stats()
+
+    def report_llm_stats(self):
+        """
+        Prints the LLM response cache hit rate per node, the rate limiter waits per endpoint, the SQL
+        result cache hit rate and the lexical pre-filter hit rate of value lookups.
+        """
+        if llm_cache_in_use():
+            for node, stats in get_llm_cache().stats().items():
+                print(f"LLM cache [{node}]: {stats['hits']} hits, {stats['misses']} misses "
+                      f"(hit rate {stats['hit_rate']:.1%})")
+        for stats in rate_limiter_stats():
+            print(f"LLM rate limiter [{stats['endpoint']}]: {stats['requests']} requests, "
+                  f"avg wait {stats['avg_wait']:.2f}s, max wait {stats['max_wait']:.2f}s")
+        results = get_result_cache().stats()
+        if results["hits"] + results["misses"]:
+            print(f"SQL result cache: {results['hits']} hits, {results['misses']} misses "
+                  f"(hit rate {results['hit_rate']:.1%}), ~{results['saved_seconds']:.1f}s of execution saved")
+        lexical = LexicalStats.stats()
+        if lexical["lookups"]:
+            print(f"Value lookups: {lexical['lookups']} ({lexical['exact_hits']} exact, {lexical['narrowed']} narrowed, "
+                  f"{lexical['full_searches']} full), lexical hit rate {lexical['hit_rate']:.1%}, "
+                  f"avg {lexical['avg_exact_ms']:.2f}/{lexical['avg_narrowed_ms']:.2f}/{lexical['avg_full_ms']:.2f} ms, "
+                  f"~{lexical['saved_seconds']:.1f}s saved")
+
+    def group_tasks_by_db(self, workers: int) -> List[List[Task]]:
+        """
+        Splits the tasks into chunks that each contain a single db_id.
+
+        Databases with more tasks than a fair share per worker are split so that every worker
+        has something to do.
+
+        Args:
+            workers (int): The number of workers.
+
+        Returns:
+            List[List[Task]]: The task chunks, largest databases first.
+        """
+        groups: Dict[str, List[Task]] = {}
         for task in self.tasks:
-            ans=self.worker(task)
-            self.task_done(ans)
+            groups.setdefault(task.db_id, []).append(task)
+        chunk_size = max(1, math.ceil(len(self.tasks) / workers))
+        chunks = []
+        for db_tasks in sorted(groups.values(), key=len, reverse=True):
+            for i in range(0, len(db_tasks), chunk_size):
+                chunks.append(db_tasks[i:i + chunk_size])
+        return chunks
+
+    def run_task_chunk(self, tasks: List[Task], result_queue: Any):
+        """
+        Processes a chunk of tasks one by one and puts each result on the queue.
+
+        Args:
+            tasks (List[Task]): Tasks sharing the same db_id.
+            result_queue (Any): Queue receiving (state, db_id, question_id) tuples.
+        """
+        try:
+            for task in tasks:
+                try:
+                    result = self.worker(task)
+                except Exception as e:
+                    logging.error(f"Error processing task: {task.db_id} {task.question_id}\n{type(e)}: {e}")
+                    result = (None, task.db_id, task.question_id)
+                result_queue.put(result)
+        finally:
+            DatabaseManager.release()
+
+    def run_tasks_in_threads(self, chunks: List[List[Task]], workers: int):
+        """Runs the task chunks on a thread pool."""
+        result_queue = queue.Queue()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.run_task_chunk, chunk, result_queue) for chunk in chunks]
+            self.collect_results(result_queue, futures)
+
+    def run_tasks_in_processes(self, chunks: List[List[Task]], workers: int):
+        """
+        Runs the task chunks on a process pool, each process holding its own RunManager.
+
+        Workers are spawned rather than forked: the parent has already loaded the embedding models
+        (possibly on CUDA), which a forked child cannot use.
+        """
+        with multiprocessing.Manager() as manager:
+            result_queue = manager.Queue()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker_process,
+                                     initargs=(self.args, self.result_directory)) as executor:
+                futures = [executor.submit(_run_task_chunk_in_process, chunk, result_queue) for chunk in chunks]
+                self.collect_results(result_queue, futures)
+                cache_stats = [future.result() for future in futures]
+        if any(cache_stats):
+            cache = get_llm_cache()
+            for stats in cache_stats:
+                cache.merge_stats(stats)
+
+    async def run_tasks_async(self, chunks: List[List[Task]], workers: int):
+        """
+        Runs the tasks on one event loop with app.astream, keeping up to workers tasks in flight.
+
+        Async nodes await their LLM calls instead of holding a thread, so the number of questions in
+        flight is bounded by workers and the provider limits rather than by the thread count.
+        """
+        semaphore = asyncio.Semaphore(workers)
+
+        async def run_one(task: Task):
+            async with semaphore:
+                try:
+                    return await self.aworker(task)
+                except Exception as e:
+                    logging.error(f"Error processing task: {task.db_id} {task.question_id}\n{type(e)}: {e}")
+                    return None, task.db_id, task.question_id
+
+        try:
+            for future in asyncio.as_completed([run_one(task) for chunk in chunks for task in chunk]):
+                self.task_done(await future)
+        finally:
+            await close_async_http_client()
+
+    def collect_results(self, result_queue: Any, futures: List[Any]):
+        """
+        Streams results from the queue to task_done until every task has reported.
+
+        Raises:
+            RuntimeError: If a worker died before reporting all of its tasks.
+        """
+        received = 0
+        while received < self.total_number_of_tasks:
+            try:
+                log = result_queue.get(timeout=1)
+            except queue.Empty:
+                if all(future.done() for future in futures) and result_queue.empty():
+                    for future in futures:
+                        future.result()  # 重新拋出 worker 的例外
+                    raise RuntimeError(f"Workers exited after reporting {received}/{self.total_number_of_tasks} tasks")
+                continue
+            received += 1
+            self.task_done(log)
 
     def worker(self, task: Task) -> Tuple[Any, str, int]:
         """
@@ -88,37 +285,50 @@ class RunManager:
         Returns:
             tuple: The state of the task processing and task identifiers.
         """
-        # try:
-        database_manager = DatabaseManager(db_mode=self.args.data_mode, db_root_path=self.args.db_root_path, db_id=task.db_id)#单例
+        initial_state = self.prepare_task(task)
+        for state in self.app.stream(initial_state):
+            continue
+
+        return state[self.last_node_key], task.db_id, task.question_id
+
+    async def aworker(self, task: Task) -> Tuple[Any, str, int]:
+        """
+        Async version of worker, running the pipeline with app.astream.
+
+        Args:
+            task (Task): The task to be processed.
+
+        Returns:
+            tuple: The state of the task processing and task identifiers.
+        """
+        initial_state = self.prepare_task(task)
+        async for state in self.app.astream(initial_state):
+            continue
+
+        return state[self.last_node_key], task.db_id, task.question_id
+
+    def prepare_task(self, task: Task) -> Dict[str, Any]:
+        """
+        Binds the database context and logger of the task and returns its initial pipeline state.
+        """
+        database_manager = DatabaseManager(db_mode=self.args.data_mode, db_root_path=self.args.db_root_path, db_id=task.db_id)
         logger = Logger(db_id=task.db_id, question_id=task.question_id, result_directory=self.result_directory)
         logger._set_log_level(self.args.log_level)
         logger.log(f"Processing task: {task.db_id} {task.question_id}", "info")
-        pipeline_manager = PipelineManager(json.loads(self.args.pipeline_setup))
         execution_history = self.load_checkpoint(task.db_id, task.question_id)
 
-        initial_state = {"keys": {"task": task, "execution_history": execution_history}}
-        print("Building pipeline...")
-        self.app = build_pipeline(self.args.pipeline_nodes)
-        print("Pipeline built successfully.")
+        return {"keys": {"task": task, "execution_history": execution_history}}
 
-        if hasattr(self.app, 'nodes'):
-            # 获取最后一个节点的键
-            if self.app.nodes:  # 确保字典不为空
-                last_node_key = list(self.app.nodes.keys())[-1]  # 获取最后一个键
-                print('checkpoint final: ',last_node_key)  # 如果你需要查看最后一个节点，可以保留这一行
-            else:
-                last_node_key = None  # 如果没有节点，设置为 None
-        else:
-            last_node_key = None  # 如果没有 nodes 属性，设置为 None
-
-        for state in self.app.stream(initial_state):
-            continue
-
-        return state[last_node_key], task.db_id, task.question_id
-            # return state['__end__'], task.db_id, task.question_id
-        # except Exception as e:
-        #     logger.log(f"Error processing task: {task.db_id} {task.question_id}\n{e}", "error")
-        #     return None, task.db_id, task.question_id
+    @staticmethod
+    def get_last_node_key(app: Any):
+        """
+        Returns the key of the last node of a compiled pipeline, or None if it has no nodes.
+        """
+        if hasattr(app, 'nodes') and app.nodes:
+            last_node_key = list(app.nodes.keys())[-1]  # 获取最后一个键
+            print('checkpoint final: ', last_node_key)
+            return last_node_key
+        return None
 
     def task_done(self, log: Tuple[Any, str, int]):
         """
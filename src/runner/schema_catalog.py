@@ -0,0 +1,153 @@
+"""
+Schema catalog
+從 tables.json 預先建立每個 db_id 的外鍵、欄位名稱對照與原始表名 / 欄名，
+以 pickle 快取在 tables.json 旁邊，tables.json 改變時自動重建
+"""
+
+import os
+import json
+import pickle
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Set, Tuple, Union
+
+# 快取格式變更時遞增，讓舊的 pickle 失效
+CATALOG_FORMAT = 1
+
+
+def _source_signature(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_catalog_entries(tables: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds the per-database entries from the parsed tables.json.
+
+    Foreign keys of every entry sharing a db_id are kept in file order; the column name mapping
+    comes from the first entry of each db_id.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    for row in tables:
+        db_id = row["db_id"]
+        tables_original = row["table_names_original"]
+        columns_original = row["column_names_original"]
+        entry = entries.get(db_id)
+        if entry is None:
+            entry = entries[db_id] = {
+                "foreign_keys": [],
+                "foreign_set": set(),
+                "column_name_map": {
+                    x[1]: y[1] for x, y in zip(row["column_names"][1:], columns_original[1:]) if x[1] != y[1]
+                },
+            }
+        for first, second in row["foreign_keys"]:
+            first_index, first_column = columns_original[first]
+            second_index, second_column = columns_original[second]
+            left = tables_original[first_index] + '.' + first_column
+            right = tables_original[second_index] + '.' + second_column
+            entry["foreign_keys"].append(left + " = " + right)
+            entry["foreign_set"].add(left)
+            entry["foreign_set"].add(right)
+    return entries
+
+
+class SchemaCatalog:
+    """
+    Per-database schema facts from tables.json with O(1) lookup by db_id.
+
+    The catalog is pickled next to the source (tables.catalog.pkl) together with the source's
+    (mtime, size), so later processes load it without parsing the JSON, and a changed tables.json
+    rebuilds it.
+    """
+    _catalogs: Dict[str, "SchemaCatalog"] = {}
+    _lock = Lock()
+
+    def __init__(self, tables_path: Union[str, Path], signature: Tuple[int, int], entries: Dict[str, Dict[str, Any]]):
+        self.tables_path = Path(tables_path)
+        self.signature = signature
+        self.entries = entries
+
+    @staticmethod
+    def cache_path(tables_path: Union[str, Path]) -> Path:
+        tables_path = Path(tables_path)
+        return tables_path.with_name(f"{tables_path.stem}.catalog.pkl")
+
+    @classmethod
+    def load(cls, tables_path: Union[str, Path]) -> "SchemaCatalog":
+        """
+        Returns the catalog of tables_path, from memory, the pickle cache or by parsing the JSON.
+
+        Args:
+            tables_path (Union[str, Path]): Path of tables.json.
+        """
+        tables_path = Path(tables_path)
+        key = str(tables_path.resolve())
+        signature = _source_signature(tables_path)
+        catalog = cls._catalogs.get(key)
+        if catalog is not None and catalog.signature == signature:
+            return catalog
+
+        with cls._lock:
+            catalog = cls._catalogs.get(key)
+            if catalog is None or catalog.signature != signature:
+                catalog = cls._load_cached(tables_path, signature) or cls._build(tables_path, signature)
+                cls._catalogs[key] = catalog
+            return catalog
+
+    @classmethod
+    def _load_cached(cls, tables_path: Path, signature: Tuple[int, int]):
+        cache_path = cls.cache_path(tables_path)
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable schema catalog {cache_path}: {e}")
+            return None
+        if cached.get("format") != CATALOG_FORMAT or cached.get("signature") != signature:
+            return None
+        return cls(tables_path, signature, cached["entries"])
+
+    @classmethod
+    def _build(cls, tables_path: Path, signature: Tuple[int, int]) -> "SchemaCatalog":
+        with open(tables_path, encoding="utf-8") as f:
+            entries = build_catalog_entries(json.load(f))
+        cache_path = cls.cache_path(tables_path)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"format": CATALOG_FORMAT, "signature": signature, "entries": entries},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write schema catalog {cache_path}: {e}")
+        logging.info(f"Built schema catalog for {len(entries)} databases from {tables_path}")
+        return cls(tables_path, signature, entries)
+
+    def foreign_keys(self, db_id: str) -> Tuple[str, Set[str]]:
+        """
+        Returns the foreign keys of db_id as "t1.c1 = t2.c2, ..." and the set of columns involved.
+        """
+        entry = self.entries.get(db_id)
+        if entry is None:
+            return "", set()
+        return ", ".join(entry["foreign_keys"]), set(entry["foreign_set"])
+
+    def column_name_map(self, db_id: str) -> Dict[str, str]:
+        """
+        Returns {readable column name: original column name} for the columns whose names differ.
+
+        Raises:
+            KeyError: If db_id is not in tables.json.
+        """
+        return self.entries[db_id]["column_name_map"]
+
+
+def get_schema_catalog(tables_path: Union[str, Path]) -> SchemaCatalog:
+    """
+    獲取 tables.json 的 schema catalog（同一行程內共用）
+    """
+    return SchemaCatalog.load(tables_path)
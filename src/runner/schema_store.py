@@ -0,0 +1,164 @@
+"""
+Schema 快取
+每個資料庫的 schema（generate_db_schema 產生的 all_info 與 db_col）各自存成一個檔案
+{db_root_path}/schema_cache/{db_id}.json:
+    - 以暫存檔 + os.replace 原子寫入，讀取端不會看到寫一半的檔案
+    - 以檔案鎖保證多個行程同時第一次請求同一資料庫時只計算一次
+    - 同一行程內保存在記憶體，之後的查詢不需再讀檔
+
+舊的整份 db_schema.json 仍會以唯讀方式查詢，其中已有的資料庫不需重新產生
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from threading import Lock
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+CACHE_DIR = "schema_cache"
+LEGACY_FILE = "db_schema.json"
+
+
+class SchemaStore:
+    """
+    A process-wide cache of database schemas backed by one JSON file per database.
+
+    get_or_create computes a missing schema under a per-database thread lock and file lock, so
+    concurrent first requests from threads or processes compute it once and the others read the
+    written file.
+    """
+    # (db_root_path, db_id) -> schema
+    _entries: Dict[Tuple[str, str], Any] = {}
+    # (db_root_path, db_id) -> 計算中使用的執行緒鎖
+    _locks: Dict[Tuple[str, str], Lock] = {}
+    # db_schema.json 路徑 -> ((mtime_ns, size), 內容)
+    _legacy: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+    _lock = Lock()
+
+    @staticmethod
+    def path(db_root_path: Union[str, Path], db_id: str) -> Path:
+        return Path(db_root_path) / CACHE_DIR / f"{db_id}.json"
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{path}.lock", "a") as f:
+            # 沒有 fcntl 的平台（Windows）只有行程內的鎖
+            if FCNTL_AVAILABLE:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Any]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt schema cache {path}")
+            return None
+
+    @staticmethod
+    def _write(path: Path, schema: Any):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(schema, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def _read_legacy(cls, db_root_path: Union[str, Path], db_id: str) -> Optional[Any]:
+        """Looks db_id up in the former db_schema.json, parsing the file once per change."""
+        path = Path(db_root_path) / LEGACY_FILE
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = str(path.resolve())
+        with cls._lock:
+            cached = cls._legacy.get(key)
+        if cached is None or cached[0] != signature:
+            data = cls._read(path) if path.is_file() else None
+            cached = (signature, data if isinstance(data, dict) else {})
+            with cls._lock:
+                cls._legacy[key] = cached
+        return cached[1].get(db_id)
+
+    @classmethod
+    def _load_or_create(cls, db_root_path: Union[str, Path], db_id: str, create: Callable[[], Any]) -> Any:
+        path = cls.path(db_root_path, db_id)
+        schema = cls._read(path)
+        if schema is None:
+            schema = cls._read_legacy(db_root_path, db_id)
+        if schema is not None:
+            return schema
+        with cls._file_lock(path):
+            # 等待鎖的期間其他行程可能已寫入
+            schema = cls._read(path)
+            if schema is None:
+                logging.info(f"Generating schema of {db_id}")
+                schema = create()
+                cls._write(path, schema)
+        return schema
+
+    @classmethod
+    def get_or_create(cls, db_root_path: Union[str, Path], db_id: str, create: Callable[[], Any]) -> Any:
+        """
+        Returns the cached schema of db_id, computing and storing it with create when missing.
+
+        Args:
+            db_root_path (Union[str, Path]): Dataset root directory.
+            db_id (str): Database id.
+            create (Callable[[], Any]): Computes the schema; its result must be JSON serializable.
+
+        Returns:
+            Any: The schema (shared, read-only).
+        """
+        key = (str(Path(db_root_path).resolve()), db_id)
+        schema = cls._entries.get(key)
+        if schema is not None:
+            return schema
+        with cls._lock:
+            lock = cls._locks.setdefault(key, Lock())
+        with lock:
+            schema = cls._entries.get(key)
+            if schema is None:
+                schema = cls._load_or_create(db_root_path, db_id, create)
+                cls._entries[key] = schema
+        return schema
+
+    @classmethod
+    def clear(cls):
+        """Drops the in-memory schemas; the files are kept."""
+        with cls._lock:
+            cls._entries.clear()
+            cls._legacy.clear()
+
+
+def get_db_schema(db_root_path: Union[str, Path], db_id: str, create: Callable[[], Any]) -> Any:
+    """
+    獲取資料庫的 schema，不存在時以 create 產生並寫入快取
+
+    Args:
+        db_root_path: 資料集根目錄
+        db_id: 資料庫名稱
+        create: 產生 schema 的函式
+
+    Returns:
+        schema（請勿修改）
+    """
+    return SchemaStore.get_or_create(db_root_path, db_id, create)
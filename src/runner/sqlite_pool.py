@@ -0,0 +1,290 @@
+"""
+SQLite 連線池
+每個資料庫檔案一個唯讀連線池（file:...?mode=ro&immutable=1），候選 SQL 執行、修正、評估、
+web /execute 與 few-shot 驗證共用，避免每個查詢重新開啟連線並從冷的 page cache 開始:
+    - 執行緒以 connection() 借出連線，用完歸還，閒置連線最多保留 SQLITE_POOL_SIZE 個
+    - 以 cache_size / mmap_size pragma 調整每個連線的快取
+    - immutable 模式下 SQLite 不檢查檔案變更，因此每次借出時比對檔案的 mtime / 大小，
+      檔案改變時丟棄舊連線；借出期間檔案改變的連線在歸還時關閉
+    - 查詢期限以 progress handler 檢查（QueryBudget），超過 wall-clock 或 VM 指令數上限時
+      SQLite 會在 C 層中斷查詢並拋出 QueryTimeout，不需要額外的執行緒
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from threading import Lock
+from urllib.parse import quote
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from config import config
+
+
+# progress handler 每執行多少個 SQLite VM 指令呼叫一次
+PROGRESS_STEPS = 1000
+
+
+class QueryTimeout(Exception):
+    """
+    Raised when a query ran past its QueryBudget; SQLite has already interrupted it.
+
+    Attributes:
+        reason (str): "timeout" for the wall-clock deadline, "steps" for the VM step budget.
+        elapsed (float): Seconds since the budget started.
+        steps (int): Approximate VM steps executed under the budget.
+    """
+
+    def __init__(self, reason: str, elapsed: float, steps: int):
+        super().__init__(f"query {'timed out' if reason == 'timeout' else 'exceeded its step budget'} "
+                         f"after {elapsed:.1f}s ({steps} steps)")
+        self.reason = reason
+        self.elapsed = elapsed
+        self.steps = steps
+
+
+class QueryBudget:
+    """
+    A wall-clock deadline and an optional SQLite VM step budget, shared by every query run under it.
+
+    The budget is enforced with conn.set_progress_handler: once it is used up the handler makes
+    SQLite abort the running statement, and every later query under the budget fails immediately.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, max_steps: Optional[int] = None):
+        """
+        Args:
+            timeout (Optional[float]): Seconds from now until the deadline; None for no deadline.
+            max_steps (Optional[int]): Maximum VM steps over all queries; None or 0 for no limit.
+        """
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout if timeout else None
+        self.max_steps = max_steps or None
+        self.steps = 0
+        self.exceeded = None
+
+    def _check(self) -> bool:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = "timeout"
+        elif self.max_steps is not None and self.steps > self.max_steps:
+            self.exceeded = "steps"
+        return self.exceeded is not None
+
+    def _progress(self) -> int:
+        self.steps += PROGRESS_STEPS
+        # 回傳非 0 會讓 SQLite 中斷目前的查詢
+        return 1 if self.exceeded or self._check() else 0
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (at least 0), or None without a deadline."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def expire(self) -> QueryTimeout:
+        """Marks the deadline as passed, for time spent outside SQLite, and returns the error to raise."""
+        self.exceeded = self.exceeded or "timeout"
+        return self.error()
+
+    def error(self) -> QueryTimeout:
+        return QueryTimeout(self.exceeded or "timeout", time.monotonic() - self.start, self.steps)
+
+    @contextmanager
+    def guard(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """
+        Enforces the budget on conn for the duration of the block.
+
+        Raises:
+            QueryTimeout: When the budget is used up before or during the block, also if the
+                code in the block caught the interrupted error itself.
+        """
+        if self._check():
+            raise self.error()
+        conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+        try:
+            yield conn
+        except Exception as e:
+            if self.exceeded:
+                raise self.error() from e
+            raise
+        finally:
+            conn.set_progress_handler(None, PROGRESS_STEPS)
+        if self.exceeded:
+            raise self.error()
+
+
+class SQLitePool:
+    """
+    A pool of read-only connections to one SQLite database file, safe to share between threads.
+    """
+
+    def __init__(self, db_path: Union[str, Path], max_idle: int = 8, cache_size_mb: int = 64,
+                 mmap_size_mb: int = 256, immutable: bool = True):
+        """
+        Args:
+            db_path (Union[str, Path]): Path of the database file.
+            max_idle (int): Maximum number of idle connections kept open.
+            cache_size_mb (int): Page cache size of each connection.
+            mmap_size_mb (int): Memory-mapped I/O size of each connection (0 disables it).
+            immutable (bool): Open with immutable=1, which skips locking and change detection.
+        """
+        self.db_path = Path(db_path)
+        self.max_idle = max_idle
+        self.cache_size_mb = cache_size_mb
+        self.mmap_size_mb = mmap_size_mb
+        self.immutable = immutable
+        self._lock = Lock()
+        self._idle: List[sqlite3.Connection] = []
+        # 連線 -> 開啟時的檔案 signature
+        self._opened: Dict[sqlite3.Connection, Tuple[int, int]] = {}
+        self._signature = None
+        self.created = 0
+        self.reused = 0
+
+    def _uri(self) -> str:
+        uri = f"file:{quote(str(self.db_path.resolve()))}?mode=ro"
+        return uri + "&immutable=1" if self.immutable else uri
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._uri(), uri=True, timeout=180, check_same_thread=False)
+        # cache_size 為負數時單位是 KiB
+        conn.execute(f"PRAGMA cache_size = {-self.cache_size_mb * 1024}")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size_mb * 1024 * 1024}")
+        return conn
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.db_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _checkout(self) -> sqlite3.Connection:
+        signature = self._file_signature()
+        stale = []
+        with self._lock:
+            if signature != self._signature:
+                # 檔案被替換或修改，immutable 連線可能讀到舊資料
+                stale, self._idle = self._idle, []
+                self._signature = signature
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        for old in stale:
+            self._discard(old)
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self.created += 1
+                self._opened[conn] = signature
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._opened.pop(conn, None)
+        conn.close()
+
+    def _checkin(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            # 借出期間檔案改變（其他執行緒已更新 signature）的連線可能讀到舊的或不完整的頁面
+            if self._opened.get(conn) == self._signature and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None, max_steps: Optional[int] = None,
+                   budget: Optional[QueryBudget] = None) -> Iterator[sqlite3.Connection]:
+        """
+        Checks a connection out for the calling thread and returns it to the pool afterwards.
+
+        Args:
+            timeout (Optional[float]): Wall-clock seconds allowed for the queries of the block.
+            max_steps (Optional[int]): VM steps allowed for the queries of the block.
+            budget (Optional[QueryBudget]): A budget shared with other blocks, instead of timeout
+                and max_steps.
+
+        Yields:
+            sqlite3.Connection: A read-only connection; writes raise sqlite3.OperationalError.
+
+        Raises:
+            QueryTimeout: When the queries of the block exceed the budget.
+        """
+        if budget is None and (timeout or max_steps):
+            budget = QueryBudget(timeout, max_steps)
+        conn = self._checkout()
+        try:
+            if budget is None:
+                yield conn
+            else:
+                with budget.guard(conn):
+                    yield conn
+        finally:
+            self._checkin(conn)
+
+    def close(self):
+        """Closes the idle connections; connections still checked out are closed on return."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.max_idle = 0
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"created": self.created, "reused": self.reused, "idle": len(self._idle)}
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = Lock()
+
+
+def get_sqlite_pool(db_path: Union[str, Path]) -> SQLitePool:
+    """
+    獲取資料庫檔案的共用連線池（每個行程每個檔案一個）
+
+    Args:
+        db_path: 資料庫檔案路徑
+
+    Returns:
+        SQLitePool 實例
+    """
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLitePool(
+                db_path,
+                max_idle=config.SQLITE_POOL_SIZE,
+                cache_size_mb=config.SQLITE_CACHE_SIZE_MB,
+                mmap_size_mb=config.SQLITE_MMAP_SIZE_MB,
+                immutable=config.SQLITE_IMMUTABLE,
+            )
+            logging.debug(f"Created read-only sqlite pool for {key}")
+        return pool
+
+
+def pooled_connection(db_path: Union[str, Path], timeout: Optional[float] = None, max_steps: Optional[int] = None,
+                      budget: Optional[QueryBudget] = None):
+    """
+    從共用連線池借出 db_path 的唯讀連線（context manager，結束時歸還）
+
+    Args:
+        db_path: 資料庫檔案路徑
+        timeout: 區塊內查詢的 wall-clock 期限（秒），超過時拋出 QueryTimeout
+        max_steps: 區塊內查詢的 VM 指令數上限
+        budget: 與其他區塊共用的 QueryBudget（取代 timeout / max_steps）
+    """
+    return get_sqlite_pool(db_path).connection(timeout, max_steps, budget)
+
+
+def close_sqlite_pools():
+    """Closes the idle connections of every pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
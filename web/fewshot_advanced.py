@@ -7,9 +7,14 @@ Few-shot 完整版管理界面 - 直接管理 questions.json
 
 from flask import Flask, render_template_string, request, jsonify
 from flask_cors import CORS
+import os
+import sys
 import json
 from pathlib import Path
-import sqlite3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from runner.sqlite_pool import pooled_connection
 
 app = Flask(__name__)
 CORS(app)
@@ -57,10 +62,8 @@ class FewShotAdvancedManager:
 
     def validate_sql(self, sql):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
-            conn.close()
+            with pooled_connection(self.db_path) as conn:
+                conn.cursor().execute(f"EXPLAIN QUERY PLAN {sql}")
             return True, "SQL 語法正確"
         except Exception as e:
             return False, str(e)
@@ -9,10 +9,15 @@ Few-shot Web 管理界面
 
 from flask import Flask, request, jsonify, render_template_string
 from flask_cors import CORS
+import os
+import sys
 import json
-import sqlite3
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from runner.sqlite_pool import pooled_connection
+
 app = Flask(__name__)
 CORS(app)
 
@@ -40,10 +45,8 @@ class FewShotManager:
         if not self.db_path.exists():
             return False, "資料庫文件不存在"
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            conn.close()
+            with pooled_connection(self.db_path) as conn:
+                conn.cursor().execute(sql)
             return True, "SQL 驗證通過"
         except Exception as e:
             return False, str(e)
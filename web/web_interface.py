@@ -19,6 +19,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from query_interface import QueryInterface
+from runner.sqlite_pool import pooled_connection
 
 app = Flask(__name__)
 CORS(app)
@@ -784,26 +785,23 @@ def execute():
         if not Path(DB_PATH).exists():
             return jsonify({"status": "error", "error": f"資料庫不存在: {DB_PATH}"}), 500
         
-        # 連接資料庫並執行查詢
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
+        # 從共用的唯讀連線池借出連線並執行查詢
         try:
-            cursor.execute(sql)
-            
-            # 獲取列名
-            columns = [description[0] for description in cursor.description] if cursor.description else []
-            
-            # 獲取結果
-            rows = cursor.fetchall()
+            with pooled_connection(DB_PATH) as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql)
+                
+                # 獲取列名
+                columns = [description[0] for description in cursor.description] if cursor.description else []
+                
+                # 獲取結果
+                rows = cursor.fetchall()
             
             # 轉換為字典列表
             results = []
             for row in rows:
                 results.append(dict(zip(columns, row)))
             
-            conn.close()
-            
             return jsonify({
                 "status": "success",
                 "columns": columns,
@@ -812,7 +810,6 @@ def execute():
             })
             
         except sqlite3.Error as e:
-            conn.close()
             return jsonify({"status": "error", "error": f"SQL 執行錯誤: {str(e)}"}), 400
             
     except Exception as e: